@@ -0,0 +1,230 @@
+"""
+Motor analítico en memoria para las páginas de estadísticas.
+
+Los resúmenes diarios (migración 4) se cargan una vez en arreglos de NumPy por
+columna: la fecha como entero (días desde 1970) con año, mes y día ya
+separados, el cliente, el combustible o producto codificado como entero y las
+medidas. Cada filtro de las páginas se resuelve con máscaras vectorizadas y
+np.bincount sobre esos arreglos, sin consultar la base.
+
+La carga es incremental: cada venta marca su día (DatabaseAuthenticator lo
+hace al terminar la transacción) y en la siguiente consulta se releen de la
+base solo los días marcados. Cambiar o borrar un producto descarta su tabla,
+porque los nombres se guardan junto a los arreglos. Cada ANALITICA_TTL
+segundos se recarga todo, para recoger lo que escriban otros procesos.
+"""
+import os
+import threading
+import time
+
+import numpy as np
+
+CONJUNTOS = ('combustible', 'productos')
+
+_EPOCA = np.datetime64('1970-01-01', 'D')
+
+
+def _a_dias(fechas):
+    """Texto 'YYYY-MM-DD...', date o datetime -> días desde 1970 (int32)."""
+    return (np.array([str(f)[:10] for f in fechas], dtype='datetime64[D]') - _EPOCA).astype(np.int32)
+
+
+def _entero(valor):
+    """Los filtros llegan como texto del formulario; '' o None es sin filtro."""
+    return int(valor) if valor not in (None, '') else None
+
+
+class TablaHechos:
+    """
+    Filas de un resumen diario en arreglos por columna. No se modifica: las
+    actualizaciones arman una tabla nueva, así las consultas en curso en otros
+    hilos siguen viendo la anterior completa.
+    """
+
+    def __init__(self, dias, cliente, codigo, medida, monto, nombres):
+        self.dias = dias
+        self.cliente = cliente
+        self.codigo = codigo      # índice en self.nombres
+        self.medida = medida      # litros o unidades
+        self.monto = monto
+        self.nombres = nombres    # nombres de combustible / producto
+        fechas = dias.astype('datetime64[D]')
+        meses = fechas.astype('datetime64[M]')
+        self.anio = (fechas.astype('datetime64[Y]').astype(np.int64) + 1970).astype(np.int16)
+        self.mes = (meses.astype(np.int64) % 12 + 1).astype(np.int8)
+        self.dia = ((fechas - meses).astype(np.int64) + 1).astype(np.int8)
+
+    @classmethod
+    def desde_filas(cls, filas, nombres=()):
+        """filas: [(fecha, cliente_id, nombre, medida, monto)]."""
+        nombres = list(nombres)
+        indice = {n: i for i, n in enumerate(nombres)}
+        codigos = []
+        for fila in filas:
+            nombre = fila[2]
+            if nombre not in indice:
+                indice[nombre] = len(nombres)
+                nombres.append(nombre)
+            codigos.append(indice[nombre])
+        return cls(
+            _a_dias([f[0] for f in filas]),
+            np.array([int(f[1] or 0) for f in filas], dtype=np.int32),
+            np.array(codigos, dtype=np.int32),
+            np.array([float(f[3] or 0) for f in filas], dtype=np.float64),
+            np.array([float(f[4] or 0) for f in filas], dtype=np.float64),
+            nombres,
+        )
+
+    def reemplazar_dias(self, fechas, filas):
+        """Tabla nueva con las filas de los días `fechas` cambiadas por `filas`."""
+        nuevas = TablaHechos.desde_filas(filas, self.nombres)
+        quedan = ~np.isin(self.dias, _a_dias(fechas))
+        return TablaHechos(
+            np.concatenate([self.dias[quedan], nuevas.dias]),
+            np.concatenate([self.cliente[quedan], nuevas.cliente]),
+            np.concatenate([self.codigo[quedan], nuevas.codigo]),
+            np.concatenate([self.medida[quedan], nuevas.medida]),
+            np.concatenate([self.monto[quedan], nuevas.monto]),
+            nuevas.nombres,
+        )
+
+    def __len__(self):
+        return len(self.dias)
+
+    def mascara(self, cliente_id=None, dia=None, mes=None, anio=None):
+        mascara = np.ones(len(self), dtype=bool)
+        for columna, valor in ((self.cliente, cliente_id), (self.anio, anio),
+                               (self.mes, mes), (self.dia, dia)):
+            valor = _entero(valor)
+            if valor is not None:
+                mascara &= columna == valor
+        return mascara
+
+    def agrupar(self, mascara, *columnas):
+        """
+        Suma de la medida por combinación de `columnas` (arreglos enteros)
+        dentro de la máscara: cada combinación se numera como un índice plano y
+        un solo np.bincount hace la suma. Devuelve (valores de cada columna,
+        sumas) solo para las combinaciones que tienen filas.
+        """
+        columnas = [c[mascara].astype(np.int64) for c in columnas]
+        minimos = [int(c.min()) if len(c) else 0 for c in columnas]
+        tamanos = [int(c.max()) - m + 1 if len(c) else 1 for c, m in zip(columnas, minimos)]
+        clave = np.zeros(len(columnas[0]), dtype=np.int64)
+        for columna, minimo, tamano in zip(columnas, minimos, tamanos):
+            clave = clave * tamano + (columna - minimo)
+        total = int(np.prod(tamanos))
+        sumas = np.bincount(clave, weights=self.medida[mascara], minlength=total)
+        presentes = np.flatnonzero(np.bincount(clave, minlength=total))
+        valores = [v + m for v, m in zip(np.unravel_index(presentes, tamanos), minimos)]
+        return valores, sumas[presentes]
+
+
+class MotorAnalitico:
+    """
+    Tablas de hechos de un backend. `cargar(conjunto, fechas=None)` devuelve
+    las filas (fecha, cliente_id, nombre, medida, monto) del resumen, todas o
+    solo las de esos días.
+    """
+
+    def __init__(self, cargar, ttl=300.0):
+        self._cargar = cargar
+        self.ttl = ttl
+        self._tablas = {}      # conjunto -> (vence, TablaHechos)
+        self._sucios = {c: set() for c in CONJUNTOS}
+        self._generacion = 0   # invalidar() la incrementa; una carga anterior no se guarda
+        self._lock = threading.Lock()
+        self._carga = threading.Lock()
+
+    def marcar_dias(self, conjunto, fechas):
+        """Anota días cuyos resúmenes cambiaron, para releerlos en la próxima consulta."""
+        with self._lock:
+            self._sucios[conjunto].update(str(f)[:10] for f in fechas)
+
+    def invalidar(self, *conjuntos):
+        """
+        Descarta las tablas de `conjuntos` (todas si no se indica ninguno), por
+        ejemplo cuando cambian los nombres de productos; se recargan completas.
+        """
+        with self._lock:
+            for conjunto in conjuntos or CONJUNTOS:
+                self._tablas.pop(conjunto, None)
+            self._generacion += 1
+
+    def tabla(self, conjunto):
+        with self._lock:
+            entrada = self._tablas.get(conjunto)
+            if entrada is not None and entrada[0] > time.monotonic() and not self._sucios[conjunto]:
+                return entrada[1]
+        with self._carga:
+            with self._lock:
+                entrada = self._tablas.get(conjunto)
+                completa = entrada is None or entrada[0] <= time.monotonic()
+                fechas = sorted(self._sucios[conjunto])
+                self._sucios[conjunto].clear()
+                if not completa and not fechas:
+                    return entrada[1]
+                generacion = self._generacion
+            try:
+                if completa:
+                    tabla = TablaHechos.desde_filas(self._cargar(conjunto))
+                    vence = time.monotonic() + self.ttl
+                else:
+                    tabla = entrada[1].reemplazar_dias(fechas, self._cargar(conjunto, fechas))
+                    vence = entrada[0]
+            except Exception:
+                with self._lock:
+                    self._sucios[conjunto].update(fechas)
+                raise
+            with self._lock:
+                if self._generacion == generacion:
+                    self._tablas[conjunto] = (vence, tabla)
+            return tabla
+
+    # --- Consultas de las páginas de estadísticas ---
+
+    def ventas_mensuales_combustible(self, cliente_id=None, mes=None, anio=None):
+        """[(mes, combustible, litros, anio)] por año, mes y combustible."""
+        t = self.tabla('combustible')
+        (anios, meses, codigos), litros = t.agrupar(t.mascara(cliente_id, None, mes, anio),
+                                                    t.anio, t.mes, t.codigo)
+        filas = [(int(m), t.nombres[c], float(l), int(a))
+                 for a, m, c, l in zip(anios, meses, codigos, litros)]
+        filas.sort(key=lambda f: (f[3], f[0], f[1]))
+        return filas
+
+    def ventas_combustible_por_dia(self, cliente_id=None, dia=None, mes=None, anio=None):
+        """[{'mes', 'dia', 'tipo', 'total'}] por mes, día y combustible."""
+        t = self.tabla('combustible')
+        (meses, dias, codigos), litros = t.agrupar(t.mascara(cliente_id, dia, mes, anio),
+                                                   t.mes, t.dia, t.codigo)
+        return [{'mes': int(m), 'dia': int(d), 'tipo': t.nombres[c], 'total': float(l)}
+                for m, d, c, l in zip(meses, dias, codigos, litros)]
+
+    def productos_mas_vendidos(self, cliente_id=None, mes=None, anio=None, limite=10):
+        """[(producto, unidades, anio)] de año más reciente a más antiguo, los `limite` primeros."""
+        t = self.tabla('productos')
+        (anios, codigos), unidades = t.agrupar(t.mascara(cliente_id, None, mes, anio), t.anio, t.codigo)
+        orden = np.lexsort((-unidades, -anios))[:limite]
+        return [(t.nombres[codigos[i]], int(unidades[i]), int(anios[i])) for i in orden]
+
+    def productos_mas_vendidos_filtrado(self, cliente_id=None, dia=None, mes=None, anio=None):
+        """[{'nombre', 'cantidad'}] de más a menos vendido."""
+        t = self.tabla('productos')
+        (codigos,), unidades = t.agrupar(t.mascara(cliente_id, dia, mes, anio), t.codigo)
+        orden = np.argsort(-unidades, kind='stable')
+        return [{'nombre': t.nombres[codigos[i]], 'cantidad': int(unidades[i])} for i in orden]
+
+
+_motores = {}
+_motores_lock = threading.Lock()
+
+
+def motor_analitico(clave, cargar):
+    """Motor del backend `clave` (uno por proceso), creándolo con `cargar` la primera vez."""
+    with _motores_lock:
+        motor = _motores.get(clave)
+        if motor is None:
+            motor = MotorAnalitico(cargar, ttl=float(os.getenv('ANALITICA_TTL', '300')))
+            _motores[clave] = motor
+        return motor
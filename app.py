@@ -1,15 +1,11 @@
-# --- IMPORT NECESARIO PARA RUTAS DE USUARIOS ---
-import pyodbc
-
 from functools import wraps
-from flask import Flask, flash, jsonify, make_response, render_template, redirect, request, session, url_for , send_file, abort# type: ignore
+from flask import Flask, Response, flash, jsonify, make_response, render_template, redirect, request, session, url_for , send_file, abort# type: ignore
 from conexion import DatabaseAuthenticator
-from datetime import datetime
-import io
-import pandas as pd
-import xlsxwriter
-from fpdf import FPDF
-import calendar
+from unidad_trabajo import registrar_unidad_trabajo
+import exportacion
+from trabajos_reportes import LISTO, LimiteTrabajos, cola_reportes
+from datetime import datetime, timedelta
+from filtros_fecha import rango_periodo
 import os
 
 app = Flask(__name__)
@@ -19,6 +15,8 @@ app.config['SESSION_COOKIE_HTTPONLY'] = True
 app.config['SESSION_COOKIE_SECURE'] = False  # Cambiar a True en producción con HTTPS
 app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
 app.config['SESSION_REFRESH_EACH_REQUEST'] = True  # Refrescar la sesión en cada solicitud
+# Una conexión y una transacción por petición, confirmada antes de responder
+registrar_unidad_trabajo(app)
 
 def login_required(f):
     @wraps(f)
@@ -98,27 +96,27 @@ def login():
 @login_required
 def dashboard():
     db_auth = DatabaseAuthenticator()
-    ventas_totales = float(db_auth.obtener_ventas_totales_hoy() or 0)
-    litros_distribuidos = float(db_auth.obtener_litros_distribuidos_hoy() or 0)
-    productos_vendidos = float(db_auth.obtener_productos_vendidos_hoy() or 0)
-    ventas_por_producto = db_auth.obtener_ventas_por_producto()
-    
-    # Obtener inventario consolidado
-    inventario_consolidado = db_auth.obtener_inventario_consolidado()
-    inv_labels = [row[0] for row in inventario_consolidado]
-    inv_data = [float(row[1] or 0) for row in inventario_consolidado]
-    
+    # Todos los indicadores en una sola consulta
+    kpis = db_auth.obtener_kpis_dashboard()
+
     return render_template(
         'dashboard.html',
-        ventas_totales=ventas_totales,
-        litros_distribuidos=litros_distribuidos,
-        productos_vendidos=productos_vendidos,
-        ventas_por_producto=ventas_por_producto,  # <-- Pasamos la lista de tuplas
-        inv_labels=inv_labels,
-        inv_data=inv_data
+        ventas_totales=kpis.ventas_totales,
+        litros_distribuidos=kpis.litros_distribuidos,
+        productos_vendidos=kpis.productos_vendidos,
+        ventas_por_producto=kpis.ventas_por_producto,  # <-- Pasamos la lista de tuplas
+        inv_labels=kpis.inv_labels,
+        inv_data=kpis.inv_data
     )
 
 
+@app.route('/api/kpis_dashboard')
+@login_required
+def api_kpis_dashboard():
+    db_auth = DatabaseAuthenticator()
+    return jsonify(db_auth.obtener_kpis_dashboard().a_dict())
+
+
 @app.route('/perfil')
 @login_required
 def perfil():
@@ -183,12 +181,10 @@ def format_inventory_data(registros):
 def inventory_and_trucks():
     db_auth = DatabaseAuthenticator()
     tipos_combustible = db_auth.obtener_tipos_combustible_con_id()
-    pipas = db_auth.obtener_todas_las_pipas()
 
     # Paso 1: Obtener el tipo por defecto (ejemplo: el primero de la lista)
     tipo_default_id = tipos_combustible[0]['id'] if tipos_combustible else None
-    inventario_inicial = db_auth.obtener_ultimo_inventario_final(tipo_default_id) if tipo_default_id else 0
-    
+
     if request.method == 'POST':
         form_type = request.form.get('form_type')
         if form_type == 'inventario':
@@ -224,33 +220,21 @@ def inventory_and_trucks():
     mes = int(request.args.get('mes', now.month))
     anio = int(request.args.get('anio', now.year))
 
-    registros = db_auth.obtener_registros_inventario_mes(mes, anio)
-    total = len(registros)
-    start = (page - 1) * per_page
-    end = start + per_page
-    registros_pagina = registros[start:end]
-
-    registros_con_nombre = [
-        {
-            'InventarioID': registro.InventarioID,
-            'TipoCombustibleID': int(registro.TipoCombustibleID),
-            'InventarioInicial': float(registro.InventarioInicial or 0),
-            'Entrada': float(registro.Entrada or 0),
-            'Salida': float(registro.Salida or 0),
-            'InventarioFinal': float(registro.InventarioFinal or 0),
-            'Fecha': registro.Fecha,
-            'NombreTipo': db_auth.obtener_nombre_tipo_combustible(registro.TipoCombustibleID),
-            'EsAutomatico': int(getattr(registro, 'EsAutomatico', 0) or 0)  # <-- AÑADIDO
-        }
-        for registro in registros_pagina
-    ]
+    tipo_filtro = request.args.get('tipo_filtro', type=int)
+    origen = request.args.get('origen', '')  # '' todos, 'manual' o 'automatico'
+    es_automatico = {'manual': 0, 'automatico': 1}.get(origen)
+
+    # Solo se traen las filas visibles (ya con NombreTipo y EsAutomatico) y el total
+    registros_pagina, total = db_auth.obtener_registros_inventario_pagina(
+        mes, anio, page, per_page, tipo_id=tipo_filtro, es_automatico=es_automatico
+    )
 
     pipas = db_auth.obtener_todas_las_pipas()
 
     saldos_actuales = db_auth.obtener_saldos_actuales_todos()
     return render_template(
         'inventory_and_trucks.html',
-        registros=registros_con_nombre,
+        registros=registros_pagina,
         pipas=pipas,
         tipos_combustible=tipos_combustible,
         tipo_default_id=tipo_default_id,
@@ -259,6 +243,8 @@ def inventory_and_trucks():
         per_page=per_page,
         mes=mes,
         anio=anio,
+        tipo_filtro=tipo_filtro,
+        origen=origen,
         saldos_actuales=saldos_actuales
     )
 @app.route('/inventario')
@@ -326,8 +312,9 @@ def eliminar_registro(id):
 @login_required
 def datos_litros_distribuidos():
     db_auth = DatabaseAuthenticator()
-    litros_distribuidos = db_auth.obtener_litros_distribuidos_hoy()
-    return jsonify({'litros_distribuidos': litros_distribuidos})
+    # Sale de la caché de indicadores: los tableros abiertos no recalculan en cada consulta
+    kpis = db_auth.obtener_kpis_dashboard()
+    return jsonify({'litros_distribuidos': kpis.litros_distribuidos, 'edad_segundos': round(kpis.edad, 1)})
 
 @app.route('/editar_pipa/<int:id>', methods=['POST'])
 @login_required
@@ -426,32 +413,13 @@ def product_inventory():
     page = int(request.args.get('page', 1))
     per_page = 5
 
-    # Obtener todos los productos
-    productos = db_auth.obtener_todos_los_productos()
-    
-    # Obtener lista de códigos únicos para el desplegable
-    codigos = sorted(list({p.Codigo for p in productos if p.Codigo}))
-    
-    # Aplicar filtros de búsqueda
-    if codigo_seleccionado:
-        productos = [p for p in productos if p.Codigo == codigo_seleccionado]
-    
-    if search:
-        productos = [
-            p for p in productos
-            if search.lower() in p.Codigo.lower() or search.lower() in p.Nombre.lower()
-        ]
-    
-    # Aplicar ordenación por cantidad si se solicitó
-    if sort_cantidad == 'asc':
-        productos.sort(key=lambda x: x.Cantidad, reverse=False)
-    elif sort_cantidad == 'desc':
-        productos.sort(key=lambda x: x.Cantidad, reverse=True)
+    # Lista de códigos únicos para el desplegable (cacheada)
+    codigos = db_auth.obtener_codigos_productos()
 
-    total = len(productos)
-    start = (page - 1) * per_page
-    end = start + per_page
-    productos_pagina = productos[start:end]
+    # Filtro, orden y página se resuelven en la base de datos
+    productos_pagina, total = db_auth.buscar_productos(
+        search, codigo_seleccionado, sort_cantidad, page, per_page
+    )
 
     return render_template(
         'product_inventory.html',
@@ -542,10 +510,12 @@ def ventas():
             descuento = float(request.form.get('descuento', 0))
             total = subtotal + iva - descuento
 
-            venta_id = db_auth.agregar_venta(cliente_id, fecha, subtotal, iva, descuento, total, metodo_pago, observaciones)
-            for item in carrito:
-                db_auth.agregar_detalle_venta(venta_id, item['producto_id'], item['cantidad'], item['precio'], item['precio'] * item['cantidad'])
-                db_auth.rebajar_stock_producto(item['producto_id'], item['cantidad'])
+            venta_id = db_auth.registrar_venta_productos(
+                cliente_id, fecha, subtotal, iva, descuento, total, metodo_pago, observaciones, carrito
+            )
+            if venta_id is None:
+                flash('Error al registrar la venta. No se guardó ningún cambio.')
+                return redirect(url_for('ventas'))
 
             session['carrito'] = []
             session['cliente_seleccionado'] = ''
@@ -590,12 +560,14 @@ def historial_ventas():
     now = datetime.now()
     mes = request.args.get('mes', default=now.month, type=int)
     anio = request.args.get('anio', default=now.year, type=int)
-    page = request.args.get('page', default=1, type=int)
+    token = request.args.get('token')
     per_page = 10
 
-    ventas = db_auth.obtener_historial_ventas(mes=mes, anio=anio, page=page, per_page=per_page)
+    # Paginación por cursor: el token marca la posición, no un número de página
+    ventas, token_anterior, token_siguiente = db_auth.obtener_historial_ventas(
+        mes=mes, anio=anio, token=token, per_page=per_page
+    )
     total = db_auth.contar_historial_ventas(mes=mes, anio=anio)
-    total_pages = (total + per_page - 1) // per_page
 
     return render_template(
         'ventas.html',
@@ -603,11 +575,27 @@ def historial_ventas():
         ventas=ventas,
         mes=mes,
         anio=anio,
-        page=page,
-        total_pages=total_pages
+        total=total,
+        token_anterior=token_anterior,
+        token_siguiente=token_siguiente
     )
 
 
+@app.route('/api/historial_ventas')
+@login_required
+def api_historial_ventas():
+    db_auth = DatabaseAuthenticator()
+    ventas, token_anterior, token_siguiente = db_auth.obtener_historial_ventas(
+        mes=request.args.get('mes', type=int),
+        anio=request.args.get('anio', type=int),
+        token=request.args.get('token'),
+        per_page=min(request.args.get('por_pagina', default=10, type=int), 100)
+    )
+    for venta in ventas:
+        venta['fecha'] = venta['fecha'].isoformat() if hasattr(venta['fecha'], 'isoformat') else venta['fecha']
+    return jsonify({'ventas': ventas, 'anterior': token_anterior, 'siguiente': token_siguiente})
+
+
 @app.route('/ventas_combustible', methods=['GET', 'POST'])
 @login_required
 def ventas_combustible():
@@ -617,21 +605,39 @@ def ventas_combustible():
     # Filtros
     cliente_id = request.args.get('filtro_cliente')
     fecha = request.args.get('filtro_fecha')
-    pagina = int(request.args.get('pagina', 1))
+    token = request.args.get('token')
     tab = request.args.get('tab','nueva')
-    historial, total_paginas = db.obtener_historial_ventas_combustible(cliente_id, fecha, pagina)
+    por_pagina = 10
+    historial, token_anterior, token_siguiente = db.obtener_historial_ventas_combustible(
+        cliente_id, fecha, token, por_pagina
+    )
+    total = db.contar_historial_ventas_combustible(cliente_id, fecha)
     return render_template(
         'ventas_combustible.html',
         clientes=clientes,
         tipos_combustible=tipos_combustible,
         historial=historial,
-        total_paginas=total_paginas,
-        pagina=pagina,
+        total=total,
+        total_paginas=(total + por_pagina - 1) // por_pagina,
+        token_anterior=token_anterior,
+        token_siguiente=token_siguiente,
         filtro_cliente=cliente_id,
         filtro_fecha=fecha,
         tab = tab
     )
 
+@app.route('/api/historial_ventas_combustible')
+@login_required
+def api_historial_ventas_combustible():
+    db = DatabaseAuthenticator()
+    historial, token_anterior, token_siguiente = db.obtener_historial_ventas_combustible(
+        request.args.get('filtro_cliente'),
+        request.args.get('filtro_fecha'),
+        request.args.get('token'),
+        min(request.args.get('por_pagina', default=10, type=int), 100)
+    )
+    return jsonify({'ventas': historial, 'anterior': token_anterior, 'siguiente': token_siguiente})
+
 @app.route('/registrar_venta_combustible', methods=['POST'])
 @login_required
 def registrar_venta_combustible():
@@ -675,9 +681,6 @@ def estadisticas_combustible():
         mes=mes_combustible,
         anio=anio_combustible
     )
-    # Datos completos para extraer todos los años posibles
-    ventas_raw_todos = db_auth.obtener_ventas_mensuales_combustible_agrupadas()
-    ventas_mensuales_combustible = []
     ventas_mensuales_combustible = []
     for row in ventas_raw:
         mes = int(row[0])
@@ -686,12 +689,6 @@ def estadisticas_combustible():
         anio = int(row[3]) if len(row) > 3 and row[3] is not None else None
         ventas_mensuales_combustible.append([mes, tipo_combustible, total_litros, anio])
     ventas_mensuales_combustible.sort(key=lambda x: (x[3], x[0]))
-    # Extraer todos los años posibles de los datos completos
-    anios_ventas = set()
-    for row in ventas_raw_todos:
-        if len(row) > 3 and row[3] is not None:
-            anios_ventas.add(int(row[3]))
-    anios_ventas = sorted(anios_ventas)
 
     # Productos filtrados para mostrar
     if cliente_producto_id or mes_producto or anio_producto:
@@ -704,13 +701,9 @@ def estadisticas_combustible():
         cantidad = int(row[1]) if row[1] is not None else 0
         anio = int(row[2]) if len(row) > 2 and row[2] is not None else None
         productos_mas_vendidos.append([nombre_producto, cantidad, anio])
-    # Extraer todos los años posibles de productos (sin filtro)
-    productos_raw_todos = db_auth.obtener_productos_mas_vendidos()
-    anios_productos = set()
-    for row in productos_raw_todos:
-        if len(row) > 2 and row[2] is not None:
-            anios_productos.add(int(row[2]))
-    anios_productos = sorted(anios_productos)
+    # Años para los filtros, desde las facetas en caché
+    anios_ventas = db_auth.obtener_facetas('ventas_combustible').anios
+    anios_productos = db_auth.obtener_facetas('ventas_productos').anios
 
     clientes = db_auth.obtener_todos_los_clientes()
     return render_template(
@@ -765,19 +758,9 @@ def estadisticas_productos():
         ventas_mensuales_combustible.append([mes, tipo_combustible, total_litros, anio])
     ventas_mensuales_combustible.sort(key=lambda x: (x[3], x[0]))
 
-    # Extraer todos los años posibles de los datos completos
-    ventas_raw_todos = db_auth.obtener_ventas_mensuales_combustible_agrupadas()
-    anios_ventas = set()
-    for row in ventas_raw_todos:
-        if len(row) > 3 and row[3] is not None:
-            anios_ventas.add(int(row[3]))
-    anios_ventas = sorted(anios_ventas)
-    productos_raw_todos = db_auth.obtener_productos_mas_vendidos()
-    anios_productos = set()
-    for row in productos_raw_todos:
-        if len(row) > 2 and row[2] is not None:
-            anios_productos.add(int(row[2]))
-    anios_productos = sorted(anios_productos)
+    # Años para los filtros, desde las facetas en caché
+    anios_ventas = db_auth.obtener_facetas('ventas_combustible').anios
+    anios_productos = db_auth.obtener_facetas('ventas_productos').anios
 
     clientes = db_auth.obtener_todos_los_clientes()
     return render_template(
@@ -818,78 +801,96 @@ def descargar_reporte(reporte, formato):
 
     if not fecha_inicio or not fecha_fin:
         abort(400, "Debe seleccionar un rango de fechas.")
-
-    # Obtén los datos reales según el reporte
-    if reporte == 'inventario_combustible':
-        data = db_auth.obtener_inventario_combustible(fecha_inicio, fecha_fin)
-        columns = ['Fecha', 'Combustible', 'Entrada', 'Salida', 'Saldo']
-        nombre = "Inventario_Combustible"
-    elif reporte == 'ventas_combustible':
-        data = db_auth.obtener_ventas_combustible(fecha_inicio, fecha_fin)
-        columns = ['Fecha', 'Cliente', 'Combustible', 'Litros']
-        nombre = "Ventas_Combustible"
-    elif reporte == 'ventas_productos':
-        data = db_auth.obtener_ventas_productos(fecha_inicio, fecha_fin)
-        columns = ['Fecha', 'Producto', 'Cantidad', 'Total']
-        nombre = "Ventas_Productos"
-    elif reporte == 'inventario_productos':
-        data = db_auth.obtener_inventario_productos(fecha_inicio, fecha_fin)
-        columns = ['Producto', 'Saldo']
-        nombre = "Inventario_Productos"
-    else:
+    if reporte not in exportacion.REPORTES:
         abort(404, "Reporte no encontrado.")
+    if formato not in exportacion.FORMATOS:
+        abort(400, "Formato no soportado.")
+    columns = exportacion.REPORTES[reporte][1]
+
+    # CSV y CSV.gz se generan mientras se envían; el resto sale de la caché de
+    # archivos (o se genera y se guarda en ella) y se envía por bloques
+    if formato in ('csv', 'csv.gz'):
+        cuerpo = exportacion.bloques_csv(db_auth.iterar_reporte(reporte, fecha_inicio, fecha_fin), columns)
+        if formato == 'csv.gz':
+            cuerpo = exportacion.comprimir_gzip(cuerpo)
+    else:
+        archivo = exportacion.archivo_reporte(db_auth, reporte, formato, fecha_inicio, fecha_fin)
+        cuerpo = exportacion.transmitir(archivo)
+    filename = exportacion.nombre_archivo(reporte, formato, fecha_inicio, fecha_fin)
+    return Response(cuerpo, mimetype=exportacion.FORMATOS[formato][1],
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+@app.route('/api/cierre_mes', methods=['POST'])
+@login_required
+def cierre_mes():
+    """Encola el libro de cierre de mes (mes=YYYY-MM) y devuelve el trabajo (202)."""
+    datos = request.get_json(silent=True) or request.form
+    try:
+        anio, mes = (int(parte) for parte in datos.get('mes', '').split('-'))
+        fecha_inicio, fin = rango_periodo(anio, mes)
+    except ValueError:
+        return jsonify({'error': 'Debe seleccionar un mes.'}), 400
+    db_auth = DatabaseAuthenticator()
+    try:
+        trabajo = cola_reportes.encolar(session.get('usuario_id'), exportacion.CIERRE_MES, 'excel',
+                                        fecha_inicio.isoformat(), (fin - timedelta(days=1)).isoformat(), db_auth)
+    except LimiteTrabajos as e:
+        return jsonify({'error': str(e)}), 429
+    return jsonify(_trabajo_json(trabajo)), 202
+
+def _trabajo_json(trabajo):
+    datos = trabajo.a_dict()
+    datos['url_estado'] = url_for('trabajo_reporte', trabajo_id=trabajo.id)
+    datos['url_archivo'] = url_for('archivo_trabajo_reporte', trabajo_id=trabajo.id) if trabajo.estado == LISTO else None
+    return datos
+
+@app.route('/api/trabajos_reporte', methods=['GET', 'POST'])
+@login_required
+def trabajos_reporte():
+    """GET: trabajos del usuario. POST: encola un reporte y devuelve el trabajo (202)."""
+    usuario_id = session.get('usuario_id')
+    if request.method == 'GET':
+        return jsonify({'trabajos': [_trabajo_json(t) for t in cola_reportes.trabajos(usuario_id)]})
+    datos = request.get_json(silent=True) or request.form
+    reporte = datos.get('reporte')
+    formato = datos.get('formato')
+    fecha_inicio = datos.get('fecha_inicio')
+    fecha_fin = datos.get('fecha_fin')
+    if not fecha_inicio or not fecha_fin:
+        return jsonify({'error': 'Debe seleccionar un rango de fechas.'}), 400
+    if reporte not in exportacion.REPORTES:
+        return jsonify({'error': 'Reporte no encontrado.'}), 404
+    if formato not in exportacion.FORMATOS:
+        return jsonify({'error': 'Formato no soportado.'}), 400
+    db_auth = DatabaseAuthenticator()
+    try:
+        trabajo = cola_reportes.encolar(usuario_id, reporte, formato, fecha_inicio, fecha_fin, db_auth)
+    except LimiteTrabajos as e:
+        return jsonify({'error': str(e)}), 429
+    return jsonify(_trabajo_json(trabajo)), 202
 
-    # Si no hay datos, puedes devolver un archivo vacío o un mensaje
-    if not data:
-        data = [{col: '' for col in columns}]
-
-    # Generar Excel
-    if formato == 'excel':
-        df = pd.DataFrame(data, columns=columns)
-        output = io.BytesIO()
-        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-            df.to_excel(writer, index=False, sheet_name='Reporte')
-            # Personalización: encabezado en negrita y color
-            workbook = writer.book
-            worksheet = writer.sheets['Reporte']
-            header_format = workbook.add_format({'bold': True, 'bg_color': '#DDEEFF'})
-            worksheet.set_row(0, None, header_format)
-            worksheet.autofilter(0, 0, len(df), len(columns)-1)
-        output.seek(0)
-        filename = f"{nombre}_{fecha_inicio}_a_{fecha_fin}.xlsx"
-        return send_file(output, download_name=filename, as_attachment=True, mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-
-    # Generar PDF
-    elif formato == 'pdf':
-        pdf = FPDF(orientation='L', unit='mm', format='A4')
-        pdf.add_page()
-        pdf.set_font("Arial", 'B', 14)
-        pdf.cell(0, 10, f"{nombre.replace('_', ' ')}", ln=True, align='C')
-        pdf.set_font("Arial", '', 12)
-        pdf.cell(0, 10, f"Rango: {fecha_inicio} a {fecha_fin}", ln=True, align='C')
-        pdf.ln(5)
-        # Encabezados
-        pdf.set_font("Arial", 'B', 11)
-        col_width = 277 / len(columns)
-        for col in columns:
-            pdf.cell(col_width, 10, col, border=1, align='C')
-        pdf.ln()
-        # Filas
-        pdf.set_font("Arial", '', 10)
-        for row in data:
-            for col in columns:
-                valor = row.get(col, '')
-                # Formatear si es número
-                if isinstance(valor, (int, float)):
-                    valor = "{:,.2f}".format(valor)
-                pdf.cell(col_width, 10, str(valor), border=1, align='C')
-            pdf.ln()
-        output = io.BytesIO(pdf.output(dest='S').encode('latin1'))
-        filename = f"{nombre}_{fecha_inicio}_a_{fecha_fin}.pdf"
-        return send_file(output, download_name=filename, as_attachment=True, mimetype='application/pdf')
+@app.route('/api/trabajos_reporte/<trabajo_id>', methods=['GET', 'DELETE'])
+@login_required
+def trabajo_reporte(trabajo_id):
+    """GET: estado y progreso del trabajo. DELETE: lo cancela o lo descarta."""
+    usuario_id = session.get('usuario_id')
+    if request.method == 'DELETE':
+        if not cola_reportes.cancelar(trabajo_id, usuario_id):
+            abort(404)
+        return jsonify({'success': True})
+    trabajo = cola_reportes.obtener(trabajo_id, usuario_id)
+    if trabajo is None:
+        abort(404)
+    return jsonify(_trabajo_json(trabajo))
 
-    else:
-        abort(400, "Formato no soportado.")
+@app.route('/api/trabajos_reporte/<trabajo_id>/archivo')
+@login_required
+def archivo_trabajo_reporte(trabajo_id):
+    trabajo = cola_reportes.obtener(trabajo_id, session.get('usuario_id'))
+    if trabajo is None or trabajo.estado != LISTO:
+        abort(404)
+    return send_file(trabajo.ruta, download_name=trabajo.nombre_archivo, as_attachment=True,
+                     mimetype=trabajo.tipo)
 
 @app.route('/crear_usuario', methods=['GET', 'POST'])
 @login_required
@@ -924,16 +925,7 @@ def usuarios():
     db_auth = DatabaseAuthenticator()
     usuarios = []
     try:
-        with pyodbc.connect(db_auth._get_connection_string()) as cn:
-            cursor = cn.cursor()
-            cursor.execute("SELECT UsuarioID, NombreUsuario, CorreoElectronico, Rol FROM Usuarios")
-            for row in cursor.fetchall():
-                usuarios.append({
-                    'id': row[0],
-                    'usuario': row[1],
-                    'correo': row[2],
-                    'rol': row[3]
-                })
+        usuarios = db_auth.obtener_usuarios()
     except Exception as e:
         flash(f'Error al obtener usuarios: {e}', 'danger')
     return render_template('usuarios.html', usuarios=usuarios)
@@ -958,16 +950,8 @@ def editar_usuario():
             return redirect(url_for('usuarios'))
     try:
         db_auth = DatabaseAuthenticator()
-        with pyodbc.connect(db_auth._get_connection_string()) as cn:
-            cursor = cn.cursor()
-            # Actualizar correo y rol
-            cursor.execute("UPDATE Usuarios SET CorreoElectronico = ?, Rol = ? WHERE UsuarioID = ?", (correo, rol, usuario_id))
-            # Si hay nueva contraseña, actualizarla como hash
-            if contrasena1:
-                from werkzeug.security import generate_password_hash
-                pw_hash = generate_password_hash(contrasena1)
-                cursor.execute("UPDATE Usuarios SET Contrasena = ? WHERE UsuarioID = ?", (pw_hash, usuario_id))
-            cn.commit()
+        # Actualizar correo y rol; si hay nueva contraseña, se guarda como hash
+        db_auth.actualizar_usuario(usuario_id, correo, rol, contrasena1 or None)
         flash('Usuario actualizado correctamente.', 'success')
     except Exception as e:
         flash(f'Error al actualizar usuario: {e}', 'danger')
@@ -0,0 +1,312 @@
+"""
+Motores de almacenamiento disponibles para DatabaseAuthenticator.
+
+- sqlserver (por defecto): SQL Server por ODBC, la instalación de siempre.
+- sqlite: archivo local (db/gasolinera.db), pensado para estaciones sin licencia
+  de SQL Server y para correr pruebas de rendimiento en una laptop.
+
+Se elige con la variable de entorno DB_BACKEND; con sqlite la ruta del archivo
+se toma de DB_PATH. Las consultas de la aplicación se escriben en T-SQL y el
+backend de SQLite las traduce con dialecto_sql.traducir_a_sqlite().
+"""
+import datetime
+import decimal
+import os
+import sqlite3
+
+from dialecto_sql import traducir_a_sqlite
+from migraciones import aplicar_migraciones
+
+RUTA_SQLITE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'db', 'gasolinera.db')
+
+ESQUEMA_SQLITE = """
+CREATE TABLE IF NOT EXISTS Usuarios (
+    UsuarioID INTEGER PRIMARY KEY AUTOINCREMENT,
+    NombreUsuario TEXT NOT NULL UNIQUE,
+    Contrasena TEXT NOT NULL,
+    CorreoElectronico TEXT,
+    FechaCreacion DATETIME,
+    Rol TEXT DEFAULT 'encargado'
+);
+CREATE TABLE IF NOT EXISTS TiposCombustible (
+    TipoCombustibleID INTEGER PRIMARY KEY AUTOINCREMENT,
+    Nombre TEXT NOT NULL UNIQUE,
+    Precio REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS InventarioCombustible (
+    InventarioID INTEGER PRIMARY KEY AUTOINCREMENT,
+    TipoCombustibleID INTEGER NOT NULL REFERENCES TiposCombustible(TipoCombustibleID),
+    InventarioInicial REAL NOT NULL DEFAULT 0,
+    Entrada REAL NOT NULL DEFAULT 0,
+    Salida REAL NOT NULL DEFAULT 0,
+    InventarioFinal REAL NOT NULL DEFAULT 0,
+    Fecha DATE NOT NULL,
+    EsAutomatico INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS Pipas (
+    PipaID INTEGER PRIMARY KEY AUTOINCREMENT,
+    Placa TEXT NOT NULL,
+    Capacidad REAL,
+    TipoCombustibleID INTEGER REFERENCES TiposCombustible(TipoCombustibleID),
+    ConductorAsignado TEXT,
+    Estado TEXT,
+    UbicacionActual TEXT,
+    UltimoMantenimiento DATE,
+    ProximoMantenimiento DATE
+);
+CREATE TABLE IF NOT EXISTS Productos (
+    ProductoID INTEGER PRIMARY KEY AUTOINCREMENT,
+    Codigo TEXT,
+    Nombre TEXT NOT NULL,
+    Precio REAL NOT NULL DEFAULT 0,
+    Cantidad INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS Clientes (
+    ClienteID INTEGER PRIMARY KEY AUTOINCREMENT,
+    Nombre TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS Ventas (
+    VentaID INTEGER PRIMARY KEY AUTOINCREMENT,
+    ClienteID INTEGER REFERENCES Clientes(ClienteID),
+    Fecha DATE NOT NULL,
+    Subtotal REAL NOT NULL DEFAULT 0,
+    IVA REAL NOT NULL DEFAULT 0,
+    Descuento REAL NOT NULL DEFAULT 0,
+    Total REAL NOT NULL DEFAULT 0,
+    MetodoPago TEXT,
+    Observaciones TEXT
+);
+CREATE TABLE IF NOT EXISTS DetalleVenta (
+    DetalleVentaID INTEGER PRIMARY KEY AUTOINCREMENT,
+    VentaID INTEGER NOT NULL REFERENCES Ventas(VentaID),
+    ProductoID INTEGER NOT NULL REFERENCES Productos(ProductoID),
+    Cantidad INTEGER NOT NULL,
+    Precio REAL NOT NULL,
+    Subtotal REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS VentaCombustible (
+    VentaCombustibleID INTEGER PRIMARY KEY AUTOINCREMENT,
+    ClienteID INTEGER REFERENCES Clientes(ClienteID),
+    Fecha DATE NOT NULL,
+    Total REAL NOT NULL DEFAULT 0,
+    MetodoPago TEXT,
+    Observaciones TEXT
+);
+CREATE TABLE IF NOT EXISTS DetalleVentaCombustible (
+    DetalleVentaCombustibleID INTEGER PRIMARY KEY AUTOINCREMENT,
+    VentaCombustibleID INTEGER NOT NULL REFERENCES VentaCombustible(VentaCombustibleID),
+    TipoCombustibleID INTEGER NOT NULL REFERENCES TiposCombustible(TipoCombustibleID),
+    PrecioUnitario REAL NOT NULL,
+    CantidadLitros REAL NOT NULL,
+    MontoQuetzales REAL,
+    Subtotal REAL NOT NULL
+);
+"""
+
+# --- Conversión de tipos para SQLite (fechas como texto ISO, decimales como REAL) ---
+
+def _convertir_fecha(valor):
+    texto = valor.decode()
+    try:
+        if len(texto) <= 10:
+            return datetime.date.fromisoformat(texto)
+        return datetime.datetime.fromisoformat(texto)
+    except ValueError:
+        return texto
+
+
+sqlite3.register_adapter(datetime.date, lambda v: v.isoformat())
+sqlite3.register_adapter(datetime.datetime, lambda v: v.isoformat(sep=' '))
+sqlite3.register_adapter(decimal.Decimal, float)
+sqlite3.register_converter('DATE', _convertir_fecha)
+sqlite3.register_converter('DATETIME', _convertir_fecha)
+
+
+class Fila(tuple):
+    """Fila de resultado accesible por índice y por nombre de columna, como pyodbc.Row."""
+
+    __slots__ = ()
+    _indices = {}
+
+    def __getattr__(self, nombre):
+        try:
+            return self[self._indices[nombre]]
+        except KeyError:
+            raise AttributeError(nombre) from None
+
+
+_clases_fila = {}
+
+
+def _clase_fila(description):
+    nombres = tuple(col[0] for col in description)
+    clase = _clases_fila.get(nombres)
+    if clase is None:
+        clase = type('Fila', (Fila,), {'__slots__': (), '_indices': {n: i for i, n in enumerate(nombres)}})
+        _clases_fila[nombres] = clase
+    return clase
+
+
+def _parametros(params):
+    """pyodbc acepta execute(sql, a, b) y execute(sql, (a, b)); sqlite3 solo lo segundo."""
+    if len(params) == 1 and isinstance(params[0], (list, tuple)):
+        return tuple(params[0])
+    return tuple(params)
+
+
+class CursorSQLite:
+    """Cursor de sqlite3 con la interfaz de pyodbc que usa la aplicación."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self._clase = None
+        self.fast_executemany = False  # Solo tiene efecto en pyodbc
+
+    def execute(self, sql, *params):
+        self._cursor.execute(traducir_a_sqlite(sql), _parametros(params))
+        self._clase = _clase_fila(self._cursor.description) if self._cursor.description else None
+        return self
+
+    def executemany(self, sql, filas):
+        self._cursor.executemany(traducir_a_sqlite(sql), [tuple(f) for f in filas])
+        self._clase = None
+        return self
+
+    def _envolver(self, fila):
+        return self._clase(fila) if fila is not None and self._clase else fila
+
+    def fetchone(self):
+        return self._envolver(self._cursor.fetchone())
+
+    def fetchmany(self, cantidad=1):
+        return [self._envolver(f) for f in self._cursor.fetchmany(cantidad)]
+
+    def fetchall(self):
+        return [self._envolver(f) for f in self._cursor.fetchall()]
+
+    def __iter__(self):
+        fila = self.fetchone()
+        while fila is not None:
+            yield fila
+            fila = self.fetchone()
+
+    def nextset(self):
+        return False
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def close(self):
+        self._cursor.close()
+
+
+class ConexionSQLite:
+    """Conexión de sqlite3 que entrega cursores compatibles con pyodbc."""
+
+    def __init__(self, conexion):
+        self._conexion = conexion
+
+    def cursor(self):
+        return CursorSQLite(self._conexion.cursor())
+
+    def execute(self, sql, *params):
+        return self.cursor().execute(sql, *params)
+
+    def commit(self):
+        self._conexion.commit()
+
+    def rollback(self):
+        self._conexion.rollback()
+
+    def close(self):
+        self._conexion.close()
+
+
+class BackendSQLServer:
+    nombre = 'sqlserver'
+    consulta_validacion = "SELECT 1"
+
+    def __init__(self, cadena_conexion):
+        import pyodbc  # Solo se necesita el driver ODBC cuando se usa SQL Server
+        self._pyodbc = pyodbc
+        self.cadena_conexion = cadena_conexion
+        self.clave = cadena_conexion
+        self.Error = pyodbc.Error
+        self.ProgrammingError = pyodbc.ProgrammingError
+
+    def conectar(self):
+        return self._pyodbc.connect(self.cadena_conexion)
+
+    def preparar(self):
+        """Aplica las migraciones pendientes; el resto del esquema lo administra el DBA."""
+        conexion = self.conectar()
+        try:
+            aplicar_migraciones(conexion, self.nombre)
+        finally:
+            conexion.close()
+
+
+class BackendSQLite:
+    nombre = 'sqlite'
+    consulta_validacion = "SELECT 1"
+    Error = sqlite3.Error
+    ProgrammingError = sqlite3.OperationalError  # p.ej. columna inexistente
+
+    def __init__(self, ruta=RUTA_SQLITE):
+        self.ruta = ruta
+        self.clave = f'sqlite:{os.path.abspath(ruta)}'
+
+    def conectar(self):
+        conexion = sqlite3.connect(
+            self.ruta,
+            timeout=30,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            check_same_thread=False,  # El pool la presta a un solo hilo a la vez
+        )
+        conexion.execute("PRAGMA journal_mode=WAL")
+        conexion.execute("PRAGMA synchronous=NORMAL")
+        return ConexionSQLite(conexion)
+
+    def preparar(self):
+        """Crea las tablas que falten en el archivo de SQLite y aplica las migraciones pendientes."""
+        carpeta = os.path.dirname(os.path.abspath(self.ruta))
+        os.makedirs(carpeta, exist_ok=True)
+        conexion = sqlite3.connect(self.ruta, timeout=30)
+        try:
+            conexion.executescript(ESQUEMA_SQLITE)
+            conexion.commit()
+            aplicar_migraciones(conexion, self.nombre)
+        finally:
+            conexion.close()
+
+
+def obtener_backend(cadena_sqlserver):
+    """Devuelve el backend configurado en DB_BACKEND."""
+    tipo = os.getenv('DB_BACKEND', 'sqlserver').strip().lower()
+    if tipo == 'sqlite':
+        backend = BackendSQLite(os.getenv('DB_PATH', RUTA_SQLITE))
+    elif tipo == 'sqlserver':
+        backend = BackendSQLServer(cadena_sqlserver)
+    else:
+        raise ValueError(f"DB_BACKEND desconocido: {tipo}")
+    return backend
+
+
+if __name__ == "__main__":
+    # Instalación local: crea el esquema de SQLite y el primer usuario administrador
+    import getpass
+    os.environ.setdefault('DB_BACKEND', 'sqlite')
+    from conexion import DatabaseAuthenticator
+
+    db = DatabaseAuthenticator()
+    print(f"Base de datos lista ({db.backend.nombre}).")
+    usuario = input("Usuario administrador a crear (vacío para omitir): ").strip()
+    if usuario:
+        contrasena = getpass.getpass("Contraseña: ")
+        if db.crear_usuario(usuario, '', contrasena, 'admin'):
+            print("Usuario creado.")
@@ -0,0 +1,97 @@
+"""
+Benchmark: latencia de editar el primer registro del libro de inventario según
+cuántos registros posteriores hay que recalcular.
+
+Compara la cascada anterior (un UPDATE por registro desde Python) con la
+actual de una sola sentencia. Corre sobre SQLite en un archivo temporal, así
+que no incluye la latencia de red: en SQL Server cada UPDATE de la versión
+anterior es además un viaje de ida y vuelta al servidor.
+
+    python benchmarks/bench_cascada.py [tamaños...]
+"""
+import datetime
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['DB_BACKEND'] = 'sqlite'
+os.environ['DB_PATH'] = os.path.join(tempfile.mkdtemp(prefix='bench_cascada_'), 'bench.db')
+
+from conexion import DatabaseAuthenticator  # noqa: E402
+
+
+def cascada_fila_por_fila(cursor, inventario_id, tipo_id, nuevo_inventario_final, fecha):
+    """Réplica de la implementación anterior, solo para comparar."""
+    cursor.execute("""
+        SELECT InventarioID, Entrada, Salida, Fecha
+        FROM InventarioCombustible
+        WHERE TipoCombustibleID = ? AND (Fecha > ? OR (Fecha = ? AND InventarioID > ?))
+        ORDER BY Fecha ASC, InventarioID ASC
+    """, (tipo_id, fecha, fecha, inventario_id))
+    inventario_inicial = nuevo_inventario_final
+    for reg in cursor.fetchall():
+        inventario_final = inventario_inicial + float(reg[1] or 0) - float(reg[2] or 0)
+        cursor.execute("""
+            UPDATE InventarioCombustible
+            SET InventarioInicial = ?, InventarioFinal = ?
+            WHERE InventarioID = ?
+        """, (inventario_inicial, inventario_final, reg[0]))
+        inventario_inicial = inventario_final
+
+
+def preparar_libro(db, cantidad):
+    with db._transaccion() as cursor:
+        cursor.execute("DELETE FROM InventarioCombustible")
+        cursor.execute("DELETE FROM TiposCombustible")
+        cursor.execute("INSERT INTO TiposCombustible (Nombre, Precio) VALUES ('Super', 35)")
+        tipo_id = cursor.execute("SELECT TipoCombustibleID FROM TiposCombustible").fetchone()[0]
+        inicio = datetime.date(2020, 1, 1)
+        filas = []
+        saldo = 0.0
+        for i in range(cantidad):
+            entrada, salida = (5000.0, 0.0) if i % 50 == 0 else (0.0, 40.0)
+            filas.append((tipo_id, saldo, entrada, salida, saldo + entrada - salida,
+                          (inicio + datetime.timedelta(days=i // 20)).isoformat(), 0))
+            saldo += entrada - salida
+        cursor.executemany("""
+            INSERT INTO InventarioCombustible
+            (TipoCombustibleID, InventarioInicial, Entrada, Salida, InventarioFinal, Fecha, EsAutomatico)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, filas)
+        primero = cursor.execute(
+            "SELECT TOP 1 InventarioID, Fecha FROM InventarioCombustible ORDER BY Fecha, InventarioID"
+        ).fetchone()
+    return tipo_id, primero[0], primero[1]
+
+
+def medir(funcion, repeticiones=3):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return min(tiempos)
+
+
+def main(tamanos):
+    db = DatabaseAuthenticator()
+    print(f"{'registros':>10} {'fila por fila (ms)':>20} {'una sentencia (ms)':>20} {'mejora':>8}")
+    for cantidad in tamanos:
+        tipo_id, inventario_id, fecha = preparar_libro(db, cantidad)
+
+        def anterior():
+            with db._transaccion() as cursor:
+                cascada_fila_por_fila(cursor, inventario_id, tipo_id, 5100.0, fecha)
+
+        def actual():
+            db.actualizar_cascada_inventario(inventario_id, tipo_id, 5100.0, fecha)
+
+        t_anterior = medir(anterior)
+        t_actual = medir(actual)
+        print(f"{cantidad:>10} {t_anterior * 1000:>20.1f} {t_actual * 1000:>20.1f} {t_anterior / t_actual:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main([int(n) for n in sys.argv[1:]] or [1000, 10000, 50000])
@@ -0,0 +1,133 @@
+"""
+Benchmark: memoria máxima (RSS) y tiempo de la descarga de ventas_combustible
+según la cantidad de filas, con la exportación anterior y con las actuales.
+
+- anterior: fetchall() a una lista de dicts, pandas.DataFrame y ExcelWriter
+  sobre un BytesIO (como hacía descargar_reporte)
+- excel: iterar_reporte() con fetchmany, xlsxwriter en modo constant_memory
+  sobre un SpooledTemporaryFile y envío por bloques con transmitir()
+- csv, csv.gz: bloques_csv() / comprimir_gzip() directo desde el cursor
+- npz: escribir_npz() por columnas sobre un SpooledTemporaryFile
+
+Cada medición corre en un proceso aparte para que el pico de uno no contamine
+al siguiente. Se informa el pico absoluto y el aumento sobre el proceso ya
+cargado (después de los imports y antes de exportar).
+
+    python benchmarks/bench_exportacion.py [filas ...]
+"""
+import datetime
+import os
+import resource
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+FILAS_POR_DIA = 1000
+MODOS = ('anterior', 'excel', 'csv', 'csv.gz', 'npz')
+INICIO = datetime.date(2020, 1, 1)
+
+
+def _rss_kb():
+    """
+    Pico de RSS del proceso en KB. En Linux se lee VmHWM, porque ru_maxrss
+    conserva tras exec el pico del proceso padre.
+    """
+    try:
+        with open('/proc/self/status') as estado:
+            for linea in estado:
+                if linea.startswith('VmHWM:'):
+                    return int(linea.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def poblar(ruta, filas):
+    from backends import ESQUEMA_SQLITE
+    from migraciones import aplicar_migraciones
+    conexion = sqlite3.connect(ruta)
+    conexion.executescript(ESQUEMA_SQLITE)
+    aplicar_migraciones(conexion, 'sqlite')
+    conexion.executemany("INSERT INTO TiposCombustible (Nombre, Precio) VALUES (?, ?)",
+                         [('Super', 35), ('Regular', 33), ('Diesel', 30)])
+    conexion.executemany("INSERT INTO Clientes (Nombre) VALUES (?)",
+                         [(f'Cliente {i}',) for i in range(1, 51)])
+    ventas, detalles = [], []
+    for i in range(filas):
+        fecha = INICIO + datetime.timedelta(days=i // FILAS_POR_DIA)
+        ventas.append((i + 1, i % 50 + 1, fecha.isoformat(), 100.0))
+        detalles.append((i + 1, i % 3 + 1, 35.0, 10.0 + i % 40, 350.0))
+    conexion.executemany("INSERT INTO VentaCombustible (VentaCombustibleID, ClienteID, Fecha, Total) "
+                         "VALUES (?, ?, ?, ?)", ventas)
+    conexion.executemany("""
+        INSERT INTO DetalleVentaCombustible
+        (VentaCombustibleID, TipoCombustibleID, PrecioUnitario, CantidadLitros, Subtotal)
+        VALUES (?, ?, ?, ?, ?)
+    """, detalles)
+    conexion.commit()
+    conexion.close()
+
+
+def medir(modo, ruta, filas):
+    """Corre en el proceso hijo: exporta `filas` filas y devuelve (pico KB, base KB, bytes, ms)."""
+    os.environ['DB_BACKEND'] = 'sqlite'
+    os.environ['DB_PATH'] = ruta
+    from conexion import DatabaseAuthenticator
+    import exportacion
+    fecha_fin = INICIO + datetime.timedelta(days=(filas - 1) // FILAS_POR_DIA)
+    db = DatabaseAuthenticator()
+    columnas = exportacion.REPORTES['ventas_combustible'][1]
+    if modo == 'anterior':
+        import io
+        import pandas as pd
+    base = _rss_kb()
+    inicio = time.perf_counter()
+    filas_reporte = db.iterar_reporte('ventas_combustible', INICIO, fecha_fin)
+    if modo == 'anterior':
+        data = db.obtener_ventas_combustible(INICIO, fecha_fin)
+        df = pd.DataFrame(data, columns=columnas)
+        salida = io.BytesIO()
+        with pd.ExcelWriter(salida, engine='xlsxwriter') as writer:
+            df.to_excel(writer, index=False, sheet_name='Reporte')
+        tamano = len(salida.getvalue())
+    elif modo in ('excel', 'npz'):
+        archivo = exportacion.archivo_temporal()
+        escribir = exportacion.escribir_excel if modo == 'excel' else exportacion.escribir_npz
+        escribir(filas_reporte, columnas, archivo)
+        tamano = sum(len(bloque) for bloque in exportacion.transmitir(archivo))
+    else:
+        bloques = exportacion.bloques_csv(filas_reporte, columnas)
+        if modo == 'csv.gz':
+            bloques = exportacion.comprimir_gzip(bloques)
+        tamano = sum(len(bloque) for bloque in bloques)
+    return _rss_kb(), base, tamano, int((time.perf_counter() - inicio) * 1000)
+
+
+def main(cantidades):
+    ruta = os.path.join(tempfile.mkdtemp(prefix='bench_exportacion_'), 'bench.db')
+    poblar(ruta, max(cantidades))
+    print(f"{'filas':>9} {'modo':>9} {'pico (MB)':>10} {'aumento (MB)':>13} {'archivo (MB)':>13} {'tiempo (s)':>11}")
+    for filas in cantidades:
+        for modo in MODOS:
+            salida = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--medir', modo, ruta, str(filas)],
+                capture_output=True, text=True, check=True,
+            ).stdout.strip().splitlines()[-1]
+            pico, base, tamano, ms = (int(v) for v in salida.split())
+            print(f"{filas:>9} {modo:>9} {pico / 1024:>10.1f} {(pico - base) / 1024:>13.1f} "
+                  f"{tamano / 1024 / 1024:>13.1f} {ms / 1000:>11.2f}")
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--medir']:
+        import contextlib
+        with contextlib.redirect_stdout(sys.stderr):
+            resultado = medir(sys.argv[2], sys.argv[3], int(sys.argv[4]))
+        print(*resultado)
+    else:
+        main([int(a) for a in sys.argv[1:]] or [10000, 100000, 300000])
@@ -0,0 +1,143 @@
+"""
+Benchmark: filtros por fecha con funciones sobre la columna contra rangos
+semiabiertos, con y sin los índices de la migración 2.
+
+Genera varios años de ventas e inventario en un SQLite temporal y mide las
+consultas típicas (inventario del mes, historial de ventas del mes, ventas de
+hoy y litros distribuidos hoy) en tres escenarios:
+
+- anterior: MONTH()/YEAR()/CAST() sobre Fecha, sin índices
+- anterior + índices: mismas consultas, ya con los índices creados
+- actual: rangos de filtros_fecha con los índices
+
+    python benchmarks/bench_fechas.py [años] [movimientos_por_dia]
+"""
+import datetime
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backends import BackendSQLite, ESQUEMA_SQLITE  # noqa: E402
+from filtros_fecha import filtro_hoy, filtro_periodo  # noqa: E402
+from migraciones import aplicar_migraciones  # noqa: E402
+
+
+def consultas_anteriores(mes, anio):
+    return {
+        'inventario del mes': ("""
+            SELECT * FROM InventarioCombustible
+            WHERE MONTH(Fecha) = ? AND YEAR(Fecha) = ?
+            ORDER BY Fecha DESC, InventarioID DESC
+        """, (mes, anio)),
+        'historial ventas del mes': ("""
+            SELECT COUNT(*) FROM Ventas WHERE MONTH(Fecha) = ? AND YEAR(Fecha) = ?
+        """, (mes, anio)),
+        'ventas de hoy': ("""
+            SELECT SUM(Total) FROM Ventas WHERE CAST(Fecha AS DATE) = CAST(GETDATE() AS DATE)
+        """, ()),
+        'litros distribuidos hoy': ("""
+            SELECT ISNULL(SUM(Salida), 0) FROM InventarioCombustible
+            WHERE CAST(Fecha AS DATE) = CAST(GETDATE() AS DATE)
+        """, ()),
+    }
+
+
+def consultas_actuales(mes, anio):
+    mes_inv, p_inv = filtro_periodo("Fecha", anio, mes)
+    hoy, p_hoy = filtro_hoy("Fecha")
+    return {
+        'inventario del mes': (f"""
+            SELECT * FROM InventarioCombustible
+            WHERE {" AND ".join(mes_inv)}
+            ORDER BY Fecha DESC, InventarioID DESC
+        """, p_inv),
+        'historial ventas del mes': (f"""
+            SELECT COUNT(*) FROM Ventas WHERE {" AND ".join(mes_inv)}
+        """, p_inv),
+        'ventas de hoy': (f"""
+            SELECT SUM(Total) FROM Ventas WHERE {" AND ".join(hoy)}
+        """, p_hoy),
+        'litros distribuidos hoy': (f"""
+            SELECT ISNULL(SUM(Salida), 0) FROM InventarioCombustible WHERE {" AND ".join(hoy)}
+        """, p_hoy),
+    }
+
+
+def poblar(ruta, anios, por_dia):
+    conexion = sqlite3.connect(ruta)
+    conexion.executescript(ESQUEMA_SQLITE)
+    aplicar_migraciones(conexion, 'sqlite', hasta=1)  # Sin los índices todavía
+    conexion.executemany("INSERT INTO TiposCombustible (Nombre, Precio) VALUES (?, ?)",
+                         [('Super', 35), ('Regular', 33), ('Diesel', 30)])
+    conexion.execute("INSERT INTO Clientes (Nombre) VALUES ('Consumidor final')")
+    azar = random.Random(7)
+    hoy = datetime.date.today()
+    inicio = hoy - datetime.timedelta(days=365 * anios)
+    inventario, ventas = [], []
+    dia = inicio
+    while dia <= hoy:
+        for i in range(por_dia):
+            momento = datetime.datetime.combine(dia, datetime.time(6 + i % 16, azar.randrange(60)))
+            inventario.append((azar.randint(1, 3), 0, 0, azar.uniform(5, 60), 0, dia.isoformat(), 1))
+            ventas.append((1, momento.isoformat(sep=' '), azar.uniform(20, 500)))
+        dia += datetime.timedelta(days=1)
+    conexion.executemany("""
+        INSERT INTO InventarioCombustible
+        (TipoCombustibleID, InventarioInicial, Entrada, Salida, InventarioFinal, Fecha, EsAutomatico)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, inventario)
+    conexion.executemany("INSERT INTO Ventas (ClienteID, Fecha, Total) VALUES (?, ?, ?)", ventas)
+    conexion.commit()
+    conexion.close()
+    return len(inventario)
+
+
+def medir(cursor, sql, params, repeticiones=5):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        cursor.execute(sql, params)
+        cursor.fetchall()
+        tiempos.append(time.perf_counter() - inicio)
+    return min(tiempos) * 1000
+
+
+def main(anios, por_dia):
+    ruta = os.path.join(tempfile.mkdtemp(prefix='bench_fechas_'), 'bench.db')
+    filas = poblar(ruta, anios, por_dia)
+    backend = BackendSQLite(ruta)
+    hoy = datetime.date.today()
+    mes, anio = (hoy.month - 2) % 12 + 1, hoy.year - (1 if hoy.month <= 1 else 0)
+    print(f"{anios} años, {filas} movimientos de inventario y {filas} ventas\n")
+
+    conexion = backend.conectar()
+    cursor = conexion.cursor()
+    sin_indices = {n: medir(cursor, *q) for n, q in consultas_anteriores(mes, anio).items()}
+    conexion.close()
+
+    crudo = sqlite3.connect(ruta)
+    aplicar_migraciones(crudo, 'sqlite')
+    crudo.execute("ANALYZE")
+    crudo.commit()
+    crudo.close()
+
+    conexion = backend.conectar()
+    cursor = conexion.cursor()
+    con_indices = {n: medir(cursor, *q) for n, q in consultas_anteriores(mes, anio).items()}
+    actuales = {n: medir(cursor, *q) for n, q in consultas_actuales(mes, anio).items()}
+    conexion.close()
+
+    print(f"{'consulta':<26} {'anterior (ms)':>14} {'+ índices (ms)':>15} {'actual (ms)':>12} {'mejora':>8}")
+    for nombre in sin_indices:
+        print(f"{nombre:<26} {sin_indices[nombre]:>14.2f} {con_indices[nombre]:>15.2f} "
+              f"{actuales[nombre]:>12.2f} {sin_indices[nombre] / actuales[nombre]:>7.0f}x")
+
+
+if __name__ == '__main__':
+    argumentos = [int(a) for a in sys.argv[1:]]
+    main(*(argumentos + [5, 60][len(argumentos):]))
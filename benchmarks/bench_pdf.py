@@ -0,0 +1,94 @@
+"""
+Benchmark: tiempo y memoria máxima (RSS) del PDF de ventas_combustible según
+la cantidad de filas, con el dibujo anterior y con pdf_tablas.
+
+- anterior: un pdf.cell(..., border=1) por valor a 277 / columnas de ancho,
+  sobre la lista completa de dicts (como hacía descargar_reporte)
+- actual: pdf_tablas.escribir_tabla() sobre iterar_reporte()
+
+Usa la misma base de prueba y la misma medición por proceso que
+bench_exportacion.py.
+
+    python benchmarks/bench_pdf.py [filas ...]
+"""
+import datetime
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_exportacion import FILAS_POR_DIA, INICIO, RAIZ, _rss_kb, poblar  # noqa: E402
+
+sys.path.insert(0, RAIZ)
+
+MODOS = ('anterior', 'actual')
+
+
+def _pdf_anterior(data, columnas, destino):
+    from fpdf import FPDF
+    pdf = FPDF(orientation='L', unit='mm', format='A4')
+    pdf.add_page()
+    pdf.set_font("helvetica", 'B', 14)
+    pdf.cell(0, 10, "Ventas Combustible", new_x='LMARGIN', new_y='NEXT', align='C')
+    pdf.set_font("helvetica", 'B', 11)
+    col_width = 277 / len(columnas)
+    for col in columnas:
+        pdf.cell(col_width, 10, col, border=1, align='C')
+    pdf.ln()
+    pdf.set_font("helvetica", '', 10)
+    for row in data:
+        for col in columnas:
+            valor = row.get(col, '')
+            if isinstance(valor, (int, float)):
+                valor = "{:,.2f}".format(valor)
+            pdf.cell(col_width, 10, str(valor), border=1, align='C')
+        pdf.ln()
+    destino.write(bytes(pdf.output()))
+
+
+def medir(modo, ruta, filas):
+    """Corre en el proceso hijo: genera el PDF y devuelve (pico KB, base KB, bytes, ms)."""
+    os.environ['DB_BACKEND'] = 'sqlite'
+    os.environ['DB_PATH'] = ruta
+    from conexion import DatabaseAuthenticator
+    import exportacion
+    import pdf_tablas
+    fecha_fin = INICIO + datetime.timedelta(days=(filas - 1) // FILAS_POR_DIA)
+    db = DatabaseAuthenticator()
+    columnas = exportacion.REPORTES['ventas_combustible'][1]
+    archivo = tempfile.TemporaryFile()
+    base = _rss_kb()
+    inicio = time.perf_counter()
+    if modo == 'anterior':
+        _pdf_anterior(db.obtener_ventas_combustible(INICIO, fecha_fin), columnas, archivo)
+    else:
+        pdf_tablas.escribir_tabla(db.iterar_reporte('ventas_combustible', INICIO, fecha_fin), columnas,
+                                  archivo, "Ventas Combustible", f"Rango: {INICIO} a {fecha_fin}")
+    return _rss_kb(), base, archivo.tell(), int((time.perf_counter() - inicio) * 1000)
+
+
+def main(cantidades):
+    ruta = os.path.join(tempfile.mkdtemp(prefix='bench_pdf_'), 'bench.db')
+    poblar(ruta, max(cantidades))
+    print(f"{'filas':>9} {'modo':>9} {'pico (MB)':>10} {'aumento (MB)':>13} {'archivo (MB)':>13} {'tiempo (s)':>11}")
+    for filas in cantidades:
+        for modo in MODOS:
+            salida = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--medir', modo, ruta, str(filas)],
+                capture_output=True, text=True, check=True,
+            ).stdout.strip().splitlines()[-1]
+            pico, base, tamano, ms = (int(v) for v in salida.split())
+            print(f"{filas:>9} {modo:>9} {pico / 1024:>10.1f} {(pico - base) / 1024:>13.1f} "
+                  f"{tamano / 1024 / 1024:>13.1f} {ms / 1000:>11.2f}")
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--medir']:
+        import contextlib
+        with contextlib.redirect_stdout(sys.stderr):
+            resultado = medir(sys.argv[2], sys.argv[3], int(sys.argv[4]))
+        print(*resultado)
+    else:
+        main([int(a) for a in sys.argv[1:]] or [5000, 20000, 50000])
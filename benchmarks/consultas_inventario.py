@@ -0,0 +1,96 @@
+"""
+Verificación: la pantalla de inventario y pipas ejecuta siempre la misma
+cantidad (pequeña) de consultas, sin importar cuántos registros tenga el mes
+ni qué página se pida.
+
+Corre la ruta /inventory-and-trucks con el cliente de pruebas de Flask sobre un
+SQLite temporal y cuenta las sentencias que llegan a la base. Termina con
+código 1 si la cantidad cambia con el tamaño o pasa de MAXIMO_CONSULTAS.
+
+    python benchmarks/consultas_inventario.py
+"""
+import datetime
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['DB_BACKEND'] = 'sqlite'
+os.environ['DB_PATH'] = os.path.join(tempfile.mkdtemp(prefix='consultas_inventario_'), 'bench.db')
+
+from backends import BackendSQLite  # noqa: E402
+from cache_catalogos import catalogos  # noqa: E402
+
+MAXIMO_CONSULTAS = 5
+_SENTENCIAS = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH')
+
+consultas = []
+_conectar_original = BackendSQLite.conectar
+
+
+def _conectar_con_traza(self):
+    conexion = _conectar_original(self)
+    conexion._conexion.set_trace_callback(consultas.append)
+    return conexion
+
+
+BackendSQLite.conectar = _conectar_con_traza
+
+from app import app  # noqa: E402
+from conexion import DatabaseAuthenticator  # noqa: E402
+
+
+def preparar_mes(db, cantidad):
+    hoy = datetime.date.today()
+    with db._transaccion() as cursor:
+        cursor.execute("DELETE FROM InventarioCombustible")
+        if not cursor.execute("SELECT COUNT(*) FROM TiposCombustible").fetchone()[0]:
+            cursor.executemany("INSERT INTO TiposCombustible (Nombre, Precio) VALUES (?, ?)",
+                               [('Super', 35), ('Regular', 33), ('Diesel', 30)])
+            cursor.execute("""
+                INSERT INTO Pipas (Placa, Capacidad, TipoCombustibleID, Estado)
+                VALUES ('P-001', 5000, 1, 'Disponible')
+            """)
+        cursor.executemany("""
+            INSERT INTO InventarioCombustible
+            (TipoCombustibleID, InventarioInicial, Entrada, Salida, InventarioFinal, Fecha, EsAutomatico)
+            VALUES (?, 0, 0, 10, 0, ?, ?)
+        """, [(i % 3 + 1, hoy.replace(day=1 + i % hoy.day), i % 2) for i in range(cantidad)])
+
+
+def contar(cliente, url):
+    catalogos.limpiar()
+    del consultas[:]
+    respuesta = cliente.get(url)
+    assert respuesta.status_code == 200, respuesta.status_code
+    return len([c for c in consultas if c.lstrip().upper().startswith(_SENTENCIAS) and c.strip() != 'SELECT 1'])
+
+
+def main():
+    db = DatabaseAuthenticator()
+    app.config['TESTING'] = True
+    cliente = app.test_client()
+    with cliente.session_transaction() as sesion:
+        sesion['usuario'] = 'verificacion'
+        sesion['rol'] = 'admin'
+
+    resultados = {}
+    for cantidad in (5, 200, 5000):
+        preparar_mes(db, cantidad)
+        ultima = max(1, (cantidad + 4) // 5)
+        for pagina in (1, ultima):
+            resultados[(cantidad, pagina)] = contar(cliente, f'/inventory-and-trucks?page={pagina}')
+
+    print(f"{'registros':>10} {'página':>7} {'consultas':>10}")
+    for (cantidad, pagina), total in resultados.items():
+        print(f"{cantidad:>10} {pagina:>7} {total:>10}")
+    distintos = set(resultados.values())
+    if len(distintos) != 1 or max(distintos) > MAXIMO_CONSULTAS:
+        print(f"ERROR: se esperaba una cantidad fija de a lo sumo {MAXIMO_CONSULTAS} consultas.")
+        return 1
+    print(f"OK: {distintos.pop()} consultas por página.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
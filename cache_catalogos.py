@@ -0,0 +1,97 @@
+"""
+Caché en memoria de los catálogos (tipos de combustible, clientes y productos).
+
+Son tablas chicas que cambian unas pocas veces al día pero se leen en casi
+todas las páginas. Cada catálogo se carga completo una vez, se guarda con un
+tiempo de vida (CATALOGO_TTL, en segundos) y los métodos que lo modifican lo
+invalidan. La caché es del proceso y compartida entre hilos; las claves
+incluyen el backend para no mezclar bases de datos distintas.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class Catalogo:
+    """Filas de un catálogo con índices por ID y por nombre."""
+
+    def __init__(self, filas, columna_id=0, columna_nombre=1):
+        self.filas = [tuple(f) for f in filas]
+        self.por_id = {f[columna_id]: f for f in self.filas}
+        self.por_nombre = {f[columna_nombre]: f for f in self.filas}
+
+
+class CacheCatalogos:
+    """
+    Caché acotada por tiempo de vida y por cantidad de entradas (LRU).
+
+    Cada catálogo lleva un número de generación que invalidar() incrementa
+    (limpiar() incrementa uno común a todas las claves): una carga que empezó
+    antes de la invalidación no se guarda, así una lectura lenta no vuelve a
+    dejar datos viejos en la caché.
+    """
+
+    def __init__(self, ttl=300.0, max_entradas=32):
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self._entradas = OrderedDict()  # clave -> (vence, valor)
+        self._generaciones = {}
+        self._generacion_comun = 0
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+
+    def obtener(self, clave, cargar):
+        """Devuelve el valor de `clave`, cargándolo con cargar() si falta o venció."""
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None and entrada[0] > ahora:
+                self._entradas.move_to_end(clave)
+                self.aciertos += 1
+                return entrada[1]
+            self.fallos += 1
+            generacion = (self._generacion_comun, self._generaciones.get(clave, 0))
+        valor = cargar()
+        with self._lock:
+            if (self._generacion_comun, self._generaciones.get(clave, 0)) == generacion:
+                self._entradas[clave] = (time.monotonic() + self.ttl, valor)
+                self._entradas.move_to_end(clave)
+                while len(self._entradas) > self.max_entradas:
+                    self._entradas.popitem(last=False)
+        return valor
+
+    def invalidar(self, *claves):
+        with self._lock:
+            for clave in claves:
+                self._entradas.pop(clave, None)
+                self._generaciones[clave] = self._generaciones.get(clave, 0) + 1
+
+    def limpiar(self):
+        with self._lock:
+            self._generacion_comun += 1
+            self._entradas.clear()
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                'entradas': len(self._entradas),
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+                'ttl': self.ttl,
+            }
+
+
+catalogos = CacheCatalogos(
+    ttl=float(os.getenv('CATALOGO_TTL', '300')),
+    max_entradas=int(os.getenv('CATALOGO_MAX_ENTRADAS', '32')),
+)
+
+# Totales de filas por combinación de filtros (p.ej. tickets del historial de
+# combustible), para las páginas que se recorren por cursor; cada escritura
+# invalida solo las combinaciones de filtros que cuentan lo que escribió.
+conteos = CacheCatalogos(
+    ttl=float(os.getenv('CONTEO_TTL', '300')),
+    max_entradas=int(os.getenv('CONTEO_MAX_ENTRADAS', '256')),
+)
@@ -0,0 +1,126 @@
+"""
+Caché "stale-while-revalidate" de los indicadores del tablero.
+
+El tablero se abre en cada oficina y main.js lo consulta periódicamente; sin
+caché, cada carga vuelve a sumar las ventas y salidas del día en la base.
+Aquí cada valor es fresco durante KPI_FRESCURA segundos. Pasado ese tiempo se
+sigue entregando de inmediato el último valor mientras un hilo en segundo
+plano lo recalcula (uno solo por clave); si pasa de KPI_EDAD_MAXIMA, o si una
+escritura lo invalidó, la siguiente lectura espera el cálculo. Así la base
+recibe a lo sumo un cálculo por clave cada KPI_FRESCURA segundos, sin importar
+cuántos tableros estén abiertos.
+"""
+import os
+import threading
+import time
+
+
+class _Entrada:
+    __slots__ = ('valor', 'calculado', 'refrescando')
+
+    def __init__(self, valor, calculado):
+        self.valor = valor
+        self.calculado = calculado  # time.monotonic() del cálculo
+        self.refrescando = False
+
+
+class CacheKpis:
+    """
+    Cada clave lleva un número de generación que invalidar() incrementa: un
+    cálculo que empezó antes de la invalidación no se guarda, igual que en
+    CacheCatalogos.
+    """
+
+    def __init__(self, frescura=15.0, edad_maxima=300.0):
+        self.frescura = frescura
+        self.edad_maxima = edad_maxima
+        self._entradas = {}  # clave -> _Entrada
+        self._generaciones = {}
+        self._calculos = {}  # clave -> threading.Lock del cálculo en primer plano
+        self._lock = threading.Lock()
+        self.frescos = 0
+        self.viejos = 0
+        self.calculos = 0
+
+    def obtener(self, clave, calcular):
+        """
+        Devuelve el valor de `clave`. calcular() puede ejecutarse en este hilo
+        o, si hay un valor viejo que servir, en otro.
+        """
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None:
+                edad = ahora - entrada.calculado
+                if edad < self.frescura:
+                    self.frescos += 1
+                    return entrada.valor
+                if edad < self.edad_maxima:
+                    self.viejos += 1
+                    if not entrada.refrescando:
+                        entrada.refrescando = True
+                        self._refrescar_en_segundo_plano(clave, calcular)
+                    return entrada.valor
+            calculo = self._calculos.setdefault(clave, threading.Lock())
+        # Sin valor utilizable: un solo hilo calcula y los demás esperan su resultado
+        with calculo:
+            with self._lock:
+                entrada = self._entradas.get(clave)
+                if entrada is not None and time.monotonic() - entrada.calculado < self.frescura:
+                    return entrada.valor
+                generacion = self._generaciones.get(clave, 0)
+            valor = calcular()
+            self._guardar(clave, generacion, valor)
+        return valor
+
+    def _refrescar_en_segundo_plano(self, clave, calcular):
+        generacion = self._generaciones.get(clave, 0)
+
+        def refrescar():
+            try:
+                self._guardar(clave, generacion, calcular())
+            except Exception as e:
+                print("Error al refrescar indicadores en segundo plano:", e)
+                with self._lock:
+                    entrada = self._entradas.get(clave)
+                    if entrada is not None:
+                        entrada.refrescando = False
+
+        threading.Thread(target=refrescar, name=f'kpis-{clave}', daemon=True).start()
+
+    def _guardar(self, clave, generacion, valor):
+        with self._lock:
+            self.calculos += 1
+            if self._generaciones.get(clave, 0) == generacion:
+                self._entradas[clave] = _Entrada(valor, time.monotonic())
+
+    def invalidar(self, *claves):
+        with self._lock:
+            for clave in claves:
+                self._entradas.pop(clave, None)
+                self._generaciones[clave] = self._generaciones.get(clave, 0) + 1
+
+    def limpiar(self):
+        with self._lock:
+            claves = list(self._entradas)
+        self.invalidar(*claves)
+
+    def estadisticas(self):
+        """Contadores y la edad en segundos de cada valor guardado."""
+        ahora = time.monotonic()
+        with self._lock:
+            return {
+                'edades': {str(clave): round(ahora - entrada.calculado, 1)
+                           for clave, entrada in self._entradas.items()},
+                'frescos': self.frescos,
+                'viejos': self.viejos,
+                'calculos': self.calculos,
+                'frescura': self.frescura,
+                'edad_maxima': self.edad_maxima,
+            }
+
+
+cache_kpis = CacheKpis(
+    frescura=float(os.getenv('KPI_FRESCURA', '15')),
+    edad_maxima=float(os.getenv('KPI_EDAD_MAXIMA', '300')),
+)
@@ -0,0 +1,178 @@
+"""
+Caché en disco de los archivos de reportes ya generados.
+
+Los mismos reportes mensuales se descargan muchas veces al día y cada descarga
+volvía a consultar y a generar el archivo. Aquí cada archivo se guarda con un
+nombre que sale de su contenido: reporte, formato, rango de fechas y la
+versión de los datos (DatabaseAuthenticator.version_reporte). Si los datos
+del rango cambian, cambia la versión y la siguiente descarga genera un archivo
+nuevo; el viejo se va por LRU. La versión sale de VersionesDatos, que los
+disparadores de la migración 5 mantienen por tabla y mes en cada escritura,
+también en las hechas desde otro proceso o directo en la base (mover una
+fecha, cambiar un nombre). Para meses cerrados se lee de la caché de
+catálogos sin ir a la base. Las escrituras de la aplicación además borran con
+invalidar() los archivos que dejaron viejos, para no esperar al LRU.
+
+El tamaño total está acotado (REPORTES_CACHE_MB) y se expulsan primero los
+archivos usados hace más tiempo; la fecha de modificación de cada archivo hace
+de marca de uso, así el orden sobrevive a un reinicio. El índice es del
+proceso: con varios procesos sobre el mismo directorio cada uno acota lo suyo.
+"""
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+from filtros_fecha import fecha_de
+
+
+class CacheReportes:
+    """
+    Lleva un número de generación que invalidar() incrementa, como
+    CacheCatalogos: un archivo que empezó a generarse antes de la invalidación
+    se entrega pero no se guarda.
+    """
+
+    def __init__(self, directorio, maximo_bytes=256 * 1024 * 1024):
+        self.directorio = directorio
+        self.maximo_bytes = maximo_bytes
+        self._entradas = None  # nombre -> (reporte, fecha_fin, tamaño); el último es el más reciente
+        self._total = 0
+        self._generacion = 0
+        self._calculos = {}    # nombre -> threading.Lock de la generación en curso
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+
+    @staticmethod
+    def _nombre(reporte, extension, fecha_inicio, fecha_fin, version):
+        inicio, fin = fecha_de(fecha_inicio).isoformat(), fecha_de(fecha_fin).isoformat()
+        huella = hashlib.sha256(f"{reporte}|{extension}|{inicio}|{fin}|{version}".encode('utf-8')).hexdigest()
+        return f"{reporte}__{inicio}__{fin}__{huella[:32]}.{extension}"
+
+    def abrir(self, reporte, extension, fecha_inicio, fecha_fin, version, escribir):
+        """
+        Archivo (abierto en modo binario, al principio) del reporte. Si no está
+        guardado, escribir(destino) lo genera; mientras tanto las demás
+        peticiones del mismo archivo esperan en lugar de generarlo otra vez.
+        """
+        nombre = self._nombre(reporte, extension, fecha_inicio, fecha_fin, version)
+        with self._lock:
+            archivo = self._abrir_guardado(nombre)
+            if archivo is not None:
+                return archivo
+            calculo = self._calculos.setdefault(nombre, threading.Lock())
+        with calculo:
+            with self._lock:
+                archivo = self._abrir_guardado(nombre)
+                if archivo is not None:
+                    return archivo
+                self.fallos += 1
+                generacion = self._generacion
+            temporal = tempfile.NamedTemporaryFile(dir=self.directorio, prefix='.', suffix='.tmp', delete=False)
+            try:
+                with temporal:
+                    escribir(temporal)
+                archivo = open(temporal.name, 'rb')
+            except Exception:
+                os.remove(temporal.name)
+                with self._lock:
+                    self._calculos.pop(nombre, None)
+                raise
+            tamano = os.path.getsize(temporal.name)
+            with self._lock:
+                self._calculos.pop(nombre, None)
+                if generacion == self._generacion and tamano <= self.maximo_bytes:
+                    os.replace(temporal.name, os.path.join(self.directorio, nombre))
+                    self._entradas[nombre] = (reporte, fecha_de(fecha_fin), tamano)
+                    self._total += tamano
+                    self._expulsar()
+                else:
+                    os.remove(temporal.name)  # el archivo abierto se sigue pudiendo leer
+            return archivo
+
+    def _abrir_guardado(self, nombre):
+        """Con el lock tomado: el archivo guardado abierto, o None."""
+        self._cargar_indice()
+        if nombre not in self._entradas:
+            return None
+        ruta = os.path.join(self.directorio, nombre)
+        try:
+            archivo = open(ruta, 'rb')
+        except FileNotFoundError:
+            # Lo borró otro proceso
+            self._total -= self._entradas.pop(nombre)[2]
+            return None
+        os.utime(ruta)
+        self._entradas.move_to_end(nombre)
+        self.aciertos += 1
+        return archivo
+
+    def _cargar_indice(self):
+        """La primera vez, arma el índice con los archivos que ya están en el directorio."""
+        if self._entradas is not None:
+            return
+        os.makedirs(self.directorio, exist_ok=True)
+        encontrados = []
+        for entrada in os.scandir(self.directorio):
+            partes = entrada.name.split('__')
+            if entrada.name.startswith('.') or len(partes) != 4 or not entrada.is_file():
+                continue
+            try:
+                encontrados.append((entrada.stat().st_mtime, entrada.name, partes[0],
+                                    fecha_de(partes[2]), entrada.stat().st_size))
+            except (OSError, ValueError):
+                continue
+        self._entradas = OrderedDict()
+        for _, nombre, reporte, fecha_fin, tamano in sorted(encontrados):
+            self._entradas[nombre] = (reporte, fecha_fin, tamano)
+            self._total += tamano
+        self._expulsar()
+
+    def _expulsar(self):
+        while self._total > self.maximo_bytes and self._entradas:
+            nombre, (_, _, tamano) = self._entradas.popitem(last=False)
+            self._total -= tamano
+            self._quitar(nombre)
+
+    def _quitar(self, nombre):
+        try:
+            os.remove(os.path.join(self.directorio, nombre))
+        except OSError:
+            pass
+
+    def invalidar(self, *reportes, desde=None):
+        """
+        Borra los archivos de `reportes` (de todos si no se indica ninguno)
+        cuyo rango llega a `desde` o después; sin `desde`, todos los de esos reportes.
+        """
+        desde = fecha_de(desde) if desde is not None else None
+        with self._lock:
+            self._generacion += 1
+            self._cargar_indice()
+            for nombre, (reporte, fecha_fin, tamano) in list(self._entradas.items()):
+                if reportes and reporte not in reportes:
+                    continue
+                if desde is not None and fecha_fin < desde:
+                    continue
+                del self._entradas[nombre]
+                self._total -= tamano
+                self._quitar(nombre)
+
+    def estadisticas(self):
+        with self._lock:
+            self._cargar_indice()
+            return {
+                'archivos': len(self._entradas),
+                'bytes': self._total,
+                'maximo_bytes': self.maximo_bytes,
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+            }
+
+
+cache_reportes = CacheReportes(
+    os.getenv('REPORTES_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'reportes_cache')),
+    maximo_bytes=int(float(os.getenv('REPORTES_CACHE_MB', '256')) * 1024 * 1024),
+)
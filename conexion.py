@@ -1,138 +1,374 @@
 import os
-import pyodbc
 import datetime
+import threading
 import getpass  # Módulo para ocultar la contraseña al escribir
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from werkzeug.security import check_password_hash, generate_password_hash
+from analitica import motor_analitico
+from backends import obtener_backend
+from pool_conexiones import obtener_pool
+from unidad_trabajo import unidad_actual
+from cache_catalogos import Catalogo, catalogos, conteos
+from filtros_fecha import fecha_de, filtro_dia, filtro_entre_fechas, filtro_hoy, filtro_periodo, rango_periodo
+from cache_kpis import cache_kpis
+from cache_reportes import cache_reportes
+from facetas import Facetas, facetas, meses_entre
+from kpis import KpisDashboard
+from paginacion import armar_pagina, filtro_keyset
+
+# Backends (por clave) cuyo esquema y tabla de saldos ya se prepararon en este proceso
+_esquemas_listos = set()
+_esquemas_lock = threading.Lock()
+
+# Transacciones del pool abiertas por _transaccion en cada hilo (fuera de peticiones Flask)
+_local = threading.local()
+
+# Consulta de cada catálogo y columna que sirve de nombre para la búsqueda por nombre
+_CONSULTAS_CATALOGO = {
+    'tipos_combustible': ("SELECT TipoCombustibleID, Nombre, Precio FROM TiposCombustible", 1),
+    'clientes': ("SELECT ClienteID, Nombre FROM Clientes", 1),
+    'productos': ("SELECT ProductoID, Codigo, Nombre, Precio, Cantidad FROM Productos", 2),
+    'codigos_productos': (
+        "SELECT DISTINCT Codigo FROM Productos WHERE Codigo IS NOT NULL AND Codigo <> '' ORDER BY Codigo", 0
+    ),
+}
+
+# Tabla de cada conjunto de facetas (años y meses con datos); todas tienen índice por Fecha
+_TABLAS_FACETAS = {
+    'ventas_combustible': 'VentaCombustible',
+    'ventas_productos': 'Ventas',
+}
+# Meses que se comprueban por consulta al calcular facetas
+_MESES_POR_CONSULTA = 120
+
+# Resúmenes diarios (migración 4): tabla, columna de la dimensión, medidas y la
+# consulta que los rearma desde las ventas (sus columnas en el mismo orden)
+_RESUMENES = {
+    'combustible': ('ResumenDiarioCombustible', 'TipoCombustibleID', ('Litros', 'Monto', 'Lineas'), """
+        SELECT CAST(VC.Fecha AS DATE), ISNULL(VC.ClienteID, 0), DVC.TipoCombustibleID,
+               SUM(DVC.CantidadLitros), SUM(DVC.Subtotal), COUNT(*)
+        FROM VentaCombustible VC
+        JOIN DetalleVentaCombustible DVC ON DVC.VentaCombustibleID = VC.VentaCombustibleID
+        GROUP BY CAST(VC.Fecha AS DATE), ISNULL(VC.ClienteID, 0), DVC.TipoCombustibleID
+    """),
+    'productos': ('ResumenDiarioProductos', 'ProductoID', ('Cantidad', 'Monto', 'Lineas'), """
+        SELECT CAST(V.Fecha AS DATE), ISNULL(V.ClienteID, 0), DV.ProductoID,
+               SUM(DV.Cantidad), SUM(DV.Subtotal), COUNT(*)
+        FROM Ventas V
+        JOIN DetalleVenta DV ON DV.VentaID = V.VentaID
+        GROUP BY CAST(V.Fecha AS DATE), ISNULL(V.ClienteID, 0), DV.ProductoID
+    """),
+}
+# Filas (fecha, cliente, nombre, medida, monto) de cada resumen para el motor analítico
+_HECHOS_ANALITICA = {
+    'combustible': """
+        SELECT R.Fecha, R.ClienteID, TC.Nombre, R.Litros, R.Monto
+        FROM ResumenDiarioCombustible R
+        JOIN TiposCombustible TC ON R.TipoCombustibleID = TC.TipoCombustibleID
+    """,
+    'productos': """
+        SELECT R.Fecha, R.ClienteID, P.Nombre, R.Cantidad, R.Monto
+        FROM ResumenDiarioProductos R
+        JOIN Productos P ON R.ProductoID = P.ProductoID
+    """,
+}
+# Días que se releen por consulta en la carga incremental del motor analítico
+_DIAS_POR_CONSULTA = 200
+
+# Reportes descargables: columna por la que se filtra el rango de fechas (None si
+# no se filtra) y consulta (los alias son los encabezados del archivo)
+_CONSULTAS_REPORTE = {
+    'inventario_combustible': ("Fecha", """
+        SELECT CONVERT(VARCHAR, Fecha, 23) AS Fecha,
+            (SELECT Nombre FROM TiposCombustible WHERE TipoCombustibleID = IC.TipoCombustibleID) AS Combustible,
+            Entrada, Salida, InventarioFinal AS Saldo
+        FROM InventarioCombustible IC
+        WHERE {filtro}
+        ORDER BY Fecha, Combustible
+    """),
+    'ventas_combustible': ("VC.Fecha", """
+        SELECT CONVERT(VARCHAR, VC.Fecha, 23) AS Fecha,
+            C.Nombre AS Cliente,
+            TC.Nombre AS Combustible,
+            DVC.CantidadLitros AS Litros
+        FROM VentaCombustible VC
+        JOIN Clientes C ON VC.ClienteID = C.ClienteID
+        JOIN DetalleVentaCombustible DVC ON VC.VentaCombustibleID = DVC.VentaCombustibleID
+        JOIN TiposCombustible TC ON DVC.TipoCombustibleID = TC.TipoCombustibleID
+        WHERE {filtro}
+        ORDER BY VC.Fecha, C.Nombre
+    """),
+    'ventas_productos': ("V.Fecha", """
+        SELECT CONVERT(VARCHAR, V.Fecha, 23) AS Fecha,
+            P.Nombre AS Producto,
+            DV.Cantidad AS Cantidad,
+            DV.Subtotal AS Total
+        FROM Ventas V
+        JOIN DetalleVenta DV ON V.VentaID = DV.VentaID
+        JOIN Productos P ON DV.ProductoID = P.ProductoID
+        WHERE {filtro}
+        ORDER BY V.Fecha, P.Nombre
+    """),
+    'inventario_productos': (None, """
+        SELECT P.Nombre AS Producto, P.Cantidad AS Saldo
+        FROM Productos P
+        ORDER BY P.Nombre
+    """),
+}
+# Filas de VersionesDatos (migración 5) de las que depende cada reporte: la
+# tabla versionada por mes dentro del rango (None si no se filtra por fecha) y
+# las versionadas sin mes (Mes = '')
+_VERSIONES_REPORTE = {
+    'inventario_combustible': ('InventarioCombustible', ('Nombres',)),
+    'ventas_combustible': ('VentaCombustible', ('Nombres',)),
+    'ventas_productos': ('Ventas', ('Nombres',)),
+    'inventario_productos': (None, ('Productos',)),
+}
+
+# Totales de las hojas de resumen del cierre de mes: columna de fecha y consulta
+# (cada {filtro} es el rango sobre esa columna); los alias son los encabezados
+_CONSULTAS_CIERRE = {
+    'totales_combustible': ("R.Fecha", """
+        SELECT TC.Nombre AS Combustible, SUM(R.Litros) AS Litros, SUM(R.Monto) AS Monto,
+            SUM(R.Lineas) AS Lineas
+        FROM ResumenDiarioCombustible R
+        JOIN TiposCombustible TC ON R.TipoCombustibleID = TC.TipoCombustibleID
+        WHERE {filtro}
+        GROUP BY TC.Nombre
+        ORDER BY TC.Nombre
+    """),
+    'totales_metodo_pago': ("Fecha", """
+        SELECT Origen, MetodoPago, COUNT(*) AS Ventas, SUM(Total) AS Total
+        FROM (
+            SELECT 'Combustible' AS Origen, ISNULL(MetodoPago, 'Sin especificar') AS MetodoPago, Total
+            FROM VentaCombustible WHERE {filtro}
+            UNION ALL
+            SELECT 'Productos' AS Origen, ISNULL(MetodoPago, 'Sin especificar') AS MetodoPago, Total
+            FROM Ventas WHERE {filtro}
+        ) T
+        GROUP BY Origen, MetodoPago
+        ORDER BY Origen, MetodoPago
+    """),
+}
+
+
+def _patron_like(texto):
+    """Escapa los comodines de LIKE para buscar `texto` literal (se usa con ESCAPE '\\')."""
+    for caracter in ('\\', '%', '_', '['):
+        texto = texto.replace(caracter, '\\' + caracter)
+    return texto
+
+
+def _producto(row):
+    return type('Producto', (), {
+        'ProductoID': row[0],
+        'Codigo': row[1],
+        'Nombre': row[2],
+        'Precio': row[3],
+        'Cantidad': row[4]
+    })()
+
+# Columnas del libro de inventario que muestran los listados, ya con el nombre del tipo
+_COLUMNAS_INVENTARIO = """
+    IC.InventarioID, IC.TipoCombustibleID, TC.Nombre AS NombreTipo,
+    IC.InventarioInicial, IC.Entrada, IC.Salida, IC.InventarioFinal,
+    IC.Fecha, IC.EsAutomatico
+"""
+
+
+def _registro_inventario(row):
+    return {
+        'InventarioID': row[0],
+        'TipoCombustibleID': int(row[1]),
+        'NombreTipo': row[2],
+        'InventarioInicial': float(row[3] or 0),
+        'Entrada': float(row[4] or 0),
+        'Salida': float(row[5] or 0),
+        'InventarioFinal': float(row[6] or 0),
+        'Fecha': row[7],
+        'EsAutomatico': int(row[8] or 0),
+    }
 
 class DatabaseAuthenticator:
-    def actualizar_cascada_inventario(self, inventario_id, tipo_id, nuevo_inventario_final, fecha):
+    def actualizar_cascada_inventario(self, inventario_id, tipo_id, nuevo_inventario_final, fecha, cursor=None):
         """
         Actualiza en cascada los registros posteriores al registro editado para mantener la coherencia de saldos.
+        Se hace en una sola sentencia: el saldo de cada registro posterior es el
+        nuevo inventario final más la suma acumulada de (Entrada - Salida)
+        ordenada por Fecha, InventarioID.
         """
         try:
-            self.connection = pyodbc.connect(self._get_connection_string())
-            cursor = self.connection.cursor()
-            # Seleccionar todos los registros posteriores (por fecha y tipo) ordenados
-            cursor.execute("""
-                SELECT InventarioID, Entrada, Salida, Fecha
-                FROM InventarioCombustible
-                WHERE TipoCombustibleID = ? AND (Fecha > ? OR (Fecha = ? AND InventarioID > ?))
-                ORDER BY Fecha ASC, InventarioID ASC
-            """, (tipo_id, fecha, fecha, inventario_id))
-            registros = cursor.fetchall()
-            inventario_inicial = nuevo_inventario_final
-            for reg in registros:
-                reg_id = reg[0]
-                entrada = float(reg[1] or 0)
-                salida = float(reg[2] or 0)
-                # Calcular nuevo inventario final
-                inventario_final = inventario_inicial + entrada - salida
-                # Actualizar registro
+            with self._transaccion(cursor) as cursor:
                 cursor.execute("""
+                    WITH Posteriores AS (
+                        SELECT InventarioID,
+                            ISNULL(Entrada, 0) - ISNULL(Salida, 0) AS Neto,
+                            SUM(ISNULL(Entrada, 0) - ISNULL(Salida, 0)) OVER (
+                                ORDER BY Fecha, InventarioID ROWS UNBOUNDED PRECEDING
+                            ) AS Acumulado
+                        FROM InventarioCombustible
+                        WHERE TipoCombustibleID = ? AND (Fecha > ? OR (Fecha = ? AND InventarioID > ?))
+                    )
                     UPDATE InventarioCombustible
-                    SET InventarioInicial = ?, InventarioFinal = ?
-                    WHERE InventarioID = ?
-                """, (inventario_inicial, inventario_final, reg_id))
-                inventario_inicial = inventario_final
-            self.connection.commit()
+                    SET InventarioInicial = ? + Posteriores.Acumulado - Posteriores.Neto,
+                        InventarioFinal = ? + Posteriores.Acumulado
+                    FROM Posteriores
+                    WHERE InventarioCombustible.InventarioID = Posteriores.InventarioID
+                """, (tipo_id, fecha, fecha, inventario_id, nuevo_inventario_final, nuevo_inventario_final))
+                self._invalidar_reportes('inventario_combustible')
         except Exception as e:
             print("Error en actualización en cascada de inventario:", e)
-        finally:
-            if self.connection:
-                self.connection.close()
-    def obtener_saldos_actuales_todos(self):
+    def obtener_saldos_actuales_todos(self, cursor=None):
         """
         Devuelve un diccionario con el saldo actual de todos los tipos de combustible.
         """
         try:
-            self.connection = pyodbc.connect(self._get_connection_string())
-            cursor = self.connection.cursor()
-            cursor.execute("""
-                SELECT TC.Nombre, ISNULL(SUM(IC.Entrada),0) AS TotalEntradas, ISNULL(SUM(IC.Salida),0) AS TotalSalidas
-                FROM InventarioCombustible IC
-                JOIN TiposCombustible TC ON IC.TipoCombustibleID = TC.TipoCombustibleID
-                GROUP BY TC.Nombre
-            """)
-            saldos = {}
-            for row in cursor.fetchall():
-                nombre = row[0]
-                entradas = float(row[1])
-                salidas = float(row[2])
-                saldos[nombre] = entradas - salidas
-            return saldos
+            with self._transaccion(cursor) as cursor:
+                cursor.execute("""
+                    SELECT TC.Nombre, S.Saldo
+                    FROM SaldosCombustible S
+                    JOIN TiposCombustible TC ON S.TipoCombustibleID = TC.TipoCombustibleID
+                """)
+                return {row[0]: float(row[1] or 0) for row in cursor.fetchall()}
         except Exception as e:
             print("Error al obtener saldos actuales de todos los combustibles:", e)
             return {}
-        finally:
-            if self.connection:
-                self.connection.close()
-    def obtener_saldo_actual(self, tipo_id):
+    def obtener_saldo_actual(self, tipo_id, cursor=None):
         """
-        Devuelve el saldo actual (SUM(Entrada) - SUM(Salida)) para el tipo de combustible.
+        Devuelve el saldo actual (SUM(Entrada) - SUM(Salida)) para el tipo de combustible,
+        leído de la tabla de saldos que mantienen los métodos que escriben el inventario.
         """
         try:
-            self.connection = pyodbc.connect(self._get_connection_string())
-            cursor = self.connection.cursor()
-            cursor.execute("""
-                SELECT ISNULL(SUM(Entrada),0) AS TotalEntradas, ISNULL(SUM(Salida),0) AS TotalSalidas
-                FROM InventarioCombustible
-                WHERE TipoCombustibleID = ?
-            """, (tipo_id,))
-            row = cursor.fetchone()
-            entradas = float(row[0]) if row and row[0] is not None else 0.0
-            salidas = float(row[1]) if row and row[1] is not None else 0.0
-            return entradas - salidas
+            with self._transaccion(cursor) as cursor:
+                cursor.execute("SELECT Saldo FROM SaldosCombustible WHERE TipoCombustibleID = ?", (tipo_id,))
+                row = cursor.fetchone()
+                return float(row[0]) if row and row[0] is not None else 0.0
         except Exception as e:
             print("Error al calcular saldo actual:", e)
             return 0.0
-        finally:
-            if self.connection:
-                self.connection.close()
 
-    def obtener_inventario_actual(self, tipo_id):
+    def _ajustar_saldo(self, cursor, tipo_id, delta):
+        """Suma `delta` al saldo del tipo de combustible dentro de la transacción del cursor."""
+        cursor.execute("""
+            UPDATE SaldosCombustible
+            SET Saldo = Saldo + ?, FechaActualizacion = GETDATE()
+            WHERE TipoCombustibleID = ?
+        """, (delta, tipo_id))
+        if cursor.rowcount == 0:
+            cursor.execute("""
+                INSERT INTO SaldosCombustible (TipoCombustibleID, Saldo, FechaActualizacion)
+                VALUES (?, ?, GETDATE())
+            """, (tipo_id, delta))
+
+    def verificar_saldos(self, reparar=False, cursor=None):
         """
-        Devuelve el saldo real actual para el tipo de combustible,
-        sumando entradas y restando salidas posteriores al último registro de inventario.
+        Compara la tabla de saldos con la suma del libro de inventario.
+        Devuelve la lista de diferencias [(tipo_id, saldo_tabla, saldo_libro)];
+        con reparar=True reconstruye la tabla cuando hay alguna.
         """
-        try:
-            self.connection = pyodbc.connect(self._get_connection_string())
-            cursor = self.connection.cursor()
-            # 1. Obtener el último registro de inventario para ese tipo
+        with self._transaccion(cursor) as cursor:
             cursor.execute("""
-                SELECT TOP 1 InventarioFinal, Fecha
-                FROM InventarioCombustible
-                WHERE TipoCombustibleID = ?
-                ORDER BY Fecha DESC, InventarioID DESC
-            """, (tipo_id,))
-            row = cursor.fetchone()
-            saldo = float(row[0]) if row and row[0] is not None else 0.0
-            fecha_ultimo = row[1] if row and row[1] is not None else None
-
-            # 2. Sumar entradas y restar salidas posteriores a esa fecha
-            if fecha_ultimo:
-                cursor.execute("""
-                    SELECT ISNULL(SUM(Entrada),0), ISNULL(SUM(Salida),0)
-                    FROM InventarioCombustible
-                    WHERE TipoCombustibleID = ? AND Fecha > ?
-                """, (tipo_id, fecha_ultimo))
-                movs = cursor.fetchone()
-                entradas = float(movs[0]) if movs and movs[0] is not None else 0.0
-                salidas = float(movs[1]) if movs and movs[1] is not None else 0.0
-                saldo += entradas - salidas
-            return saldo
-        except Exception as e:
-            print("Error al calcular inventario actual:", e)
-            return 0.0
-        finally:
-            if self.connection:
-                self.connection.close()
-    def __init__(self):
+                SELECT TC.TipoCombustibleID, ISNULL(S.Saldo, 0),
+                    (SELECT ISNULL(SUM(IC.Entrada), 0) - ISNULL(SUM(IC.Salida), 0)
+                     FROM InventarioCombustible IC
+                     WHERE IC.TipoCombustibleID = TC.TipoCombustibleID)
+                FROM TiposCombustible TC
+                LEFT JOIN SaldosCombustible S ON S.TipoCombustibleID = TC.TipoCombustibleID
+            """)
+            diferencias = [
+                (row[0], float(row[1]), float(row[2]))
+                for row in cursor.fetchall()
+                if abs(float(row[1]) - float(row[2])) > 0.005
+            ]
+            if diferencias and reparar:
+                self.reconstruir_saldos(cursor=cursor)
+            return diferencias
+
+    def reconstruir_saldos(self, solo_faltantes=False, cursor=None):
+        """
+        Recalcula la tabla de saldos desde el libro de inventario.
+        Con solo_faltantes=True únicamente agrega los tipos que aún no tienen fila.
+        """
+        with self._transaccion(cursor) as cursor:
+            if not solo_faltantes:
+                cursor.execute("DELETE FROM SaldosCombustible")
+            cursor.execute("""
+                INSERT INTO SaldosCombustible (TipoCombustibleID, Saldo, FechaActualizacion)
+                SELECT TC.TipoCombustibleID, ISNULL(SUM(IC.Entrada), 0) - ISNULL(SUM(IC.Salida), 0), GETDATE()
+                FROM TiposCombustible TC
+                LEFT JOIN InventarioCombustible IC ON IC.TipoCombustibleID = TC.TipoCombustibleID
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM SaldosCombustible S WHERE S.TipoCombustibleID = TC.TipoCombustibleID
+                )
+                GROUP BY TC.TipoCombustibleID
+            """)
+            self._invalidar_kpis()
+
+    def _acumular_resumen(self, cursor, resumen, fecha, cliente_id, totales):
+        """
+        Suma a los resúmenes diarios, dentro de la transacción de la venta, los
+        `totales` {id de combustible o producto: (medidas...)} del día y cliente.
+        UPDLOCK + HOLDLOCK bloquean también la fila que aún no existe, así dos
+        ventas del mismo día no intentan insertarla a la vez.
+        """
+        tabla, columna, medidas, _ = _RESUMENES[resumen]
+        dia = fecha_de(fecha)
+        cliente = int(cliente_id or 0)
+        for clave, valores in totales.items():
+            cursor.execute(f"""
+                UPDATE {tabla} WITH (UPDLOCK, HOLDLOCK)
+                SET {", ".join(f"{m} = {m} + ?" for m in medidas)}
+                WHERE Fecha = ? AND ClienteID = ? AND {columna} = ?
+            """, (*valores, dia, cliente, clave))
+            if cursor.rowcount == 0:
+                cursor.execute(f"""
+                    INSERT INTO {tabla} (Fecha, ClienteID, {columna}, {", ".join(medidas)})
+                    VALUES (?, ?, ?, {", ".join("?" * len(medidas))})
+                """, (dia, cliente, clave, *valores))
+        motor = self._analitica()
+        self._al_finalizar_transaccion(lambda: motor.marcar_dias(resumen, [dia]))
+
+    def reconstruir_resumenes(self, cursor=None):
+        """Rearma los resúmenes diarios desde las ventas (por ejemplo tras corregir datos a mano)."""
+        with self._transaccion(cursor) as cursor:
+            for tabla, columna, medidas, consulta in _RESUMENES.values():
+                cursor.execute(f"DELETE FROM {tabla}")
+                cursor.execute(
+                    f"INSERT INTO {tabla} (Fecha, ClienteID, {columna}, {', '.join(medidas)}) {consulta}"
+                )
+            self._al_finalizar_transaccion(self._analitica().invalidar)
+
+    def _analitica(self):
+        """Motor analítico en memoria de este backend (ver analitica.py)."""
+        return motor_analitico(self.backend.clave, self._cargar_hechos)
+
+    def _cargar_hechos(self, conjunto, fechas=None):
+        """Filas de un resumen diario para el motor analítico: todas o las de esos días."""
+        with self._transaccion() as cursor:
+            if not fechas:
+                cursor.execute(_HECHOS_ANALITICA[conjunto])
+                return cursor.fetchall()
+            filas = []
+            for i in range(0, len(fechas), _DIAS_POR_CONSULTA):
+                grupo = fechas[i:i + _DIAS_POR_CONSULTA]
+                cursor.execute(
+                    _HECHOS_ANALITICA[conjunto] + f" WHERE R.Fecha IN ({', '.join('?' * len(grupo))})",
+                    [fecha_de(f) for f in grupo],
+                )
+                filas.extend(cursor.fetchall())
+            return filas
+
+    def __init__(self, preparar_esquema=True):
         # Configuración de la conexión (usa variables de entorno con fallback)
         self.server = os.getenv('DB_SERVER', r'LAPTOP-1MHEEMP6\SQLSERVER2022')
         self.database = os.getenv('DB_NAME', 'SistemaGasolinera')
         self.username = os.getenv('DB_USER', 'sa')
         self.password = os.getenv('DB_PASSWORD', 'Ale1209.')
-        self.connection = None
+        # Motor de almacenamiento (SQL Server o SQLite) según DB_BACKEND
+        self.backend = obtener_backend(self._get_connection_string())
+        if preparar_esquema:
+            self._preparar_esquema()
 
     def _get_connection_string(self):
         """Genera la cadena de conexión"""
@@ -144,281 +380,462 @@ class DatabaseAuthenticator:
             f'PWD={self.password}'
         )
 
-    def authenticate_user(self, username: str, password: str):
+    def _preparar_esquema(self):
+        """
+        Crea las tablas que falten y siembra la tabla de saldos a partir del
+        libro de inventario. Se hace una sola vez por backend y proceso.
+        """
+        clave = self.backend.clave
+        if clave in _esquemas_listos:
+            return
+        with _esquemas_lock:
+            if clave in _esquemas_listos:
+                return
+            try:
+                self.backend.preparar()
+                with self._conectar() as connection:
+                    self.reconstruir_saldos(solo_faltantes=True, cursor=connection.cursor())
+                _esquemas_listos.add(clave)
+            except Exception as e:
+                print("Error al preparar el esquema de la base de datos:", e)
+
+    def _conectar(self):
+        """
+        Presta una conexión del pool compartido del proceso.
+        Hay que cerrarla con close() (o usarla con `with`) para devolverla al pool.
+        """
+        return self._pool().obtener()
+
+    def _pool(self):
+        """Pool de conexiones compartido del proceso para este backend."""
+        return obtener_pool(
+            self.backend.clave,
+            self.backend.conectar,
+            consulta_validacion=self.backend.consulta_validacion,
+            tamano_maximo=int(os.getenv('DB_POOL_SIZE', '10')),
+            tiempo_espera=float(os.getenv('DB_POOL_TIMEOUT', '30')),
+            inactividad_maxima=float(os.getenv('DB_POOL_IDLE', '300')),
+            vida_maxima=float(os.getenv('DB_POOL_LIFETIME', '1800')),
+        )
+
+    @contextmanager
+    def _transaccion(self, cursor=None):
+        """
+        Entrega el cursor con el que trabaja cada método de acceso a datos:
+        - Si se pasa `cursor`, se reutiliza tal cual y quien lo pasó confirma.
+        - Dentro de una petición Flask se usa la unidad de trabajo de la petición
+          (una conexión y una transacción), que se confirma en el teardown.
+        - Fuera de una petición se presta una conexión del pool y se confirma al
+          salir del bloque sin errores.
+        Una excepción dentro del bloque revierte la transacción correspondiente.
+        """
+        if cursor is not None:
+            yield cursor
+            return
+        unidad = unidad_actual(self._conectar)
+        if unidad is not None:
+            try:
+                yield unidad.cursor()
+            except Exception:
+                unidad.marcar_fallida()
+                raise
+            return
+        pila = _local.__dict__.setdefault('al_finalizar', [])
+        pendientes = []  # (funcion, solo_si_confirma)
+        pila.append(pendientes)
+        confirmada = False
+        try:
+            with self._conectar() as connection:
+                yield connection.cursor()
+            confirmada = True
+        finally:
+            pila.pop()
+            for funcion, solo_si_confirma in pendientes:
+                if confirmada or not solo_si_confirma:
+                    funcion()
+
+    def _al_finalizar_transaccion(self, funcion, solo_si_confirma=False):
+        """
+        Ejecuta `funcion` cuando termine (confirmada o revertida) la transacción
+        en curso: la de la petición o la abierta por _transaccion en este hilo.
+        Con solo_si_confirma=True se descarta si la transacción se revierte.
+        Si no hay ninguna, la ejecuta de inmediato.
+        """
+        unidad = unidad_actual(self._conectar)
+        if unidad is not None:
+            unidad.al_finalizar(funcion, solo_si_confirma)
+            return
+        pila = _local.__dict__.get('al_finalizar')
+        if pila:
+            pila[-1].append((funcion, solo_si_confirma))
+        else:
+            funcion()
+
+    def _invalidar_catalogos(self, *nombres):
+        """
+        Saca los catálogos de la caché ahora y otra vez al terminar la
+        transacción, para que nadie los recargue con los datos de antes del commit.
+        """
+        claves = [(self.backend.clave, nombre) for nombre in nombres]
+        catalogos.invalidar(*claves)
+        self._al_finalizar_transaccion(lambda: catalogos.invalidar(*claves))
+
+    def _invalidar_kpis(self):
+        """Igual que _invalidar_catalogos, para los indicadores del tablero."""
+        clave = (self.backend.clave, 'kpis_dashboard')
+        cache_kpis.invalidar(clave)
+        self._al_finalizar_transaccion(lambda: cache_kpis.invalidar(clave))
+
+    def _invalidar_analitica(self, *conjuntos):
+        """Igual que _invalidar_catalogos, para las tablas del motor analítico."""
+        motor = self._analitica()
+        motor.invalidar(*conjuntos)
+        self._al_finalizar_transaccion(lambda: motor.invalidar(*conjuntos))
+
+    def _clave_conteo_combustible(self, cliente_id, fecha):
+        """Clave en `conteos` del total del historial de combustible con esos filtros."""
+        cliente = str(cliente_id).strip() if cliente_id not in (None, '') else None
+        dia = None
+        if fecha:
+            try:
+                dia = fecha_de(fecha).isoformat()
+            except ValueError:
+                dia = str(fecha)
+        return (self.backend.clave, 'historial_ventas_combustible', cliente, dia)
+
+    def _invalidar_conteo_combustible(self, cliente_id, fecha):
+        """
+        Igual que _invalidar_catalogos, solo para los totales del historial de
+        combustible que cuentan una venta de ese cliente y día: el del
+        cliente y el día, el del cliente, el del día y el sin filtros.
+        """
+        claves = {self._clave_conteo_combustible(c, f)
+                  for c in (cliente_id, None) for f in (fecha, None)}
+        conteos.invalidar(*claves)
+        self._al_finalizar_transaccion(lambda: conteos.invalidar(*claves))
+
+    def _invalidar_reportes(self, *reportes, desde=None):
+        """
+        Igual que _invalidar_catalogos, para los archivos de `reportes` en
+        cache_reportes cuyo rango llega a `desde` o después (todos sin `desde`).
+        """
+        cache_reportes.invalidar(*reportes, desde=desde)
+        self._al_finalizar_transaccion(lambda: cache_reportes.invalidar(*reportes, desde=desde))
+        self._invalidar_catalogos('versiones_datos')
+
+    def _registrar_faceta(self, conjunto, fecha):
+        """
+        Agrega el año y mes de una inserción a las facetas en caché de
+        `conjunto` cuando la transacción se confirma (no si se revierte).
+        """
+        clave = (self.backend.clave, conjunto)
+
+        def registrar():
+            try:
+                facetas.registrar(clave, fecha)
+            except ValueError:
+                pass  # Fecha ilegible: la recogerá la próxima carga completa
+
+        self._al_finalizar_transaccion(registrar, solo_si_confirma=True)
+
+    def obtener_facetas(self, conjunto, cursor=None):
+        """
+        Facetas (años y meses con datos) de 'ventas_combustible' o
+        'ventas_productos', desde la caché. En lugar de agrupar todo el
+        historial se leen MIN/MAX(Fecha) y luego, por cada mes del rango, un
+        EXISTS que se resuelve con una búsqueda en el índice por Fecha.
+        """
+        tabla = _TABLAS_FACETAS[conjunto]
+
+        def cargar(cursor=None):
+            with self._transaccion(cursor) as cursor:
+                cursor.execute(f"SELECT MIN(Fecha), MAX(Fecha) FROM {tabla}")
+                primera, ultima = cursor.fetchone()
+                if primera is None:
+                    return Facetas()
+                meses = meses_entre(primera, ultima)
+                pares = []
+                for i in range(0, len(meses), _MESES_POR_CONSULTA):
+                    partes, params = [], []
+                    for anio, mes in meses[i:i + _MESES_POR_CONSULTA]:
+                        # anio y mes son enteros generados aquí, no datos del usuario
+                        partes.append(f"SELECT {anio} AS Anio, {mes} AS Mes WHERE EXISTS "
+                                      f"(SELECT 1 FROM {tabla} WHERE Fecha >= ? AND Fecha < ?)")
+                        params.extend(rango_periodo(anio, mes))
+                    cursor.execute(" UNION ALL ".join(partes), params)
+                    pares.extend(cursor.fetchall())
+                return Facetas(pares)
+
+        try:
+            if cursor is not None:
+                return cargar(cursor)
+            return facetas.obtener((self.backend.clave, conjunto), cargar)
+        except Exception as e:
+            print(f"Error al obtener años y meses de {conjunto}:", e)
+            return Facetas()
+
+    def _catalogo(self, nombre, cursor=None):
+        """
+        Devuelve el Catalogo `nombre` desde la caché. Con un cursor explícito se
+        lee directo de la base, porque puede haber cambios aún sin confirmar.
+        """
+        consulta, columna_nombre = _CONSULTAS_CATALOGO[nombre]
+
+        def cargar(cursor=None):
+            with self._transaccion(cursor) as cursor:
+                cursor.execute(consulta)
+                return Catalogo(cursor.fetchall(), columna_nombre=columna_nombre)
+
+        if cursor is not None:
+            return cargar(cursor)
+        return catalogos.obtener((self.backend.clave, nombre), cargar)
+
+    def authenticate_user(self, username: str, password: str, cursor=None):
         """Autentica un usuario y devuelve dict con datos o None.
         Compatibilidad: acepta contraseñas en texto plano o con hash.
         """
         try:
-            self.connection = pyodbc.connect(self._get_connection_string())
-            cursor = self.connection.cursor()
-            # Intentar traer hash (o texto) y rol; si la columna Rol no existe, hacer fallback
-            try:
-                cursor.execute(
-                    "SELECT UsuarioID, Contrasena, ISNULL(Rol, 'encargado') as Rol FROM Usuarios WHERE NombreUsuario = ?",
-                    (username,)
-                )
-            except pyodbc.ProgrammingError:
-                cursor.execute(
-                    "SELECT UsuarioID, Contrasena FROM Usuarios WHERE NombreUsuario = ?",
-                    (username,)
-                )
-            row = cursor.fetchone()
-            if not row:
-                return None
-            # Cuando no exista Rol, asignar 'encargado' por defecto
-            user_id, stored_pw = row[0], row[1]
-            role = row[2] if len(row) >= 3 else 'encargado'
-
-            # Si parece hash (ej. pbkdf2:, scrypt:), usar check_password_hash; si no, comparar en texto plano
-            if isinstance(stored_pw, str) and (':' in stored_pw):
-                ok = check_password_hash(stored_pw, password)
-            else:
-                ok = (stored_pw == password)
+            with self._transaccion(cursor) as cursor:
+                # Intentar traer hash (o texto) y rol; si la columna Rol no existe, hacer fallback
+                try:
+                    cursor.execute(
+                        "SELECT UsuarioID, Contrasena, ISNULL(Rol, 'encargado') as Rol FROM Usuarios WHERE NombreUsuario = ?",
+                        (username,)
+                    )
+                except self.backend.ProgrammingError:
+                    cursor.execute(
+                        "SELECT UsuarioID, Contrasena FROM Usuarios WHERE NombreUsuario = ?",
+                        (username,)
+                    )
+                row = cursor.fetchone()
+                if not row:
+                    return None
+                # Cuando no exista Rol, asignar 'encargado' por defecto
+                user_id, stored_pw = row[0], row[1]
+                role = row[2] if len(row) >= 3 else 'encargado'
 
-            if not ok:
-                return None
+                # Si parece hash (ej. pbkdf2:, scrypt:), usar check_password_hash; si no, comparar en texto plano
+                if isinstance(stored_pw, str) and (':' in stored_pw):
+                    ok = check_password_hash(stored_pw, password)
+                else:
+                    ok = (stored_pw == password)
 
-            return {"id": int(user_id), "usuario": username, "rol": role}
-        except pyodbc.Error as ex:
+                if not ok:
+                    return None
+
+                return {"id": int(user_id), "usuario": username, "rol": role}
+        except self.backend.Error as ex:
             error_msg = ex.args[1] if len(ex.args) > 1 else str(ex)
             print(f"\nError de base de datos: {error_msg}")
             return None
-        finally:
-            if self.connection:
-                self.connection.close()
 
-    def set_user_password(self, username: str, password: str) -> bool:
+    def set_user_password(self, username: str, password: str, cursor=None) -> bool:
         """Actualiza la contraseña del usuario con un hash seguro."""
         try:
-            self.connection = pyodbc.connect(self._get_connection_string())
-            cursor = self.connection.cursor()
-            pw_hash = generate_password_hash(password)
-            cursor.execute("UPDATE Usuarios SET Contrasena = ? WHERE NombreUsuario = ?", (pw_hash, username))
-            self.connection.commit()
-            return cursor.rowcount > 0
+            with self._transaccion(cursor) as cursor:
+                pw_hash = generate_password_hash(password)
+                cursor.execute("UPDATE Usuarios SET Contrasena = ? WHERE NombreUsuario = ?", (pw_hash, username))
+                return cursor.rowcount > 0
         except Exception as e:
             print("Error al actualizar contraseña:", e)
-            if self.connection:
-                self.connection.rollback()
             return False
-        finally:
-            if self.connection:
-                self.connection.close()
 
-    def crear_usuario(self, username: str, correo: str, password: str, rol: str = 'encargado') -> bool:
+    def crear_usuario(self, username: str, correo: str, password: str, rol: str = 'encargado', cursor=None) -> bool:
         """Crea un usuario con contraseña hasheada."""
         try:
-            self.connection = pyodbc.connect(self._get_connection_string())
-            cursor = self.connection.cursor()
-            pw_hash = generate_password_hash(password)
-            cursor.execute(
-                "INSERT INTO Usuarios (NombreUsuario, Contrasena, CorreoElectronico, FechaCreacion, Rol) VALUES (?, ?, ?, GETDATE(), ?)",
-                (username, pw_hash, correo, rol)
-            )
-            self.connection.commit()
-            return True
+            with self._transaccion(cursor) as cursor:
+                pw_hash = generate_password_hash(password)
+                cursor.execute(
+                    "INSERT INTO Usuarios (NombreUsuario, Contrasena, CorreoElectronico, FechaCreacion, Rol) VALUES (?, ?, ?, GETDATE(), ?)",
+                    (username, pw_hash, correo, rol)
+                )
+                return True
         except Exception as e:
             print("Error al crear usuario:", e)
-            if self.connection:
-                self.connection.rollback()
             return False
-        finally:
-            if self.connection:
-                self.connection.close()
     
-    def obtener_ventas_mensuales_combustible_agrupadas(self, cliente_id=None, mes=None, anio=None):
+    def obtener_usuarios(self, cursor=None):
+        """Lista los usuarios del sistema para la pantalla de administración."""
+        with self._transaccion(cursor) as cursor:
+            cursor.execute("SELECT UsuarioID, NombreUsuario, CorreoElectronico, Rol FROM Usuarios")
+            return [
+                {'id': row[0], 'usuario': row[1], 'correo': row[2], 'rol': row[3]}
+                for row in cursor.fetchall()
+            ]
+
+    def actualizar_usuario(self, usuario_id, correo, rol, password=None, cursor=None):
+        """Actualiza correo y rol; si se indica contraseña la guarda como hash."""
+        with self._transaccion(cursor) as cursor:
+            cursor.execute("UPDATE Usuarios SET CorreoElectronico = ?, Rol = ? WHERE UsuarioID = ?", (correo, rol, usuario_id))
+            if password:
+                pw_hash = generate_password_hash(password)
+                cursor.execute("UPDATE Usuarios SET Contrasena = ? WHERE UsuarioID = ?", (pw_hash, usuario_id))
+
+    def obtener_ventas_mensuales_combustible_agrupadas(self, cliente_id=None, mes=None, anio=None, cursor=None):
         """
         Obtiene las ventas de combustible agrupadas, incluyendo el año.
-        Si no hay filtros, muestra todos los datos históricos.
+        Si no hay filtros, muestra todos los datos históricos. Sin cursor
+        explícito responde el motor analítico en memoria.
         """
+        if cursor is None:
+            try:
+                return self._analitica().ventas_mensuales_combustible(cliente_id, mes, anio)
+            except Exception as e:
+                print("Error en el motor analítico, se consulta la base:", e)
         try:
-            self.connection = pyodbc.connect(self._get_connection_string())
-            cursor = self.connection.cursor()
-            params = []
-            query_base = (
-                "SELECT MONTH(VC.Fecha) as mes, "
-                "TC.Nombre as tipo_combustible, "
-                "SUM(DVC.CantidadLitros) as total_litros, "
-                "YEAR(VC.Fecha) as anio "
-                "FROM VentaCombustible VC "
-                "JOIN DetalleVentaCombustible DVC ON VC.VentaCombustibleID = DVC.VentaCombustibleID "
-                "JOIN TiposCombustible TC ON DVC.TipoCombustibleID = TC.TipoCombustibleID "
-            )
-            where_clauses = []
-            if cliente_id:
-                where_clauses.append("VC.ClienteID = ?")
-                params.append(cliente_id)
-            if mes:
-                where_clauses.append("MONTH(VC.Fecha) = ?")
-                params.append(mes)
-            if anio:
-                where_clauses.append("YEAR(VC.Fecha) = ?")
-                params.append(anio)
-            query = query_base
-            if where_clauses:
-                query += " WHERE " + " AND ".join(where_clauses)
-            query += " GROUP BY YEAR(VC.Fecha), MONTH(VC.Fecha), TC.Nombre ORDER BY anio, mes, tipo_combustible;"
-            cursor.execute(query, params)
-            resultados = cursor.fetchall()
-            print('DEBUG ventas mensuales:', resultados)  # Depuración
-            return resultados
+            with self._transaccion(cursor) as cursor:
+                params = []
+                # Desde el resumen diario: una fila por día, cliente y combustible
+                query_base = (
+                    "SELECT MONTH(R.Fecha) as mes, "
+                    "TC.Nombre as tipo_combustible, "
+                    "SUM(R.Litros) as total_litros, "
+                    "YEAR(R.Fecha) as anio "
+                    "FROM ResumenDiarioCombustible R "
+                    "JOIN TiposCombustible TC ON R.TipoCombustibleID = TC.TipoCombustibleID "
+                )
+                where_clauses = []
+                if cliente_id:
+                    where_clauses.append("R.ClienteID = ?")
+                    params.append(cliente_id)
+                clausulas, valores = filtro_periodo("R.Fecha", anio, mes)
+                where_clauses.extend(clausulas)
+                params.extend(valores)
+                query = query_base
+                if where_clauses:
+                    query += " WHERE " + " AND ".join(where_clauses)
+                query += " GROUP BY YEAR(R.Fecha), MONTH(R.Fecha), TC.Nombre ORDER BY anio, mes, tipo_combustible;"
+                cursor.execute(query, params)
+                return cursor.fetchall()
         except Exception as e:
             print(f"Error al obtener ventas mensuales de combustible: {e}")
             return []
-        finally:
-            if self.connection:
-                self.connection.close()
 
-    def obtener_productos_mas_vendidos(self, cliente_id=None, mes=None, anio=None):
+    def obtener_productos_mas_vendidos(self, cliente_id=None, mes=None, anio=None, cursor=None):
         """
         Obtiene los productos más vendidos, incluyendo el año.
-        Si no hay filtros, muestra el top 10 histórico.
+        Si no hay filtros, muestra el top 10 histórico. Sin cursor explícito
+        responde el motor analítico en memoria.
         """
+        if cursor is None:
+            try:
+                return self._analitica().productos_mas_vendidos(cliente_id, mes, anio)
+            except Exception as e:
+                print("Error en el motor analítico, se consulta la base:", e)
         try:
-            self.connection = pyodbc.connect(self._get_connection_string())
-            cursor = self.connection.cursor()
-            params = []
-            query_base = (
-                "SELECT TOP 10 P.Nombre, "
-                "SUM(DV.Cantidad) as total_vendido, "
-                "YEAR(V.Fecha) as anio "
-                "FROM Ventas V "
-                "JOIN DetalleVenta DV ON V.VentaID = DV.VentaID "
-                "JOIN Productos P ON DV.ProductoID = P.ProductoID "
-            )
-            where_clauses = []
-            if cliente_id:
-                where_clauses.append("V.ClienteID = ?")
-                params.append(cliente_id)
-            if mes:
-                where_clauses.append("MONTH(V.Fecha) = ?")
-                params.append(mes)
-            if anio:
-                where_clauses.append("YEAR(V.Fecha) = ?")
-                params.append(anio)
-            query = query_base
-            if where_clauses:
-                query += " WHERE " + " AND ".join(where_clauses)
-            query += " GROUP BY YEAR(V.Fecha), P.Nombre ORDER BY anio DESC, total_vendido DESC;"
-            cursor.execute(query, params)
-            resultados = cursor.fetchall()
-            print('DEBUG productos más vendidos:', resultados)  # Depuración
-            return resultados
+            with self._transaccion(cursor) as cursor:
+                params = []
+                # Desde el resumen diario: una fila por día, cliente y producto
+                query_base = (
+                    "SELECT TOP 10 P.Nombre, "
+                    "SUM(R.Cantidad) as total_vendido, "
+                    "YEAR(R.Fecha) as anio "
+                    "FROM ResumenDiarioProductos R "
+                    "JOIN Productos P ON R.ProductoID = P.ProductoID "
+                )
+                where_clauses = []
+                if cliente_id:
+                    where_clauses.append("R.ClienteID = ?")
+                    params.append(cliente_id)
+                clausulas, valores = filtro_periodo("R.Fecha", anio, mes)
+                where_clauses.extend(clausulas)
+                params.extend(valores)
+                query = query_base
+                if where_clauses:
+                    query += " WHERE " + " AND ".join(where_clauses)
+                query += " GROUP BY YEAR(R.Fecha), P.Nombre ORDER BY anio DESC, total_vendido DESC;"
+                cursor.execute(query, params)
+                return cursor.fetchall()
         except Exception as e:
             print(f"Error al obtener productos más vendidos: {e}")
             return []
-        finally:
-            if self.connection:
-                self.connection.close()
-    def obtener_ventas_totales_hoy(self):
+    def obtener_ventas_totales_hoy(self, cursor=None):
         try:
-            self.connection = pyodbc.connect(self._get_connection_string())
-            cursor = self.connection.cursor()
-            query = """
-                SELECT SUM(Total)
-                FROM Ventas
-                WHERE CAST(Fecha AS DATE) = CAST(GETDATE() AS DATE)
-            """
-            cursor.execute(query)
-            result = cursor.fetchone()
-            return float(result[0]) if result and result[0] else 0.0
+            with self._transaccion(cursor) as cursor:
+                clausulas, params = filtro_hoy("Fecha")
+                query = f"""
+                    SELECT SUM(Total)
+                    FROM Ventas
+                    WHERE {" AND ".join(clausulas)}
+                """
+                cursor.execute(query, params)
+                result = cursor.fetchone()
+                return float(result[0]) if result and result[0] else 0.0
         except Exception as e:
             print("Error al obtener ventas totales:", e)
             return 0.0
-        finally:
-            if self.connection:
-                self.connection.close()
     
-    def obtener_inventario_actual(self):
+    def obtener_inventario_actual(self, tipo_id=None, cursor=None):
+        """
+        Con tipo_id devuelve el saldo actual de ese combustible; sin él, la lista
+        (Nombre, Inventario) de todos los tipos. Ambos salen de la tabla de saldos.
+        """
+        if tipo_id is not None:
+            return self.obtener_saldo_actual(tipo_id, cursor=cursor)
         try:
-            self.connection = pyodbc.connect(self._get_connection_string())
-            cursor = self.connection.cursor()
-            query = """
-                SELECT TC.Nombre, 
-                    COALESCE(IC.InventarioFinal, 0) as Inventario
-                FROM TiposCombustible TC
-                LEFT JOIN (
-                    SELECT TipoCombustibleID, InventarioFinal
-                    FROM InventarioCombustible
-                    WHERE Fecha = (
-                        SELECT MAX(Fecha)
-                        FROM InventarioCombustible IC2
-                        WHERE IC2.TipoCombustibleID = InventarioCombustible.TipoCombustibleID
-                    )
-                ) IC ON TC.TipoCombustibleID = IC.TipoCombustibleID
-            """
-            cursor.execute(query)
-            return cursor.fetchall()
+            with self._transaccion(cursor) as cursor:
+                query = """
+                    SELECT TC.Nombre, ISNULL(S.Saldo, 0) as Inventario
+                    FROM TiposCombustible TC
+                    LEFT JOIN SaldosCombustible S ON TC.TipoCombustibleID = S.TipoCombustibleID
+                """
+                cursor.execute(query)
+                return cursor.fetchall()
         except Exception as e:
             print("Error al obtener inventario actual:", e)
             return []
-        finally:
-            if self.connection:
-                self.connection.close()
 
-    def obtener_inventario_consolidado(self):
+    def obtener_inventario_consolidado(self, cursor=None):
         try:
-            self.connection = pyodbc.connect(self._get_connection_string())
-            cursor = self.connection.cursor()
-            query = """
-                SELECT TC.Nombre, 
-                    SUM(IC.Entrada) - SUM(IC.Salida) as InventarioFinal
-                FROM TiposCombustible TC
-                LEFT JOIN InventarioCombustible IC ON TC.TipoCombustibleID = IC.TipoCombustibleID
-                GROUP BY TC.Nombre
-            """
-            cursor.execute(query)
-            return cursor.fetchall()
+            with self._transaccion(cursor) as cursor:
+                query = """
+                    SELECT TC.Nombre, S.Saldo as InventarioFinal
+                    FROM TiposCombustible TC
+                    LEFT JOIN SaldosCombustible S ON TC.TipoCombustibleID = S.TipoCombustibleID
+                """
+                cursor.execute(query)
+                return cursor.fetchall()
         except Exception as e:
             print("Error al obtener inventario consolidado:", e)
             return []
-        finally:
-            if self.connection:
-                self.connection.close()
 
-    def obtener_litros_distribuidos_hoy(self):
+    def obtener_litros_distribuidos_hoy(self, cursor=None):
         try:
-            self.connection = pyodbc.connect(self._get_connection_string())
-            cursor = self.connection.cursor()
-            query = """
-                SELECT ISNULL(SUM(Salida), 0)
-                FROM InventarioCombustible
-                WHERE CAST(Fecha AS DATE) = CAST(GETDATE() AS DATE)
-            """
-            cursor.execute(query)
-            result = cursor.fetchone()
-            return float(result[0]) if result and result[0] else 0.0
+            with self._transaccion(cursor) as cursor:
+                clausulas, params = filtro_hoy("Fecha")
+                query = f"""
+                    SELECT ISNULL(SUM(Salida), 0)
+                    FROM InventarioCombustible
+                    WHERE {" AND ".join(clausulas)}
+                """
+                cursor.execute(query, params)
+                result = cursor.fetchone()
+                return float(result[0]) if result and result[0] else 0.0
         except Exception as e:
             print("Error al obtener litros distribuidos:", e)
             return 0.0
-        finally:
-            if self.connection:
-                self.connection.close()
 
     
     
-    def obtener_todos_los_registros_inventario(self):
+    def obtener_todos_los_registros_inventario(self, cursor=None):
         try:
-            self.connection = pyodbc.connect(self._get_connection_string())
-            cursor = self.connection.cursor()
-            query = "SELECT * FROM InventarioCombustible"
-            cursor.execute(query)
-            registros = cursor.fetchall()
-            return registros
+            with self._transaccion(cursor) as cursor:
+                query = "SELECT * FROM InventarioCombustible"
+                cursor.execute(query)
+                registros = cursor.fetchall()
+                return registros
         except Exception as e:
             print("Error al obtener registros de inventario:", e)
             return []
-        finally:
-            if self.connection:
-                self.connection.close()
 
-    def actualizar_registro_inventario(self, id, tipo_id, inventario_inicial, entrada, salida, inventario_final, fecha):
+    def actualizar_registro_inventario(self, id, tipo_id, inventario_inicial, entrada, salida, inventario_final, fecha, cursor=None):
         try:
-            # Establecer conexión
-            with pyodbc.connect(self._get_connection_string()) as connection:
-                cursor = connection.cursor()
+            with self._transaccion(cursor) as cursor:
                 # Verificar si el registro es automático
-                cursor.execute("SELECT EsAutomatico FROM InventarioCombustible WHERE InventarioID = ?", (id,))
+                cursor.execute("""
+                    SELECT EsAutomatico, TipoCombustibleID, Entrada, Salida
+                    FROM InventarioCombustible WHERE InventarioID = ?
+                """, (id,))
                 row = cursor.fetchone()
                 if not row:
                     print("Error: InventarioID no encontrado.")
@@ -426,6 +843,7 @@ class DatabaseAuthenticator:
                 if row[0] == 1:
                     print("No se puede editar un registro de inventario generado automáticamente por una venta.")
                     return False
+                neto_anterior = float(row[2] or 0) - float(row[3] or 0)
 
                 # Realizar la actualización
                 query = """
@@ -434,62 +852,46 @@ class DatabaseAuthenticator:
                     WHERE InventarioID = ?
                 """
                 cursor.execute(query, (tipo_id, inventario_inicial, entrada, salida, inventario_final, fecha, id))
-                connection.commit()
+                self._ajustar_saldo(cursor, row[1], -neto_anterior)
+                self._ajustar_saldo(cursor, tipo_id, float(entrada or 0) - float(salida or 0))
+                self._invalidar_kpis()
+                self._invalidar_reportes('inventario_combustible')
                 return True
-        except pyodbc.Error as e:
+        except self.backend.Error as e:
             print("Error al actualizar registro de inventario:", e)
             return False
 
-    def obtener_nombre_tipo_combustible(self, tipo_id):
+    def obtener_nombre_tipo_combustible(self, tipo_id, cursor=None):
         try:
-            self.connection = pyodbc.connect(self._get_connection_string())
-            cursor = self.connection.cursor()
-            query = "SELECT Nombre FROM TiposCombustible WHERE TipoCombustibleID = ?"
-            cursor.execute(query, (tipo_id,))
-            result = cursor.fetchone()
-            return result[0] if result else None
+            fila = self._catalogo('tipos_combustible', cursor).por_id.get(int(tipo_id))
+            return fila[1] if fila else None
         except Exception as e:
             print("Error al obtener nombre del tipo de combustible:", e)
             return None
-        finally:
-            if self.connection:
-                self.connection.close()
 
     def obtener_ultimo_inventario_final(self, tipo_id, cursor=None):
-        close_connection = False
-        if cursor is None:
-            self.connection = pyodbc.connect(self._get_connection_string())
-            cursor = self.connection.cursor()
-            close_connection = True
         try:
-            query = """
-                SELECT TOP 1 InventarioFinal
-                FROM InventarioCombustible
-                WHERE TipoCombustibleID = ?
-                ORDER BY Fecha DESC, InventarioID DESC
-            """
-            cursor.execute(query, (tipo_id,))
-            result = cursor.fetchone()
-            return float(result[0]) if result and result[0] else 0.0
+            with self._transaccion(cursor) as cursor:
+                query = """
+                    SELECT TOP 1 InventarioFinal
+                    FROM InventarioCombustible
+                    WHERE TipoCombustibleID = ?
+                    ORDER BY Fecha DESC, InventarioID DESC
+                """
+                cursor.execute(query, (tipo_id,))
+                result = cursor.fetchone()
+                return float(result[0]) if result and result[0] else 0.0
         except Exception as e:
             print("Error al obtener el último inventario final:", e)
             return 0.0
-        finally:
-            if close_connection and self.connection:
-                self.connection.close()
 
                 
     def agregar_registro_inventario(self, tipo_id, inventario_inicial, entrada, salida, inventario_final, fecha, es_automatico=0, cursor=None):
-        close_connection = False
-        if cursor is None:
-            self.connection = pyodbc.connect(self._get_connection_string())
-            cursor = self.connection.cursor()
-            close_connection = True
+        # Validación básica de datos
+        if not tipo_id or not fecha:
+            print("Error: tipo_id o fecha vacíos")
+            return False
         try:
-            # Validación básica de datos
-            if not tipo_id or not fecha:
-                print("Error: tipo_id o fecha vacíos")
-                return False
             tipo_id = int(tipo_id)
             inventario_inicial = float(inventario_inicial)
             entrada = float(entrada)
@@ -500,796 +902,993 @@ class DatabaseAuthenticator:
                 print(f"Error: formato de fecha inválido: {fecha}")
                 return False
 
-            query = """
-                INSERT INTO InventarioCombustible
-                (TipoCombustibleID, InventarioInicial, Entrada, Salida, InventarioFinal, Fecha, EsAutomatico)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            """
-            cursor.execute(query, tipo_id, inventario_inicial, entrada, salida, inventario_final, fecha, es_automatico)
-            if close_connection:
-                self.connection.commit()
-                print("Registro de inventario guardado correctamente.")
+            with self._transaccion(cursor) as cursor:
+                query = """
+                    INSERT INTO InventarioCombustible
+                    (TipoCombustibleID, InventarioInicial, Entrada, Salida, InventarioFinal, Fecha, EsAutomatico)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                """
+                cursor.execute(query, tipo_id, inventario_inicial, entrada, salida, inventario_final, fecha, es_automatico)
+                self._ajustar_saldo(cursor, tipo_id, entrada - salida)
+                self._invalidar_kpis()
+                self._invalidar_reportes('inventario_combustible', desde=fecha)
             return True
         except Exception as e:
             print("Error al agregar registro de inventario:", repr(e))
             return False
-        finally:
-            if close_connection and self.connection:
-                self.connection.close()
-        
-    def obtener_tipos_combustible(self):
+
+    def obtener_tipos_combustible(self, cursor=None):
         try:
-            self.connection = pyodbc.connect(self._get_connection_string())
-            cursor = self.connection.cursor()
-            query = "SELECT Nombre FROM TiposCombustible"
-            cursor.execute(query)
-            tipos_combustible = [row[0] for row in cursor.fetchall()]
-            return tipos_combustible
+            return [fila[1] for fila in self._catalogo('tipos_combustible', cursor).filas]
         except Exception as e:
             print("Error al obtener tipos de combustible:", e)
             return []
-        finally:
-            if self.connection:
-                self.connection.close()
 
-    def obtener_inventario_inicial(self, tipo_id):
+    def obtener_inventario_inicial(self, tipo_id, cursor=None):
         try:
-            self.connection = pyodbc.connect(self._get_connection_string())
-            cursor = self.connection.cursor()
-            query = """
-                SELECT InventarioInicial
-                FROM InventarioCombustible
-                WHERE TipoCombustibleID = ?
-                ORDER BY Fecha DESC
-                """
-            cursor.execute(query, (tipo_id,))
-            result = cursor.fetchone()
-            return float(result[0]) if result and result[0] else 0.0
+            with self._transaccion(cursor) as cursor:
+                query = """
+                    SELECT InventarioInicial
+                    FROM InventarioCombustible
+                    WHERE TipoCombustibleID = ?
+                    ORDER BY Fecha DESC
+                    """
+                cursor.execute(query, (tipo_id,))
+                result = cursor.fetchone()
+                return float(result[0]) if result and result[0] else 0.0
         except Exception as e:
             print("Error al obtener inventario inicial:", e)
             return 0.0
-        finally:
-            if self.connection:
-                self.connection.close()
 
-    def obtener_detalles_registro_inventario(self, id):
+    def obtener_detalles_registro_inventario(self, id, cursor=None):
         try:
-            self.connection = pyodbc.connect(self._get_connection_string())
-            cursor = self.connection.cursor()
-            query = """
-                SELECT TipoCombustibleID, InventarioInicial, Entrada, Salida, InventarioFinal, Fecha
-                FROM InventarioCombustible
-                WHERE InventarioID = ?
-            """
-            cursor.execute(query, (id,))
-            result = cursor.fetchone()
-            if result:
-                return {
-                    'tipo_combustible_id': result[0],
-                    'inventario_inicial': result[1],
-                    'entrada': result[2],
-                    'salida': result[3],
-                    'inventario_final': result[4],
-                    'fecha': result[5]
-                }
-            else:
-                print("Error: InventarioID no encontrado.")
-                return None
+            with self._transaccion(cursor) as cursor:
+                query = """
+                    SELECT TipoCombustibleID, InventarioInicial, Entrada, Salida, InventarioFinal, Fecha
+                    FROM InventarioCombustible
+                    WHERE InventarioID = ?
+                """
+                cursor.execute(query, (id,))
+                result = cursor.fetchone()
+                if result:
+                    return {
+                        'tipo_combustible_id': result[0],
+                        'inventario_inicial': result[1],
+                        'entrada': result[2],
+                        'salida': result[3],
+                        'inventario_final': result[4],
+                        'fecha': result[5]
+                    }
+                else:
+                    print("Error: InventarioID no encontrado.")
+                    return None
         except Exception as e:
             print("Error al obtener detalles del registro de inventario:", e)
             return None
-        finally:
-            if self.connection:
-                self.connection.close()
 
-    def eliminar_registro_inventario(self, id):
+    def eliminar_registro_inventario(self, id, cursor=None):
         try:
-            self.connection = pyodbc.connect(self._get_connection_string())
-            cursor = self.connection.cursor()
-            # Verificar si el registro es automático
-            cursor.execute("SELECT EsAutomatico FROM InventarioCombustible WHERE InventarioID = ?", (id,))
-            row = cursor.fetchone()
-            if not row:
-                print("Error: InventarioID no encontrado.")
-                return False
-            if row[0] == 1:
-                print("No se puede eliminar un registro de inventario generado automáticamente por una venta.")
-                return False
+            with self._transaccion(cursor) as cursor:
+                # Verificar si el registro es automático
+                cursor.execute("""
+                    SELECT EsAutomatico, TipoCombustibleID, Entrada, Salida
+                    FROM InventarioCombustible WHERE InventarioID = ?
+                """, (id,))
+                row = cursor.fetchone()
+                if not row:
+                    print("Error: InventarioID no encontrado.")
+                    return False
+                if row[0] == 1:
+                    print("No se puede eliminar un registro de inventario generado automáticamente por una venta.")
+                    return False
 
-            query = "DELETE FROM InventarioCombustible WHERE InventarioID = ?"
-            cursor.execute(query, (id,))
-            self.connection.commit()
-            return True
+                query = "DELETE FROM InventarioCombustible WHERE InventarioID = ?"
+                cursor.execute(query, (id,))
+                self._ajustar_saldo(cursor, row[1], -(float(row[2] or 0) - float(row[3] or 0)))
+                self._invalidar_kpis()
+                self._invalidar_reportes('inventario_combustible')
+                return True
         except Exception as e:
             print("Error al eliminar registro de inventario:", e)
             return False
-        finally:
-            if self.connection:
-                self.connection.close()
 
-    def obtener_tipo_combustible_id(self, tipo_nombre):
+    def obtener_tipo_combustible_id(self, tipo_nombre, cursor=None):
         try:
-            self.connection = pyodbc.connect(self._get_connection_string())
-            cursor = self.connection.cursor()
-            query = "SELECT TipoCombustibleID FROM TiposCombustible WHERE Nombre = ?"
-            cursor.execute(query, (tipo_nombre,))
-            result = cursor.fetchone()
-            return result[0] if result else None
+            fila = self._catalogo('tipos_combustible', cursor).por_nombre.get(tipo_nombre)
+            return fila[0] if fila else None
         except Exception as e:
             print("Error al obtener TipoCombustibleID:", e)
             return None
-        finally:
-            if self.connection:
-                self.connection.close()
 
-    def obtener_registros_inventario_completo(self):
+    def obtener_registros_inventario_completo(self, cursor=None):
         try:
-            self.connection = pyodbc.connect(self._get_connection_string())
-            cursor = self.connection.cursor()
-            query = """
-                SELECT IC.InventarioID, TC.Nombre AS NombreTipo, IC.TipoCombustibleID,
-                    IC.InventarioInicial, IC.Entrada, IC.Salida, IC.InventarioFinal,
-                    IC.Fecha, IC.EsAutomatico
-                FROM InventarioCombustible IC
-                JOIN TiposCombustible TC ON IC.TipoCombustibleID = TC.TipoCombustibleID
-                ORDER BY IC.Fecha DESC, IC.InventarioID DESC
-            """
-            cursor.execute(query)
-            registros = []
-            for row in cursor.fetchall():
-                registros.append({
-                    'InventarioID': row[0],
-                    'NombreTipo': row[1],
-                    'TipoCombustibleID': row[2],
-                    'InventarioInicial': row[3],
-                    'Entrada': row[4],
-                    'Salida': row[5],
-                    'InventarioFinal': row[6],
-                    'Fecha': row[7],
-                    'EsAutomatico': int(row[8]) if row[8] is not None else 0
-                })
-            return registros
+            with self._transaccion(cursor) as cursor:
+                query = """
+                    SELECT IC.InventarioID, TC.Nombre AS NombreTipo, IC.TipoCombustibleID,
+                        IC.InventarioInicial, IC.Entrada, IC.Salida, IC.InventarioFinal,
+                        IC.Fecha, IC.EsAutomatico
+                    FROM InventarioCombustible IC
+                    JOIN TiposCombustible TC ON IC.TipoCombustibleID = TC.TipoCombustibleID
+                    ORDER BY IC.Fecha DESC, IC.InventarioID DESC
+                """
+                cursor.execute(query)
+                registros = []
+                for row in cursor.fetchall():
+                    registros.append({
+                        'InventarioID': row[0],
+                        'NombreTipo': row[1],
+                        'TipoCombustibleID': row[2],
+                        'InventarioInicial': row[3],
+                        'Entrada': row[4],
+                        'Salida': row[5],
+                        'InventarioFinal': row[6],
+                        'Fecha': row[7],
+                        'EsAutomatico': int(row[8]) if row[8] is not None else 0
+                    })
+                return registros
         except Exception as e:
             print("Error al obtener registros de inventario:", e)
             return []
-        finally:
-            if self.connection:
-                self.connection.close()
 
-    def agregar_pipa(self, placa, capacidad, tipo_combustible_id, conductor_asignado, estado, ubicacion_actual, ultimo_mantenimiento, proximo_mantenimiento):
-        self.connection = pyodbc.connect(self._get_connection_string())
-        cursor = self.connection.cursor()
-        cursor.execute("""
-            INSERT INTO Pipas (Placa, Capacidad, TipoCombustibleID, ConductorAsignado, Estado, UbicacionActual, UltimoMantenimiento, ProximoMantenimiento)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """, (placa, capacidad, tipo_combustible_id, conductor_asignado, estado, ubicacion_actual, ultimo_mantenimiento, proximo_mantenimiento))
-        self.connection.commit()
-        cursor.close()
-        self.connection.close()
-
-    def obtener_tipos_combustible_con_id(self):
+    def agregar_pipa(self, placa, capacidad, tipo_combustible_id, conductor_asignado, estado, ubicacion_actual, ultimo_mantenimiento, proximo_mantenimiento, cursor=None):
+        with self._transaccion(cursor) as cursor:
+            cursor.execute("""
+                INSERT INTO Pipas (Placa, Capacidad, TipoCombustibleID, ConductorAsignado, Estado, UbicacionActual, UltimoMantenimiento, ProximoMantenimiento)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, (placa, capacidad, tipo_combustible_id, conductor_asignado, estado, ubicacion_actual, ultimo_mantenimiento, proximo_mantenimiento))
+
+    def obtener_tipos_combustible_con_id(self, cursor=None):
         try:
-            self.connection = pyodbc.connect(self._get_connection_string())
-            cursor = self.connection.cursor()
-            query = "SELECT TipoCombustibleID, Nombre FROM TiposCombustible"
-            cursor.execute(query)
-            tipos = [{'id': row[0], 'nombre': row[1]} for row in cursor.fetchall()]
-            return tipos
+            return [
+                {'id': fila[0], 'nombre': fila[1]}
+                for fila in self._catalogo('tipos_combustible', cursor).filas
+            ]
         except Exception as e:
             print("Error al obtener tipos de combustible:", e)
             return []
-        finally:
-            if self.connection:
-                self.connection.close()
 
-    def actualizar_pipa(self, id, placa, capacidad, tipo_combustible_id, conductor_asignado, estado, ubicacion_actual, ultimo_mantenimiento, proximo_mantenimiento):
-        self.connection = pyodbc.connect(self._get_connection_string())
-        cursor = self.connection.cursor()
-        cursor.execute("""
-            UPDATE Pipas
-            SET Placa = ?, Capacidad = ?, TipoCombustibleID = ?, ConductorAsignado = ?, Estado = ?, UbicacionActual = ?, UltimoMantenimiento = ?, ProximoMantenimiento = ?
-            WHERE PipaID = ?
-        """, (placa, capacidad, tipo_combustible_id, conductor_asignado, estado, ubicacion_actual, ultimo_mantenimiento, proximo_mantenimiento, id))
-        self.connection.commit()
-        cursor.close()
-        self.connection.close()
-
-    def eliminar_pipa(self, id):
-        self.connection = pyodbc.connect(self._get_connection_string())
-        cursor = self.connection.cursor()
-        cursor.execute("DELETE FROM pipas WHERE pipaid = ?", (id,))
-        self.connection.commit()
-        cursor.close()
-        self.connection.close()
-
-    def obtener_todas_las_pipas(self):
+    def actualizar_pipa(self, id, placa, capacidad, tipo_combustible_id, conductor_asignado, estado, ubicacion_actual, ultimo_mantenimiento, proximo_mantenimiento, cursor=None):
+        with self._transaccion(cursor) as cursor:
+            cursor.execute("""
+                UPDATE Pipas
+                SET Placa = ?, Capacidad = ?, TipoCombustibleID = ?, ConductorAsignado = ?, Estado = ?, UbicacionActual = ?, UltimoMantenimiento = ?, ProximoMantenimiento = ?
+                WHERE PipaID = ?
+            """, (placa, capacidad, tipo_combustible_id, conductor_asignado, estado, ubicacion_actual, ultimo_mantenimiento, proximo_mantenimiento, id))
+
+    def eliminar_pipa(self, id, cursor=None):
+        with self._transaccion(cursor) as cursor:
+            cursor.execute("DELETE FROM pipas WHERE pipaid = ?", (id,))
+
+    def obtener_todas_las_pipas(self, cursor=None):
         try:
-            self.connection = pyodbc.connect(self._get_connection_string())
-            cursor = self.connection.cursor()
-            query = """
-                SELECT P.PipaID, P.Placa, P.Capacidad, TC.Nombre AS TipoCombustible, P.ConductorAsignado, P.Estado, P.UbicacionActual, P.UltimoMantenimiento, P.ProximoMantenimiento
-                FROM Pipas P
-                LEFT JOIN TiposCombustible TC ON P.TipoCombustibleID = TC.TipoCombustibleID
-                ORDER BY P.PipaID
-            """
-            cursor.execute(query)
-            pipas = []
-            for row in cursor.fetchall():
-                pipas.append({
-                    'id': row[0],
-                    'placa': row[1],
-                    'capacidad': row[2],
-                    'tipo_combustible': row[3],  # Ahora es el nombre, no el ID
-                    'conductor_asignado': row[4],
-                    'estado': row[5],
-                    'ubicacion_actual': row[6],
-                    'ultimo_mantenimiento': row[7],
-                    'proximo_mantenimiento': row[8]
-                })
-            return pipas
+            with self._transaccion(cursor) as cursor:
+                query = """
+                    SELECT P.PipaID, P.Placa, P.Capacidad, TC.Nombre AS TipoCombustible, P.ConductorAsignado, P.Estado, P.UbicacionActual, P.UltimoMantenimiento, P.ProximoMantenimiento
+                    FROM Pipas P
+                    LEFT JOIN TiposCombustible TC ON P.TipoCombustibleID = TC.TipoCombustibleID
+                    ORDER BY P.PipaID
+                """
+                cursor.execute(query)
+                pipas = []
+                for row in cursor.fetchall():
+                    pipas.append({
+                        'id': row[0],
+                        'placa': row[1],
+                        'capacidad': row[2],
+                        'tipo_combustible': row[3],  # Ahora es el nombre, no el ID
+                        'conductor_asignado': row[4],
+                        'estado': row[5],
+                        'ubicacion_actual': row[6],
+                        'ultimo_mantenimiento': row[7],
+                        'proximo_mantenimiento': row[8]
+                    })
+                return pipas
         except Exception as e:
             print("Error al obtener pipas:", e)
             return []
-        finally:
-            if self.connection:
-                self.connection.close()
 
-    def obtener_registros_inventario_mes(self, mes, anio):
+    def obtener_registros_inventario_mes(self, mes, anio, cursor=None):
+        """
+        Registros del libro de inventario del mes, ya con el nombre del tipo de
+        combustible (una sola consulta con JOIN, sin búsquedas por registro).
+        """
         try:
-            self.connection = pyodbc.connect(self._get_connection_string())
-            cursor = self.connection.cursor()
-            query = """
-                SELECT * FROM InventarioCombustible
-                WHERE MONTH(Fecha) = ? AND YEAR(Fecha) = ?
-                ORDER BY Fecha DESC, InventarioID DESC
-            """
-            cursor.execute(query, (mes, anio))
-            registros = cursor.fetchall()
-            return registros
+            with self._transaccion(cursor) as cursor:
+                clausulas, params = filtro_periodo("IC.Fecha", anio, mes)
+                query = f"""
+                    SELECT {_COLUMNAS_INVENTARIO}
+                    FROM InventarioCombustible IC
+                    JOIN TiposCombustible TC ON IC.TipoCombustibleID = TC.TipoCombustibleID
+                    WHERE {" AND ".join(clausulas)}
+                    ORDER BY IC.Fecha DESC, IC.InventarioID DESC
+                """
+                cursor.execute(query, params)
+                return [_registro_inventario(row) for row in cursor.fetchall()]
         except Exception as e:
             print("Error al obtener registros de inventario del mes:", e)
             return []
-        finally:
-            if self.connection:
-                self.connection.close()
+
+    def obtener_registros_inventario_pagina(self, mes, anio, pagina=1, por_pagina=5, tipo_id=None, es_automatico=None, cursor=None):
+        """
+        Una página del libro de inventario del mes y el total de registros que
+        cumplen los filtros. Se puede filtrar por tipo de combustible y por
+        origen (es_automatico 1 = ventas, 0 = registros manuales).
+        Devuelve (registros, total).
+        """
+        try:
+            with self._transaccion(cursor) as cursor:
+                where_clauses, params = filtro_periodo("IC.Fecha", anio, mes)
+                if tipo_id:
+                    where_clauses.append("IC.TipoCombustibleID = ?")
+                    params.append(int(tipo_id))
+                if es_automatico is not None:
+                    where_clauses.append("IC.EsAutomatico = ?")
+                    params.append(int(es_automatico))
+                where_sql = " AND ".join(where_clauses)
+                query = f"""
+                    SELECT {_COLUMNAS_INVENTARIO}, COUNT(*) OVER () AS Total
+                    FROM InventarioCombustible IC
+                    JOIN TiposCombustible TC ON IC.TipoCombustibleID = TC.TipoCombustibleID
+                    WHERE {where_sql}
+                    ORDER BY IC.Fecha DESC, IC.InventarioID DESC
+                    OFFSET ? ROWS FETCH NEXT ? ROWS ONLY
+                """
+                cursor.execute(query, params + [(max(pagina, 1) - 1) * por_pagina, por_pagina])
+                rows = cursor.fetchall()
+                if rows:
+                    total = int(rows[0][9])
+                else:
+                    # Página fuera de rango: el total sale de un conteo aparte
+                    cursor.execute(f"SELECT COUNT(*) FROM InventarioCombustible IC WHERE {where_sql}", params)
+                    total = int(cursor.fetchone()[0])
+                return [_registro_inventario(row) for row in rows], total
+        except Exception as e:
+            print("Error al obtener página de registros de inventario:", e)
+            return [], 0
 
 
-    def agregar_producto(self, codigo, nombre, precio, cantidad):
+    def agregar_producto(self, codigo, nombre, precio, cantidad, cursor=None):
         try:
-            self.connection = pyodbc.connect(self._get_connection_string())
-            cursor = self.connection.cursor()
-            query = "INSERT INTO Productos (Codigo, Nombre, Precio, Cantidad) VALUES (?, ?, ?, ?)"
-            cursor.execute(query, (codigo, nombre, precio, cantidad))
-            self.connection.commit()
+            with self._transaccion(cursor) as cursor:
+                query = "INSERT INTO Productos (Codigo, Nombre, Precio, Cantidad) VALUES (?, ?, ?, ?)"
+                cursor.execute(query, (codigo, nombre, precio, cantidad))
+                self._invalidar_catalogos('productos', 'codigos_productos')
+                self._invalidar_reportes('inventario_productos')
         except Exception as e:
             print("Error al agregar producto:", e)
-        finally:
-            if self.connection:
-                self.connection.close()
 
-    def actualizar_producto(self, producto_id, codigo, nombre, precio, cantidad):
+    def actualizar_producto(self, producto_id, codigo, nombre, precio, cantidad, cursor=None):
         try:
-            self.connection = pyodbc.connect(self._get_connection_string())
-            cursor = self.connection.cursor()
-            query = "UPDATE Productos SET Codigo = ?, Nombre = ?, Precio = ?, Cantidad = ? WHERE ProductoID = ?"
-            cursor.execute(query, (codigo, nombre, precio, cantidad, producto_id))
-            self.connection.commit()
+            with self._transaccion(cursor) as cursor:
+                query = "UPDATE Productos SET Codigo = ?, Nombre = ?, Precio = ?, Cantidad = ? WHERE ProductoID = ?"
+                cursor.execute(query, (codigo, nombre, precio, cantidad, producto_id))
+                self._invalidar_catalogos('productos', 'codigos_productos')
+                self._invalidar_reportes('ventas_productos', 'inventario_productos')
+                self._invalidar_analitica('productos')
         except Exception as e:
             print("Error al actualizar producto:", e)
-        finally:
-            if self.connection:
-                self.connection.close()
-
-    def obtener_detalle_venta(self, venta_id):
-        self.connection = pyodbc.connect(self._get_connection_string())
-        cursor = self.connection.cursor()
-        query = """
-            SELECT p.Codigo, p.Nombre, dv.Precio, dv.Cantidad, dv.Subtotal
-            FROM DetalleVenta dv
-            JOIN Productos p ON dv.ProductoID = p.ProductoID
-            WHERE dv.VentaID = ?
-        """
-        cursor.execute(query, (venta_id,))
-        detalles = cursor.fetchall()
-        self.connection.close()
-        return detalles
-
-    def obtener_todos_los_clientes(self):
-        self.connection = pyodbc.connect(self._get_connection_string())
-        cursor = self.connection.cursor()
-        cursor.execute("SELECT ClienteID, Nombre FROM Clientes")
+
+    def obtener_detalle_venta(self, venta_id, cursor=None):
+        with self._transaccion(cursor) as cursor:
+            query = """
+                SELECT p.Codigo, p.Nombre, dv.Precio, dv.Cantidad, dv.Subtotal
+                FROM DetalleVenta dv
+                JOIN Productos p ON dv.ProductoID = p.ProductoID
+                WHERE dv.VentaID = ?
+            """
+            cursor.execute(query, (venta_id,))
+            detalles = cursor.fetchall()
+            return detalles
+
+    def obtener_todos_los_clientes(self, cursor=None):
         clientes = []
-        for row in cursor.fetchall():
+        for row in self._catalogo('clientes', cursor).filas:
             clientes.append(type('Cliente', (), {
                 'ClienteID': row[0],
                 'Nombre': row[1]
             })())
-        self.connection.close()
         return clientes
 
-    def obtener_todos_los_productos(self):
-        self.connection = pyodbc.connect(self._get_connection_string())
-        cursor = self.connection.cursor()
-        cursor.execute("SELECT ProductoID, Codigo, Nombre, Precio, Cantidad FROM Productos")
-        productos = []
-        for row in cursor.fetchall():
-            productos.append(type('Producto', (), {
-                'ProductoID': row[0],
-                'Codigo': row[1],
-                'Nombre': row[2],
-                'Precio': row[3],
-                'Cantidad': row[4]
-            })())
-        self.connection.close()
-        return productos
+    def obtener_todos_los_productos(self, cursor=None):
+        return [_producto(row) for row in self._catalogo('productos', cursor).filas]
+
+    def obtener_codigos_productos(self, cursor=None):
+        """Códigos de producto distintos y ordenados (para el desplegable), desde la caché."""
+        try:
+            return [fila[0] for fila in self._catalogo('codigos_productos', cursor).filas]
+        except Exception as e:
+            print("Error al obtener códigos de productos:", e)
+            return []
+
+    def buscar_productos(self, search='', codigo=None, sort_cantidad='', pagina=1, por_pagina=5, cursor=None):
+        """
+        Búsqueda paginada de productos hecha en la base: código exacto, texto
+        que es prefijo del código o aparece en el nombre, y orden por Cantidad
+        ('asc' o 'desc'). Devuelve (productos de la página, total).
+        """
+        try:
+            with self._transaccion(cursor) as cursor:
+                where_clauses = []
+                params = []
+                if codigo:
+                    where_clauses.append("Codigo = ?")
+                    params.append(codigo)
+                if search:
+                    patron = _patron_like(search)
+                    where_clauses.append("(Codigo LIKE ? ESCAPE '\\' OR Nombre LIKE ? ESCAPE '\\')")
+                    params.extend([patron + '%', '%' + patron + '%'])
+                where_sql = "WHERE " + " AND ".join(where_clauses) if where_clauses else ""
+                orden = {'asc': "Cantidad ASC, ProductoID", 'desc': "Cantidad DESC, ProductoID"}.get(sort_cantidad, "ProductoID")
+                query = f"""
+                    SELECT ProductoID, Codigo, Nombre, Precio, Cantidad, COUNT(*) OVER () AS Total
+                    FROM Productos
+                    {where_sql}
+                    ORDER BY {orden}
+                    OFFSET ? ROWS FETCH NEXT ? ROWS ONLY
+                """
+                cursor.execute(query, params + [(max(pagina, 1) - 1) * por_pagina, por_pagina])
+                rows = cursor.fetchall()
+                if rows:
+                    total = int(rows[0][5])
+                else:
+                    cursor.execute(f"SELECT COUNT(*) FROM Productos {where_sql}", params)
+                    total = int(cursor.fetchone()[0])
+                return [_producto(row) for row in rows], total
+        except Exception as e:
+            print("Error al buscar productos:", e)
+            return [], 0
         
-    def eliminar_producto(self, producto_id):
+    def eliminar_producto(self, producto_id, cursor=None):
         try:
-            self.connection = pyodbc.connect(self._get_connection_string())
-            cursor = self.connection.cursor()
-            # Verificar si el producto existe
-            cursor.execute("SELECT COUNT(*) FROM Productos WHERE ProductoID = ?", (producto_id,))
-            if cursor.fetchone()[0] == 0:
-                return False
+            with self._transaccion(cursor) as cursor:
+                # Verificar si el producto existe
+                cursor.execute("SELECT COUNT(*) FROM Productos WHERE ProductoID = ?", (producto_id,))
+                if cursor.fetchone()[0] == 0:
+                    return False
                 
-            # Eliminar el producto
-            cursor.execute("DELETE FROM Productos WHERE ProductoID = ?", (producto_id,))
-            self.connection.commit()
-            return True
+                # Eliminar el producto
+                cursor.execute("DELETE FROM Productos WHERE ProductoID = ?", (producto_id,))
+                self._invalidar_catalogos('productos', 'codigos_productos')
+                self._invalidar_reportes('ventas_productos', 'inventario_productos')
+                self._invalidar_analitica('productos')
+                return True
         except Exception as e:
             print(f"Error al eliminar producto: {str(e)}")
-            if hasattr(self, 'connection') and self.connection:
-                self.connection.rollback()
             return False
-        finally:
-            if hasattr(self, 'connection') and self.connection:
-                self.connection.close()
 
-    def agregar_venta(self, cliente_id, fecha, subtotal, iva, descuento, total, metodo_pago, observaciones):
-        self.connection = pyodbc.connect(self._get_connection_string())
-        cursor = self.connection.cursor()
-        cursor.execute("""
-            INSERT INTO Ventas (ClienteID, Fecha, Subtotal, IVA, Descuento, Total, MetodoPago, Observaciones)
-            OUTPUT INSERTED.VentaID
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """, (cliente_id, fecha, subtotal, iva, descuento, total, metodo_pago, observaciones))
-        result = cursor.fetchone()
-        venta_id = result[0] if result else None
-        self.connection.commit()
-        cursor.close()
-        self.connection.close()
-        if venta_id is None:
-            raise Exception("No se pudo obtener el ID de la venta recién insertada.")
-        return int(venta_id)
-
-    def agregar_detalle_venta(self, venta_id, producto_id, cantidad, precio, subtotal):
-        self.connection = pyodbc.connect(self._get_connection_string())
-        cursor = self.connection.cursor()
-        cursor.execute("""
-            INSERT INTO DetalleVenta (VentaID, ProductoID, Cantidad, Precio, Subtotal)
-            VALUES (?, ?, ?, ?, ?)
-        """, (venta_id, producto_id, cantidad, precio, subtotal))
-        self.connection.commit()
-        self.connection.close()
-
-    def rebajar_stock_producto(self, producto_id, cantidad):
-        self.connection = pyodbc.connect(self._get_connection_string())
-        cursor = self.connection.cursor()
-        cursor.execute("""
-            UPDATE Productos SET Cantidad = Cantidad - ? WHERE ProductoID = ?
-        """, (cantidad, producto_id))
-        self.connection.commit()
-        self.connection.close()
+    def agregar_venta(self, cliente_id, fecha, subtotal, iva, descuento, total, metodo_pago, observaciones, cursor=None):
+        with self._transaccion(cursor) as cursor:
+            cursor.execute("""
+                INSERT INTO Ventas (ClienteID, Fecha, Subtotal, IVA, Descuento, Total, MetodoPago, Observaciones)
+                OUTPUT INSERTED.VentaID
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, (cliente_id, fecha, subtotal, iva, descuento, total, metodo_pago, observaciones))
+            result = cursor.fetchone()
+            venta_id = result[0] if result else None
+            if venta_id is None:
+                raise Exception("No se pudo obtener el ID de la venta recién insertada.")
+            self._invalidar_kpis()
+            self._registrar_faceta('ventas_productos', fecha)
+            self._invalidar_reportes('ventas_productos', desde=fecha)
+            return int(venta_id)
 
-    def obtener_historial_ventas(self, mes=None, anio=None, page=1, per_page=10):
+    def registrar_venta_productos(self, cliente_id, fecha, subtotal, iva, descuento, total, metodo_pago, observaciones, detalles, cursor=None):
+        """
+        Registra una venta de productos completa en una sola transacción: el
+        encabezado, todas las líneas (un executemany) y el descuento de stock
+        (otro executemany). Cada detalle es un dict con producto_id, cantidad y
+        precio. Devuelve el VentaID, o None si algo falló y se revirtió todo.
+        """
         try:
-            self.connection = pyodbc.connect(self._get_connection_string())
-            cursor = self.connection.cursor()
-            params = []
-            where_clauses = []
-            if mes:
-                where_clauses.append("MONTH(v.Fecha) = ?")
-                params.append(mes)
-            if anio:
-                where_clauses.append("YEAR(v.Fecha) = ?")
-                params.append(anio)
-            where_sql = "WHERE " + " AND ".join(where_clauses) if where_clauses else ""
-            offset = (page - 1) * per_page
-            query = f"""
-                SELECT v.VentaID, c.Nombre, v.Fecha, v.Total, v.MetodoPago, v.Observaciones
-                FROM Ventas v
-                JOIN Clientes c ON v.ClienteID = c.ClienteID
-                {where_sql}
-                ORDER BY v.Fecha DESC
-                OFFSET ? ROWS FETCH NEXT ? ROWS ONLY
-            """
-            params.extend([offset, per_page])
-            cursor.execute(query, params)
-            ventas = []
-            for row in cursor.fetchall():
-                ventas.append({
-                    'id': row[0],
-                    'cliente': row[1],
-                    'fecha': row[2],
-                    'total': row[3],
-                    'metodo_pago': row[4],
-                    'observaciones': row[5]
-                })
-            return ventas
+            with self._transaccion(cursor) as cursor:
+                venta_id = self.agregar_venta(
+                    cliente_id, fecha, subtotal, iva, descuento, total, metodo_pago, observaciones, cursor=cursor
+                )
+                lineas = [
+                    (venta_id, d['producto_id'], d['cantidad'], d['precio'], d['precio'] * d['cantidad'])
+                    for d in detalles
+                ]
+                # Un mismo producto en varias líneas se rebaja una sola vez por la suma
+                rebajas = {}
+                for d in detalles:
+                    rebajas[d['producto_id']] = rebajas.get(d['producto_id'], 0) + d['cantidad']
+                if lineas:
+                    cursor.fast_executemany = True
+                    cursor.executemany("""
+                        INSERT INTO DetalleVenta (VentaID, ProductoID, Cantidad, Precio, Subtotal)
+                        VALUES (?, ?, ?, ?, ?)
+                    """, lineas)
+                    cursor.executemany("""
+                        UPDATE Productos SET Cantidad = Cantidad - ? WHERE ProductoID = ?
+                    """, [(cantidad, producto_id) for producto_id, cantidad in rebajas.items()])
+                    self._invalidar_catalogos('productos')
+                    resumen = {}
+                    for _, producto_id, cantidad, _, subtotal in lineas:
+                        c, m, n = resumen.get(producto_id, (0, 0.0, 0))
+                        resumen[producto_id] = (c + cantidad, m + subtotal, n + 1)
+                    self._acumular_resumen(cursor, 'productos', fecha, cliente_id, resumen)
+                return venta_id
+        except Exception as e:
+            print("Error al registrar venta de productos:", e)
+            return None
+
+    def agregar_detalle_venta(self, venta_id, producto_id, cantidad, precio, subtotal, cursor=None):
+        with self._transaccion(cursor) as cursor:
+            cursor.execute("""
+                INSERT INTO DetalleVenta (VentaID, ProductoID, Cantidad, Precio, Subtotal)
+                VALUES (?, ?, ?, ?, ?)
+            """, (venta_id, producto_id, cantidad, precio, subtotal))
+            cursor.execute("SELECT Fecha, ClienteID FROM Ventas WHERE VentaID = ?", (venta_id,))
+            fecha, cliente_id = cursor.fetchone()
+            self._acumular_resumen(cursor, 'productos', fecha, cliente_id,
+                                   {producto_id: (cantidad, subtotal, 1)})
+            self._invalidar_kpis()
+            self._invalidar_reportes('ventas_productos', desde=fecha)
+
+    def rebajar_stock_producto(self, producto_id, cantidad, cursor=None):
+        with self._transaccion(cursor) as cursor:
+            cursor.execute("""
+                UPDATE Productos SET Cantidad = Cantidad - ? WHERE ProductoID = ?
+            """, (cantidad, producto_id))
+            self._invalidar_catalogos('productos')
+
+    def obtener_historial_ventas(self, mes=None, anio=None, token=None, per_page=10, cursor=None):
+        """
+        Una página del historial de ventas de productos, paginada por cursor
+        sobre (Fecha, VentaID). `token` es el que devolvió la página anterior.
+        Devuelve (ventas, token_anterior, token_siguiente).
+        """
+        try:
+            with self._transaccion(cursor) as cursor:
+                where_clauses, params = filtro_periodo("v.Fecha", anio, mes)
+                clausulas, valores, orden = filtro_keyset(token, "v.Fecha", "v.VentaID")
+                where_clauses.extend(clausulas)
+                params.extend(valores)
+                where_sql = "WHERE " + " AND ".join(where_clauses) if where_clauses else ""
+                query = f"""
+                    SELECT TOP {int(per_page) + 1} v.VentaID, c.Nombre, v.Fecha, v.Total, v.MetodoPago, v.Observaciones
+                    FROM Ventas v
+                    JOIN Clientes c ON v.ClienteID = c.ClienteID
+                    {where_sql}
+                    ORDER BY v.Fecha {orden}, v.VentaID {orden}
+                """
+                cursor.execute(query, params)
+                filas, anterior, siguiente = armar_pagina(
+                    cursor.fetchall(), per_page, token, lambda row: (row[2], row[0])
+                )
+                ventas = []
+                for row in filas:
+                    ventas.append({
+                        'id': row[0],
+                        'cliente': row[1],
+                        'fecha': row[2],
+                        'total': row[3],
+                        'metodo_pago': row[4],
+                        'observaciones': row[5]
+                    })
+                return ventas, anterior, siguiente
         except Exception as e:
             print("Error al obtener historial de ventas:", e)
-            return []
-        finally:
-            if self.connection:
-                self.connection.close()
+            return [], None, None
 
-    def contar_historial_ventas(self, mes=None, anio=None):
+    def contar_historial_ventas(self, mes=None, anio=None, cursor=None):
         try:
-            self.connection = pyodbc.connect(self._get_connection_string())
-            cursor = self.connection.cursor()
-            params = []
-            where_clauses = []
-            if mes:
-                where_clauses.append("MONTH(Fecha) = ?")
-                params.append(mes)
-            if anio:
-                where_clauses.append("YEAR(Fecha) = ?")
-                params.append(anio)
-            where_sql = "WHERE " + " AND ".join(where_clauses) if where_clauses else ""
-            query = f"SELECT COUNT(*) FROM Ventas {where_sql}"
-            cursor.execute(query, params)
-            result = cursor.fetchone()
-            return int(result[0]) if result else 0
+            with self._transaccion(cursor) as cursor:
+                params = []
+                where_clauses = []
+                clausulas, valores = filtro_periodo("Fecha", anio, mes)
+                where_clauses.extend(clausulas)
+                params.extend(valores)
+                where_sql = "WHERE " + " AND ".join(where_clauses) if where_clauses else ""
+                query = f"SELECT COUNT(*) FROM Ventas {where_sql}"
+                cursor.execute(query, params)
+                result = cursor.fetchone()
+                return int(result[0]) if result else 0
         except Exception as e:
             print("Error al contar historial de ventas:", e)
             return 0
-        finally:
-            if self.connection:
-                self.connection.close()
 
-    def obtener_ventas_por_producto(self):
+    def obtener_kpis_dashboard(self, cursor=None):
+        """
+        Indicadores del tablero desde cache_kpis (pueden tener unos segundos;
+        ver KpisDashboard.edad). Con un cursor explícito se calculan directo de
+        la base, porque puede haber cambios aún sin confirmar.
+        """
+        if cursor is not None:
+            try:
+                return self._calcular_kpis_dashboard(cursor)
+            except Exception as e:
+                print("Error al obtener indicadores del tablero:", e)
+                return KpisDashboard(generado=datetime.datetime.now())
+
+        def calcular():
+            with self._transaccion() as cursor:
+                return self._calcular_kpis_dashboard(cursor)
         try:
-            self.connection = pyodbc.connect(self._get_connection_string())
-            cursor = self.connection.cursor()
-            query = """
-                SELECT P.Nombre, SUM(DV.Cantidad) as TotalVendido
-                FROM DetalleVenta DV
-                JOIN Productos P ON DV.ProductoID = P.ProductoID
-                JOIN Ventas V ON DV.VentaID = V.VentaID
-                WHERE V.Fecha >= DATEADD(day, -7, GETDATE())
-                GROUP BY P.Nombre
-            """
-            cursor.execute(query)
-            return cursor.fetchall()
+            return cache_kpis.obtener((self.backend.clave, 'kpis_dashboard'), calcular)
+        except Exception as e:
+            print("Error al obtener indicadores del tablero:", e)
+            return KpisDashboard(generado=datetime.datetime.now())
+
+    def _calcular_kpis_dashboard(self, cursor):
+        """
+        Todos los indicadores del tablero en una sola consulta: cada parte del
+        UNION ALL lleva en Seccion a qué indicador pertenece su fila.
+        """
+        hoy, params_hoy = filtro_hoy("Fecha")
+        hoy_v, params_hoy_v = filtro_hoy("V.Fecha")
+        query = f"""
+            SELECT 'ventas' AS Seccion, NULL AS Etiqueta, CAST(ISNULL(SUM(Total), 0) AS FLOAT) AS Valor
+            FROM Ventas WHERE {" AND ".join(hoy)}
+            UNION ALL
+            SELECT 'litros', NULL, CAST(ISNULL(SUM(Salida), 0) AS FLOAT)
+            FROM InventarioCombustible WHERE {" AND ".join(hoy)}
+            UNION ALL
+            SELECT 'productos', NULL, CAST(ISNULL(SUM(DV.Cantidad), 0) AS FLOAT)
+            FROM DetalleVenta DV JOIN Ventas V ON DV.VentaID = V.VentaID
+            WHERE {" AND ".join(hoy_v)}
+            UNION ALL
+            SELECT 'por_producto', P.Nombre, CAST(SUM(DV.Cantidad) AS FLOAT)
+            FROM DetalleVenta DV
+            JOIN Productos P ON DV.ProductoID = P.ProductoID
+            JOIN Ventas V ON DV.VentaID = V.VentaID
+            WHERE V.Fecha >= DATEADD(day, -7, GETDATE())
+            GROUP BY P.Nombre
+            UNION ALL
+            SELECT 'inventario', TC.Nombre, CAST(ISNULL(S.Saldo, 0) AS FLOAT)
+            FROM TiposCombustible TC
+            LEFT JOIN SaldosCombustible S ON TC.TipoCombustibleID = S.TipoCombustibleID
+        """
+        kpis = KpisDashboard(generado=datetime.datetime.now())
+        cursor.execute(query, params_hoy + params_hoy + params_hoy_v)
+        for seccion, etiqueta, valor in cursor.fetchall():
+            valor = float(valor or 0)
+            if seccion == 'ventas':
+                kpis.ventas_totales = valor
+            elif seccion == 'litros':
+                kpis.litros_distribuidos = valor
+            elif seccion == 'productos':
+                kpis.productos_vendidos = int(valor)
+            elif seccion == 'por_producto':
+                kpis.ventas_por_producto.append((etiqueta, int(valor)))
+            else:
+                kpis.inventario.append((etiqueta, valor))
+        return kpis
+
+    def obtener_ventas_por_producto(self, cursor=None):
+        try:
+            with self._transaccion(cursor) as cursor:
+                query = """
+                    SELECT P.Nombre, SUM(DV.Cantidad) as TotalVendido
+                    FROM DetalleVenta DV
+                    JOIN Productos P ON DV.ProductoID = P.ProductoID
+                    JOIN Ventas V ON DV.VentaID = V.VentaID
+                    WHERE V.Fecha >= DATEADD(day, -7, GETDATE())
+                    GROUP BY P.Nombre
+                """
+                cursor.execute(query)
+                return cursor.fetchall()
         except Exception as e:
             print("Error al obtener ventas por producto:", e)
             return []
-        finally:
-            if self.connection:
-                self.connection.close()
 
-    def obtener_productos_vendidos_hoy(self):
+    def obtener_productos_vendidos_hoy(self, cursor=None):
         try:
-            self.connection = pyodbc.connect(self._get_connection_string())
-            cursor = self.connection.cursor()
-            query = """
-                SELECT ISNULL(SUM(DV.Cantidad), 0)
-                FROM DetalleVenta DV
-                JOIN Ventas V ON DV.VentaID = V.VentaID
-                WHERE CAST(V.Fecha AS DATE) = CAST(GETDATE() AS DATE)
-            """
-            cursor.execute(query)
-            result = cursor.fetchone()
-            return int(result[0]) if result and result[0] else 0
+            with self._transaccion(cursor) as cursor:
+                clausulas, params = filtro_hoy("V.Fecha")
+                query = f"""
+                    SELECT ISNULL(SUM(DV.Cantidad), 0)
+                    FROM DetalleVenta DV
+                    JOIN Ventas V ON DV.VentaID = V.VentaID
+                    WHERE {" AND ".join(clausulas)}
+                """
+                cursor.execute(query, params)
+                result = cursor.fetchone()
+                return int(result[0]) if result and result[0] else 0
         except Exception as e:
             print("Error al obtener productos vendidos:", e)
             return 0
-        finally:
-            if self.connection:
-                self.connection.close()
 
     
 
-    def obtener_tipos_combustible_con_precio(self):
+    def obtener_tipos_combustible_con_precio(self, cursor=None):
         try:
-            self.connection = pyodbc.connect(self._get_connection_string())
-            cursor = self.connection.cursor()
-            query = "SELECT TipoCombustibleID, Nombre, Precio FROM TiposCombustible"
-            cursor.execute(query)
-            tipos = []
-            for row in cursor.fetchall():
-                tipos.append({
-                    'id': row[0],
-                    'nombre': row[1],
-                    'precio': row[2]
-                })
-            return tipos
+            return [
+                {'id': fila[0], 'nombre': fila[1], 'precio': fila[2]}
+                for fila in self._catalogo('tipos_combustible', cursor).filas
+            ]
         except Exception as e:
             print("Error al obtener tipos de combustible con precio:", e)
             return []
-        finally:
-            if self.connection:
-                self.connection.close()
 
-    def obtener_clientes_para_combustible(self):
-        self.connection = pyodbc.connect(self._get_connection_string())
-        cursor = self.connection.cursor()
-        cursor.execute("SELECT ClienteID, Nombre FROM Clientes")
-        clientes = []
-        for row in cursor.fetchall():
-            clientes.append({'id': row[0], 'nombre': row[1]})
-        self.connection.close()
-        return clientes
+    def obtener_clientes_para_combustible(self, cursor=None):
+        return [{'id': fila[0], 'nombre': fila[1]} for fila in self._catalogo('clientes', cursor).filas]
     
-    def obtener_historial_ventas_combustible(self, cliente_id=None, fecha=None, pagina=1, por_pagina=10):
-        self.connection = pyodbc.connect(self._get_connection_string())
-        cursor = self.connection.cursor()
-        filtros = []
-        params = []
-        if cliente_id:
-            filtros.append("VC.ClienteID = ?")
-            params.append(cliente_id)
-        if fecha:
-            filtros.append("CAST(VC.Fecha AS DATE) = ?")
-            params.append(fecha)
-        where = "WHERE " + " AND ".join(filtros) if filtros else ""
-        offset = (pagina - 1) * por_pagina
+    def obtener_historial_ventas_combustible(self, cliente_id=None, fecha=None, token=None, por_pagina=10, cursor=None):
+        """
+        Una página del historial de ventas de combustible, paginada por ticket
+        con cursor sobre (Fecha, VentaCombustibleID). Una sola consulta trae los
+        tickets de la página con sus líneas; la fecha ya viene como dd-mm-yyyy.
+        Devuelve (ventas, token_anterior, token_siguiente); cada venta trae sus
+        líneas en 'detalles'.
+        """
+        with self._transaccion(cursor) as cursor:
+            filtros = []
+            params = []
+            if cliente_id:
+                filtros.append("VC.ClienteID = ?")
+                params.append(cliente_id)
+            if fecha:
+                clausulas, valores = filtro_dia("VC.Fecha", fecha)
+                filtros.extend(clausulas)
+                params.extend(valores)
+            clausulas, valores, orden = filtro_keyset(token, "VC.Fecha", "VC.VentaCombustibleID")
+            filtros.extend(clausulas)
+            params.extend(valores)
+            where = "WHERE " + " AND ".join(filtros) if filtros else ""
+
+            query = f"""
+                WITH Pagina AS (
+                    SELECT TOP {int(por_pagina) + 1} VC.VentaCombustibleID, C.Nombre AS Cliente, VC.Fecha,
+                        VC.Total, VC.MetodoPago
+                    FROM VentaCombustible VC
+                    JOIN Clientes C ON VC.ClienteID = C.ClienteID
+                    {where}
+                    ORDER BY VC.Fecha {orden}, VC.VentaCombustibleID {orden}
+                )
+                SELECT P.VentaCombustibleID, P.Cliente, P.Fecha, CONVERT(VARCHAR(10), P.Fecha, 105) AS FechaTexto,
+                    P.Total, P.MetodoPago, TC.Nombre, DVC.CantidadLitros, DVC.PrecioUnitario, DVC.Subtotal
+                FROM Pagina P
+                LEFT JOIN DetalleVentaCombustible DVC ON DVC.VentaCombustibleID = P.VentaCombustibleID
+                LEFT JOIN TiposCombustible TC ON DVC.TipoCombustibleID = TC.TipoCombustibleID
+                ORDER BY P.Fecha {orden}, P.VentaCombustibleID {orden}, TC.Nombre
+            """
+            cursor.execute(query, params)
+            tickets = []
+            for row in cursor.fetchall():
+                if not tickets or tickets[-1]['venta_id'] != row[0]:
+                    tickets.append({
+                        'venta_id': row[0],
+                        'cliente': row[1],
+                        'fecha_valor': row[2],
+                        'fecha': row[3],
+                        'total': row[4],
+                        'metodo_pago': row[5],
+                        'detalles': []
+                    })
+                if row[6] is not None:
+                    tickets[-1]['detalles'].append({
+                        'tipo_combustible': row[6],
+                        'litros': row[7],
+                        'precio': row[8],
+                        'subtotal': row[9]
+                    })
+            historial, anterior, siguiente = armar_pagina(
+                tickets, por_pagina, token, lambda venta: (venta['fecha_valor'], venta['venta_id'])
+            )
+            for venta in historial:
+                venta.pop('fecha_valor', None)
+            return historial, anterior, siguiente
+
+    def contar_historial_ventas_combustible(self, cliente_id=None, fecha=None, cursor=None):
+        """
+        Total de tickets del historial de combustible con esos filtros. La
+        paginación por cursor no lo necesita, así que va en su propio COUNT y
+        se guarda en `conteos` por combinación de filtros; una venta solo
+        invalida las combinaciones que la cuentan.
+        """
+        def cargar(cursor=None):
+            with self._transaccion(cursor) as cursor:
+                filtros = []
+                params = []
+                if cliente_id:
+                    filtros.append("VC.ClienteID = ?")
+                    params.append(cliente_id)
+                if fecha:
+                    clausulas, valores = filtro_dia("VC.Fecha", fecha)
+                    filtros.extend(clausulas)
+                    params.extend(valores)
+                where = "WHERE " + " AND ".join(filtros) if filtros else ""
+                cursor.execute(f"""
+                    SELECT COUNT(*)
+                    FROM VentaCombustible VC
+                    JOIN Clientes C ON VC.ClienteID = C.ClienteID
+                    {where}
+                """, params)
+                return int(cursor.fetchone()[0])
 
-        query = f"""
-            SELECT VC.VentaCombustibleID, C.Nombre, VC.Fecha, TC.Nombre, DVC.CantidadLitros, DVC.PrecioUnitario, DVC.Subtotal, VC.Total, VC.MetodoPago
-            FROM VentaCombustible VC
-            JOIN Clientes C ON VC.ClienteID = C.ClienteID
-            JOIN DetalleVentaCombustible DVC ON VC.VentaCombustibleID = DVC.VentaCombustibleID
-            JOIN TiposCombustible TC ON DVC.TipoCombustibleID = TC.TipoCombustibleID
-            {where}
-            ORDER BY VC.Fecha DESC, VC.VentaCombustibleID DESC
-            OFFSET ? ROWS FETCH NEXT ? ROWS ONLY
-        """
-        params.extend([offset, por_pagina])
-        cursor.execute(query, params)
-        historial = []
-        for row in cursor.fetchall():
-            # Formatear la fecha SIEMPRE como dd-mm-yyyy
-            fecha_val = row[2]
-            if isinstance(fecha_val, (datetime.datetime, datetime.date)):
-                fecha_str = fecha_val.strftime('%d-%m-%Y')
-            else:
-                try:
-                    fecha_str = datetime.datetime.strptime(str(fecha_val), '%Y-%m-%d').strftime('%d-%m-%Y')
-                except Exception:
-                    fecha_str = str(fecha_val)
-            historial.append({
-                'venta_id': row[0],
-                'cliente': row[1],
-                'fecha': fecha_str,
-                'tipo_combustible': row[3],
-                'litros': row[4],
-                'precio': row[5],
-                'subtotal': row[6],
-                'total': row[7],
-                'metodo_pago': row[8]
-            })
-        # Corregido aquí el nombre de la tabla
-        count_query = f"SELECT COUNT(*) FROM VentaCombustible VC {where}"
-        cursor.execute(count_query, params[:-2])
-        total_registros = cursor.fetchone()[0]
-        total_paginas = (total_registros + por_pagina - 1) // por_pagina
-        self.connection.close()
-        return historial, total_paginas
-
-    def registrar_venta_combustible(self, cliente_id, fecha, metodo_pago, observaciones, detalles):
         try:
-            print("Detalles recibidos para venta:", detalles)  # Depuración: muestra los detalles recibidos
-            self.connection = pyodbc.connect(self._get_connection_string())
-            cursor = self.connection.cursor()
-            total = sum(float(d['subtotal']) for d in detalles)
-            cursor.execute("""
-                INSERT INTO VentaCombustible (ClienteID, Fecha, Total, MetodoPago, Observaciones)
-                OUTPUT INSERTED.VentaCombustibleID
-                VALUES (?, ?, ?, ?, ?)
-            """, cliente_id, fecha, total, metodo_pago, observaciones)
-            venta_id_row = cursor.fetchone()
-            if not venta_id_row or not venta_id_row[0]:
-                raise Exception("No se pudo obtener el ID de la venta insertada.")
-            venta_id = int(venta_id_row[0])
-            for d in detalles:
-                print("Procesando detalle:", d)  # Depuración: muestra cada detalle procesado
+            if cursor is not None:
+                return cargar(cursor)
+            return conteos.obtener(self._clave_conteo_combustible(cliente_id, fecha), cargar)
+        except Exception as e:
+            print("Error al contar historial de ventas de combustible:", e)
+            return 0
+
+    def _ultimos_inventarios_finales(self, cursor, tipos):
+        """
+        Último InventarioFinal de cada tipo de combustible, en una sola consulta.
+        Bloquea (UPDLOCK) las filas de saldo de esos tipos hasta el fin de la
+        transacción, así dos ventas simultáneas del mismo combustible no parten
+        del mismo saldo.
+        """
+        marcadores = ", ".join("?" * len(tipos))
+        cursor.execute(f"""
+            SELECT S.TipoCombustibleID,
+                (SELECT TOP 1 IC.InventarioFinal
+                 FROM InventarioCombustible IC
+                 WHERE IC.TipoCombustibleID = S.TipoCombustibleID
+                 ORDER BY IC.Fecha DESC, IC.InventarioID DESC) AS InventarioFinal
+            FROM SaldosCombustible S WITH (UPDLOCK, ROWLOCK)
+            WHERE S.TipoCombustibleID IN ({marcadores})
+        """, tipos)
+        ultimos = {row[0]: float(row[1]) if row[1] else 0.0 for row in cursor.fetchall()}
+        for tipo_id in tipos:
+            if tipo_id not in ultimos:
+                # Tipo sin fila de saldo todavía: se lee directo del libro
+                ultimos[tipo_id] = self.obtener_ultimo_inventario_final(tipo_id, cursor=cursor)
+        return ultimos
+
+    def registrar_venta_combustible(self, cliente_id, fecha, metodo_pago, observaciones, detalles, cursor=None):
+        """
+        Registra la venta, sus líneas y la salida de inventario en una transacción.
+        Las líneas se agrupan por tipo de combustible: un movimiento de
+        inventario por tipo, con el saldo anterior leído una sola vez.
+        """
+        try:
+            with self._transaccion(cursor) as cursor:
+                total = sum(float(d['subtotal']) for d in detalles)
                 cursor.execute("""
+                    INSERT INTO VentaCombustible (ClienteID, Fecha, Total, MetodoPago, Observaciones)
+                    OUTPUT INSERTED.VentaCombustibleID
+                    VALUES (?, ?, ?, ?, ?)
+                """, cliente_id, fecha, total, metodo_pago, observaciones)
+                venta_id_row = cursor.fetchone()
+                if not venta_id_row or not venta_id_row[0]:
+                    raise Exception("No se pudo obtener el ID de la venta insertada.")
+                venta_id = int(venta_id_row[0])
+                self._registrar_faceta('ventas_combustible', fecha)
+                self._invalidar_reportes('ventas_combustible', 'inventario_combustible', desde=fecha)
+                self._invalidar_conteo_combustible(cliente_id, fecha)
+                if not detalles:
+                    return True
+
+                litros_por_tipo = {}
+                for d in detalles:
+                    tipo_id = int(d['tipo_combustible_id'])
+                    litros_por_tipo[tipo_id] = litros_por_tipo.get(tipo_id, 0.0) + float(d['cantidad_litros'])
+                ultimos = self._ultimos_inventarios_finales(cursor, list(litros_por_tipo))
+
+                cursor.fast_executemany = True
+                cursor.executemany("""
                     INSERT INTO DetalleVentaCombustible
                     (VentaCombustibleID, TipoCombustibleID, PrecioUnitario, CantidadLitros, MontoQuetzales, Subtotal)
                     VALUES (?, ?, ?, ?, ?, ?)
-                """, venta_id, d['tipo_combustible_id'], d['precio_unitario'], d['cantidad_litros'], d['monto_quetzales'], d['subtotal'])
-
-                inventario_inicial = self.obtener_ultimo_inventario_final(d['tipo_combustible_id'], cursor=cursor)
-                entrada = 0.0
-                salida = float(d['cantidad_litros'])
-                inventario_final = inventario_inicial - salida
-                self.agregar_registro_inventario(
-                    d['tipo_combustible_id'],
-                    inventario_inicial,
-                    entrada,
-                    salida,
-                    inventario_final,
-                    fecha,
-                    es_automatico=1,
-                    cursor=cursor
-                )
-            self.connection.commit()
+                """, [
+                    (venta_id, int(d['tipo_combustible_id']), d['precio_unitario'], d['cantidad_litros'],
+                     d['monto_quetzales'], d['subtotal'])
+                    for d in detalles
+                ])
+                cursor.executemany("""
+                    INSERT INTO InventarioCombustible
+                    (TipoCombustibleID, InventarioInicial, Entrada, Salida, InventarioFinal, Fecha, EsAutomatico)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, [
+                    (tipo_id, ultimos[tipo_id], 0.0, litros, ultimos[tipo_id] - litros, fecha, 1)
+                    for tipo_id, litros in litros_por_tipo.items()
+                ])
+                for tipo_id, litros in litros_por_tipo.items():
+                    self._ajustar_saldo(cursor, tipo_id, -litros)
+                resumen = {}
+                for d in detalles:
+                    tipo_id = int(d['tipo_combustible_id'])
+                    litros, monto, lineas = resumen.get(tipo_id, (0.0, 0.0, 0))
+                    resumen[tipo_id] = (litros + float(d['cantidad_litros']), monto + float(d['subtotal']), lineas + 1)
+                self._acumular_resumen(cursor, 'combustible', fecha, cliente_id, resumen)
+                self._invalidar_kpis()
             return True
         except Exception as e:
             print("Error al registrar venta:", e)
-            if self.connection:
-                self.connection.rollback()
             return False
-        finally:
-            if self.connection:
-                self.connection.close()
-
-    def obtener_ventas_combustible_filtrado(self, cliente_id=None, dia=None, mes=None, anio=None):
-        self.connection = pyodbc.connect(self._get_connection_string())
-        cursor = self.connection.cursor()
-        query = """
-            SELECT 
-                MONTH(VC.Fecha) as mes,
-                DAY(VC.Fecha) as dia,
-                TC.Nombre as tipo,
-                SUM(DVC.CantidadLitros) as total
-            FROM VentaCombustible VC
-            JOIN DetalleVentaCombustible DVC ON VC.VentaCombustibleID = DVC.VentaCombustibleID
-            JOIN TiposCombustible TC ON DVC.TipoCombustibleID = TC.TipoCombustibleID
-            WHERE 1=1
-        """
-        params = []
-        if cliente_id:
-            query += " AND VC.ClienteID = ?"
-            params.append(cliente_id)
-        if anio:
-            query += " AND YEAR(VC.Fecha) = ?"
-            params.append(anio)
-        if mes:
-            query += " AND MONTH(VC.Fecha) = ?"
-            params.append(mes)
-        if dia:
-            query += " AND DAY(VC.Fecha) = ?"
-            params.append(dia)
-        query += " GROUP BY MONTH(VC.Fecha), DAY(VC.Fecha), TC.Nombre"
-        cursor.execute(query, params)
-        rows = cursor.fetchall()
-        self.connection.close()
-        return [
-            {'mes': row[0], 'dia': row[1], 'tipo': row[2], 'total': row[3]}
-            for row in rows
-        ]
+
+    def obtener_ventas_combustible_filtrado(self, cliente_id=None, dia=None, mes=None, anio=None, cursor=None):
+        if cursor is None:
+            try:
+                return self._analitica().ventas_combustible_por_dia(cliente_id, dia, mes, anio)
+            except Exception as e:
+                print("Error en el motor analítico, se consulta la base:", e)
+        with self._transaccion(cursor) as cursor:
+            query = """
+                SELECT 
+                    MONTH(R.Fecha) as mes,
+                    DAY(R.Fecha) as dia,
+                    TC.Nombre as tipo,
+                    SUM(R.Litros) as total
+                FROM ResumenDiarioCombustible R
+                JOIN TiposCombustible TC ON R.TipoCombustibleID = TC.TipoCombustibleID
+                WHERE 1=1
+            """
+            params = []
+            if cliente_id:
+                query += " AND R.ClienteID = ?"
+                params.append(cliente_id)
+            clausulas, valores = filtro_periodo("R.Fecha", anio, mes, dia)
+            for clausula in clausulas:
+                query += " AND " + clausula
+            params.extend(valores)
+            query += " GROUP BY MONTH(R.Fecha), DAY(R.Fecha), TC.Nombre"
+            cursor.execute(query, params)
+            rows = cursor.fetchall()
+            return [
+                {'mes': row[0], 'dia': row[1], 'tipo': row[2], 'total': row[3]}
+                for row in rows
+            ]
                 
-    def obtener_productos_mas_vendidos_filtrado(self, cliente_id=None, dia=None, mes=None, anio=None):
-        self.connection = pyodbc.connect(self._get_connection_string())
-        cursor = self.connection.cursor()
-        query = """
-            SELECT P.Nombre, SUM(DV.Cantidad) as cantidad
-            FROM Ventas V
-            JOIN DetalleVenta DV ON V.VentaID = DV.VentaID
-            JOIN Productos P ON DV.ProductoID = P.ProductoID
-            WHERE 1=1
-        """
-        params = []
-        if cliente_id:
-            query += " AND V.ClienteID = ?"
-            params.append(cliente_id)
-        if anio:
-            query += " AND YEAR(V.Fecha) = ?"
-            params.append(anio)
-        if mes:
-            query += " AND MONTH(V.Fecha) = ?"
-            params.append(mes)
-        if dia:
-            query += " AND DAY(V.Fecha) = ?"
-            params.append(dia)
-        query += " GROUP BY P.Nombre ORDER BY cantidad DESC"
-        cursor.execute(query, params)
-        rows = cursor.fetchall()
-        self.connection.close()
-        return [{'nombre': row[0], 'cantidad': row[1]} for row in rows]
-
-    def obtener_anios_ventas_combustible(self):
-        self.connection = pyodbc.connect(self._get_connection_string())
-        cursor = self.connection.cursor()
-        cursor.execute("SELECT DISTINCT YEAR(Fecha) FROM VentaCombustible ORDER BY YEAR(Fecha)")
-        anios = [str(row[0]) for row in cursor.fetchall()]
-        self.connection.close()
-        return anios
-
-    def obtener_meses_disponibles(self, anio=None):
-        self.connection = pyodbc.connect(self._get_connection_string())
-        cursor = self.connection.cursor()
-        if anio:
-            cursor.execute("SELECT DISTINCT MONTH(Fecha) as mes FROM VentaCombustible WHERE YEAR(Fecha)=? ORDER BY mes", (anio,))
-        else:
-            cursor.execute("SELECT DISTINCT MONTH(Fecha) as mes FROM VentaCombustible ORDER BY mes")
-        meses = [row[0] for row in cursor.fetchall()]
-        self.connection.close()
-        return meses
-    
-    def obtener_inventario_combustible(self, fecha_inicio, fecha_fin):
-        self.connection = pyodbc.connect(self._get_connection_string())
-        cursor = self.connection.cursor()
-        query = """
-            SELECT CONVERT(VARCHAR, Fecha, 23) AS Fecha, 
-                (SELECT Nombre FROM TiposCombustible WHERE TipoCombustibleID = IC.TipoCombustibleID) AS Combustible,
-                Entrada, Salida, InventarioFinal AS Saldo
-            FROM InventarioCombustible IC
-            WHERE Fecha BETWEEN ? AND ?
-            ORDER BY Fecha, Combustible
-        """
-        cursor.execute(query, (fecha_inicio, fecha_fin))
-        rows = cursor.fetchall()
-        self.connection.close()
-        return [
-            {'Fecha': row[0], 'Combustible': row[1], 'Entrada': row[2], 'Salida': row[3], 'Saldo': row[4]}
-            for row in rows
-        ]
-    
-    def obtener_ventas_combustible(self, fecha_inicio, fecha_fin):
-        self.connection = pyodbc.connect(self._get_connection_string())
-        cursor = self.connection.cursor()
-        query = """
-            SELECT CONVERT(VARCHAR, VC.Fecha, 23) AS Fecha,
-                C.Nombre AS Cliente,
-                TC.Nombre AS Combustible,
-                DVC.CantidadLitros AS Litros
-            FROM VentaCombustible VC
-            JOIN Clientes C ON VC.ClienteID = C.ClienteID
-            JOIN DetalleVentaCombustible DVC ON VC.VentaCombustibleID = DVC.VentaCombustibleID
-            JOIN TiposCombustible TC ON DVC.TipoCombustibleID = TC.TipoCombustibleID
-            WHERE VC.Fecha BETWEEN ? AND ?
-            ORDER BY VC.Fecha, C.Nombre
-        """
-        cursor.execute(query, (fecha_inicio, fecha_fin))
-        rows = cursor.fetchall()
-        self.connection.close()
-        return [
-            {'Fecha': row[0], 'Cliente': row[1], 'Combustible': row[2], 'Litros': row[3]}
-            for row in rows
-        ]
-    
-    def obtener_ventas_productos(self, fecha_inicio, fecha_fin):
-        self.connection = pyodbc.connect(self._get_connection_string())
-        cursor = self.connection.cursor()
-        query = """
-            SELECT CONVERT(VARCHAR, V.Fecha, 23) AS Fecha,
-                P.Nombre AS Producto,
-                DV.Cantidad,
-                DV.Subtotal AS Total
-            FROM Ventas V
-            JOIN DetalleVenta DV ON V.VentaID = DV.VentaID
-            JOIN Productos P ON DV.ProductoID = P.ProductoID
-            WHERE V.Fecha BETWEEN ? AND ?
-            ORDER BY V.Fecha, P.Nombre
-        """
-        cursor.execute(query, (fecha_inicio, fecha_fin))
-        rows = cursor.fetchall()
-        self.connection.close()
-        return [
-            {'Fecha': row[0], 'Producto': row[1], 'Cantidad': row[2], 'Total': row[3]}
-            for row in rows
-        ]
+    def obtener_productos_mas_vendidos_filtrado(self, cliente_id=None, dia=None, mes=None, anio=None, cursor=None):
+        if cursor is None:
+            try:
+                return self._analitica().productos_mas_vendidos_filtrado(cliente_id, dia, mes, anio)
+            except Exception as e:
+                print("Error en el motor analítico, se consulta la base:", e)
+        with self._transaccion(cursor) as cursor:
+            query = """
+                SELECT P.Nombre, SUM(R.Cantidad) as cantidad
+                FROM ResumenDiarioProductos R
+                JOIN Productos P ON R.ProductoID = P.ProductoID
+                WHERE 1=1
+            """
+            params = []
+            if cliente_id:
+                query += " AND R.ClienteID = ?"
+                params.append(cliente_id)
+            clausulas, valores = filtro_periodo("R.Fecha", anio, mes, dia)
+            for clausula in clausulas:
+                query += " AND " + clausula
+            params.extend(valores)
+            query += " GROUP BY P.Nombre ORDER BY cantidad DESC"
+            cursor.execute(query, params)
+            rows = cursor.fetchall()
+            return [{'nombre': row[0], 'cantidad': row[1]} for row in rows]
+
+    def obtener_anios_ventas_combustible(self, cursor=None):
+        return [str(anio) for anio in self.obtener_facetas('ventas_combustible', cursor=cursor).anios]
+
+    def obtener_meses_disponibles(self, anio=None, cursor=None):
+        return self.obtener_facetas('ventas_combustible', cursor=cursor).meses(anio)
     
-    def obtener_inventario_productos(self, fecha_inicio, fecha_fin):
-        self.connection = pyodbc.connect(self._get_connection_string())
-        cursor = self.connection.cursor()
-        query = """
-            SELECT 
-                P.Nombre AS Producto,
-                P.Cantidad AS Saldo
-            FROM Productos P
-            ORDER BY P.Nombre
-        """
-        cursor.execute(query)
-        rows = cursor.fetchall()
-        self.connection.close()
-        return [
-            {'Producto': row[0], 'Saldo': row[1]}
-            for row in rows
-        ]
+    def _consulta_reporte(self, reporte, fecha_inicio=None, fecha_fin=None):
+        """(query, params) del reporte descargable `reporte` (ver _CONSULTAS_REPORTE)."""
+        columna_fecha, query = _CONSULTAS_REPORTE[reporte]
+        if columna_fecha is None:
+            return query, []
+        clausulas, params = filtro_entre_fechas(columna_fecha, fecha_inicio, fecha_fin)
+        return query.format(filtro=" AND ".join(clausulas)), params
+
+    def _reporte(self, reporte, fecha_inicio, fecha_fin, cursor=None):
+        with self._transaccion(cursor) as cursor:
+            query, params = self._consulta_reporte(reporte, fecha_inicio, fecha_fin)
+            cursor.execute(query, params)
+            columnas = [col[0] for col in cursor.description]
+            return [dict(zip(columnas, row)) for row in cursor.fetchall()]
+
+    def iterar_reporte(self, reporte, fecha_inicio=None, fecha_fin=None, tamano_lote=1000):
+        """
+        Filas (tuplas) del reporte leídas por lotes con fetchmany, para
+        exportarlo sin tenerlo completo en memoria. Usa su propia conexión del
+        pool y no la de la petición: SQL Server sin MARS no admite otra
+        consulta en una conexión que todavía tiene filas por leer.
+        """
+        query, params = self._consulta_reporte(reporte, fecha_inicio, fecha_fin)
+        with self._conectar() as connection:
+            cursor = connection.cursor()
+            cursor.execute(query, params)
+            while True:
+                filas = cursor.fetchmany(tamano_lote)
+                if not filas:
+                    break
+                yield from filas
+
+    def _versiones_datos(self):
+        """
+        VersionesDatos completa como {(tabla, mes): version}, desde la caché de
+        catálogos: son unas pocas filas por tabla y mes con datos.
+        """
+        def cargar():
+            with self._conectar() as connection:
+                cursor = connection.cursor()
+                cursor.execute("SELECT Tabla, Mes, CAST(Version AS BIGINT) FROM VersionesDatos")
+                return {(tabla, mes): version for tabla, mes, version in cursor.fetchall()}
+
+        return catalogos.obtener((self.backend.clave, 'versiones_datos'), cargar)
+
+    def version_reporte(self, reporte, fecha_inicio, fecha_fin, cursor=None):
+        """
+        Versión de los datos del reporte en el rango, para cache_reportes: la
+        mayor Version de VersionesDatos en los meses del rango y en las tablas
+        sin mes de las que depende. Los disparadores la suben con cualquier
+        escritura, también las hechas fuera de la aplicación.
+
+        Un rango de meses cerrados se resuelve con la copia en caché de
+        VersionesDatos, sin ir a la base; las escrituras de la aplicación la
+        invalidan y las de otros procesos se ven al vencer CATALOGO_TTL. Un
+        rango que llega al mes en curso lee sus filas en su propia conexión
+        del pool (o en `cursor`), que devuelve enseguida.
+        """
+        tabla, globales = _VERSIONES_REPORTE[reporte]
+        desde = fecha_de(fecha_inicio).strftime('%Y-%m') if fecha_inicio else ''
+        hasta = fecha_de(fecha_fin).strftime('%Y-%m') if fecha_fin else '9999-12'
+        cerrado = tabla is not None and hasta < datetime.date.today().strftime('%Y-%m')
+        if cerrado and cursor is None:
+            version = max(
+                (v for (t, mes), v in self._versiones_datos().items()
+                 if (t == tabla and desde <= mes <= hasta) or (mes == '' and t in globales)),
+                default=0,
+            )
+            return f"{self.backend.clave}|{version}"
+        marcas = ", ".join("?" for _ in globales)
+        query = f"SELECT MAX(CAST(Version AS BIGINT)) FROM VersionesDatos WHERE (Mes = '' AND Tabla IN ({marcas}))"
+        params = list(globales)
+        if tabla is not None:
+            query += " OR (Tabla = ? AND Mes BETWEEN ? AND ?)"
+            params += [tabla, desde, hasta]
+        if cursor is not None:
+            cursor.execute(query, params)
+            fila = cursor.fetchone()
+        else:
+            with self._conectar() as connection:
+                cursor = connection.cursor()
+                cursor.execute(query, params)
+                fila = cursor.fetchone()
+        return f"{self.backend.clave}|{fila[0] or 0}"
+
+    def _totales_cierre(self, nombre, fecha_inicio, fecha_fin, cursor=None):
+        columna_fecha, query = _CONSULTAS_CIERRE[nombre]
+        clausulas, params = filtro_entre_fechas(columna_fecha, fecha_inicio, fecha_fin)
+        with self._transaccion(cursor) as cursor:
+            cursor.execute(query.format(filtro=" AND ".join(clausulas)), params * query.count('{filtro}'))
+            columnas = [col[0] for col in cursor.description]
+            return [dict(zip(columnas, row)) for row in cursor.fetchall()]
+
+    def obtener_totales_combustible(self, fecha_inicio, fecha_fin, cursor=None):
+        """Litros, monto y líneas vendidos por combustible en el rango (de los resúmenes diarios)."""
+        return self._totales_cierre('totales_combustible', fecha_inicio, fecha_fin, cursor)
+
+    def obtener_totales_metodo_pago(self, fecha_inicio, fecha_fin, cursor=None):
+        """Cantidad de ventas y total por origen (combustible / productos) y método de pago."""
+        return self._totales_cierre('totales_metodo_pago', fecha_inicio, fecha_fin, cursor)
+
+    def obtener_cierre_mes(self, fecha_inicio, fecha_fin):
+        """
+        Los cuatro reportes y los totales del rango para el libro de cierre de
+        mes, consultados a la vez: cada consulta corre en su hilo con su propia
+        conexión del pool. Los hilos no pasan de la mitad del pool, para dejar
+        conexiones a las peticiones y a los demás trabajos. Devuelve {nombre: [dicts]}.
+        """
+        consultas = {
+            'inventario_combustible': self.obtener_inventario_combustible,
+            'ventas_combustible': self.obtener_ventas_combustible,
+            'ventas_productos': self.obtener_ventas_productos,
+            'inventario_productos': self.obtener_inventario_productos,
+            'totales_combustible': self.obtener_totales_combustible,
+            'totales_metodo_pago': self.obtener_totales_metodo_pago,
+        }
+        hilos = min(len(consultas), max(1, self._pool().tamano_maximo // 2))
+        with ThreadPoolExecutor(max_workers=hilos, thread_name_prefix='cierre') as ejecutor:
+            futuros = {nombre: ejecutor.submit(consulta, fecha_inicio, fecha_fin)
+                       for nombre, consulta in consultas.items()}
+            return {nombre: futuro.result() for nombre, futuro in futuros.items()}
+
+    def obtener_inventario_combustible(self, fecha_inicio, fecha_fin, cursor=None):
+        return self._reporte('inventario_combustible', fecha_inicio, fecha_fin, cursor)
+
+    def obtener_ventas_combustible(self, fecha_inicio, fecha_fin, cursor=None):
+        return self._reporte('ventas_combustible', fecha_inicio, fecha_fin, cursor)
+
+    def obtener_ventas_productos(self, fecha_inicio, fecha_fin, cursor=None):
+        return self._reporte('ventas_productos', fecha_inicio, fecha_fin, cursor)
+
+    def obtener_inventario_productos(self, fecha_inicio, fecha_fin, cursor=None):
+        return self._reporte('inventario_productos', fecha_inicio, fecha_fin, cursor)
 
 def main():
     authenticator = DatabaseAuthenticator()
@@ -0,0 +1,244 @@
+"""
+Traducción de las construcciones de T-SQL que usa la aplicación al dialecto de SQLite.
+
+Las consultas de conexion.py se siguen escribiendo en T-SQL; el backend de SQLite
+las pasa por traducir_a_sqlite() antes de ejecutarlas. Se cubren TOP, ISNULL,
+GETDATE(), CAST(... AS DATE), CONVERT, YEAR/MONTH/DAY, DATEADD, OUTPUT INSERTED,
+OFFSET ... FETCH y las pistas de bloqueo WITH (UPDLOCK, ...).
+"""
+import re
+from functools import lru_cache
+
+_IDENTIFICADOR = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+_TOP = re.compile(r'\bSELECT\s+(DISTINCT\s+)?TOP\s*(?:\(\s*(\d+)\s*\)|(\d+))\s+', re.IGNORECASE)
+_OUTPUT = re.compile(r'\s*\bOUTPUT\s+(INSERTED\.\w+(?:\s*,\s*INSERTED\.\w+)*)', re.IGNORECASE)
+_OFFSET_FETCH = re.compile(
+    r'\bOFFSET\s+(\?|\d+)\s+ROWS?\s+FETCH\s+(?:NEXT|FIRST)\s+(\?|\d+)\s+ROWS?\s+ONLY\b',
+    re.IGNORECASE,
+)
+_OFFSET_SOLO = re.compile(r'\bOFFSET\s+(\?|\d+)\s+ROWS?\b', re.IGNORECASE)
+_PISTAS = re.compile(
+    r'\s+WITH\s*\(\s*(?:NOLOCK|UPDLOCK|HOLDLOCK|ROWLOCK|READPAST|XLOCK|SERIALIZABLE)'
+    r'(?:\s*,\s*(?:NOLOCK|UPDLOCK|HOLDLOCK|ROWLOCK|READPAST|XLOCK|SERIALIZABLE))*\s*\)',
+    re.IGNORECASE,
+)
+_CAST_AS = re.compile(r'^(.*)\s+AS\s+([A-Za-z]+)\s*(\(.*\))?\s*$', re.IGNORECASE | re.DOTALL)
+
+_FORMATOS_CONVERT = {
+    '23': "date({})",
+    '105': "strftime('%d-%m-%Y', {})",
+    '103': "strftime('%d/%m/%Y', {})",
+    '120': "strftime('%Y-%m-%d %H:%M:%S', {})",
+    '108': "strftime('%H:%M:%S', {})",
+}
+_UNIDADES_DATEADD = {
+    'day': 'days', 'dd': 'days', 'd': 'days',
+    'month': 'months', 'mm': 'months', 'm': 'months',
+    'year': 'years', 'yy': 'years', 'yyyy': 'years',
+    'hour': 'hours', 'hh': 'hours',
+    'minute': 'minutes', 'mi': 'minutes', 'n': 'minutes',
+}
+_AHORA = "datetime('now', 'localtime')"
+
+
+def _cast(args):
+    m = _CAST_AS.match(args[0])
+    if not m:
+        return None
+    expr, tipo = m.group(1).strip(), m.group(2).upper()
+    if tipo == 'DATE':
+        return f"date({expr})"
+    if tipo in ('DATETIME', 'DATETIME2', 'SMALLDATETIME'):
+        return f"datetime({expr})"
+    if tipo in ('VARCHAR', 'NVARCHAR', 'CHAR', 'NCHAR'):
+        return f"CAST({expr} AS TEXT)"
+    if tipo in ('DECIMAL', 'NUMERIC', 'MONEY', 'FLOAT'):
+        return f"CAST({expr} AS REAL)"
+    if tipo in ('INT', 'BIGINT', 'SMALLINT', 'TINYINT', 'BIT'):
+        return f"CAST({expr} AS INTEGER)"
+    return None
+
+
+def _convert(args):
+    if len(args) < 2:
+        return None
+    expr = args[1]
+    if len(args) >= 3:
+        formato = _FORMATOS_CONVERT.get(args[2].strip())
+        if formato:
+            return formato.format(expr)
+    return _cast([f"{expr} AS {args[0]}"])
+
+
+def _dateadd(args):
+    if len(args) != 3:
+        return None
+    unidad = _UNIDADES_DATEADD.get(args[0].strip().lower())
+    if not unidad:
+        return None
+    return f"datetime({args[2]}, ({args[1]}) || ' {unidad}')"
+
+
+def _datediff(args):
+    if len(args) != 3 or args[0].strip().lower() not in ('day', 'dd', 'd'):
+        return None
+    return f"CAST(julianday({args[2]}) - julianday({args[1]}) AS INTEGER)"
+
+
+_FUNCIONES = {
+    'ISNULL': lambda a: f"IFNULL({', '.join(a)})",
+    'GETDATE': lambda a: _AHORA,
+    'SYSDATETIME': lambda a: _AHORA,
+    'LEN': lambda a: f"LENGTH({', '.join(a)})",
+    'YEAR': lambda a: f"CAST(strftime('%Y', {a[0]}) AS INTEGER)",
+    'MONTH': lambda a: f"CAST(strftime('%m', {a[0]}) AS INTEGER)",
+    'DAY': lambda a: f"CAST(strftime('%d', {a[0]}) AS INTEGER)",
+    'CAST': _cast,
+    'CONVERT': _convert,
+    'DATEADD': _dateadd,
+    'DATEDIFF': _datediff,
+}
+
+
+def _fin_literal(sql, i):
+    """Índice justo después del literal de texto que empieza en i."""
+    n = len(sql)
+    i += 1
+    while i < n:
+        if sql[i] == "'":
+            if i + 1 < n and sql[i + 1] == "'":
+                i += 2
+                continue
+            return i + 1
+        i += 1
+    return n
+
+
+def _cierre(sql, abre):
+    """Índice del paréntesis que cierra el que está en `abre`."""
+    nivel = 0
+    i = abre
+    while i < len(sql):
+        c = sql[i]
+        if c == "'":
+            i = _fin_literal(sql, i)
+            continue
+        if c == '(':
+            nivel += 1
+        elif c == ')':
+            nivel -= 1
+            if nivel == 0:
+                return i
+        i += 1
+    raise ValueError("Paréntesis sin cerrar en la consulta")
+
+
+def _separar_argumentos(texto):
+    args, nivel, inicio, i = [], 0, 0, 0
+    while i < len(texto):
+        c = texto[i]
+        if c == "'":
+            i = _fin_literal(texto, i)
+            continue
+        if c == '(':
+            nivel += 1
+        elif c == ')':
+            nivel -= 1
+        elif c == ',' and nivel == 0:
+            args.append(texto[inicio:i].strip())
+            inicio = i + 1
+        i += 1
+    resto = texto[inicio:].strip()
+    if resto or args:
+        args.append(resto)
+    return args
+
+
+def _reescribir_funciones(sql):
+    partes = []
+    i = 0
+    n = len(sql)
+    while i < n:
+        c = sql[i]
+        if c == "'":
+            fin = _fin_literal(sql, i)
+            partes.append(sql[i:fin])
+            i = fin
+            continue
+        m = _IDENTIFICADOR.match(sql, i)
+        if m and (i == 0 or not (sql[i - 1].isalnum() or sql[i - 1] in '_.')):
+            nombre = m.group(0)
+            j = m.end()
+            while j < n and sql[j] == ' ':
+                j += 1
+            regla = _FUNCIONES.get(nombre.upper())
+            if regla and j < n and sql[j] == '(':
+                cierre = _cierre(sql, j)
+                args = [_reescribir_funciones(a) for a in _separar_argumentos(sql[j + 1:cierre])]
+                reemplazo = regla(args)
+                if reemplazo is None:
+                    reemplazo = f"{nombre}({', '.join(args)})"
+                partes.append(reemplazo)
+                i = cierre + 1
+                continue
+            partes.append(nombre)
+            i = m.end()
+            continue
+        partes.append(c)
+        i += 1
+    return ''.join(partes)
+
+
+def _fin_de_nivel(sql, pos):
+    """Posición donde termina la consulta (o subconsulta) que contiene `pos`."""
+    nivel, i = 0, pos
+    while i < len(sql):
+        c = sql[i]
+        if c == "'":
+            i = _fin_literal(sql, i)
+            continue
+        if c == '(':
+            nivel += 1
+        elif c == ')':
+            if nivel == 0:
+                return i
+            nivel -= 1
+        elif c == ';' and nivel == 0:
+            return i
+        i += 1
+    return len(sql.rstrip())
+
+
+def _reescribir_top(sql):
+    while True:
+        m = _TOP.search(sql)
+        if not m:
+            return sql
+        n = m.group(2) or m.group(3)
+        distinct = m.group(1) or ''
+        fin = _fin_de_nivel(sql, m.end())
+        cuerpo = sql[:fin].rstrip()
+        sql = (cuerpo[:m.start()] + f"SELECT {distinct}" + cuerpo[m.end():]
+               + f" LIMIT {n}" + sql[fin:])
+
+
+def _reescribir_output(sql):
+    m = _OUTPUT.search(sql)
+    if not m:
+        return sql
+    columnas = ', '.join(c.strip().split('.', 1)[1] for c in m.group(1).split(','))
+    sql = sql[:m.start()] + sql[m.end():]
+    fin = _fin_de_nivel(sql, 0)
+    return sql[:fin].rstrip() + f" RETURNING {columnas}" + sql[fin:]
+
+
+@lru_cache(maxsize=1024)
+def traducir_a_sqlite(sql):
+    """Devuelve la consulta T-SQL reescrita para SQLite (resultado cacheado por texto)."""
+    sql = _PISTAS.sub('', sql)
+    sql = _OFFSET_FETCH.sub(r'LIMIT \1, \2', sql)
+    sql = _OFFSET_SOLO.sub(r'LIMIT -1 OFFSET \1', sql)
+    sql = _reescribir_output(sql)
+    sql = _reescribir_funciones(sql)
+    sql = _reescribir_top(sql)
+    return sql
@@ -0,0 +1,313 @@
+"""
+Exportación de reportes con memoria acotada.
+
+Las filas llegan de DatabaseAuthenticator.iterar_reporte() por lotes
+(fetchmany) y se escriben una por una con xlsxwriter en modo constant_memory,
+que vuelca cada fila al disco en cuanto se completa. El archivo resultante
+queda en un SpooledTemporaryFile (en memoria mientras es chico, en disco
+después) y se envía por bloques con transmitir(), sin Content-Length, es decir
+con transferencia fragmentada. Así la memoria usada no crece con la cantidad
+de filas del reporte.
+
+Para integraciones (contabilidad) hay además CSV, CSV comprimido con gzip y
+un formato por columnas (.npz de NumPy). CSV y CSV.gz se generan lote por lote
+directamente mientras se envían, sin archivo intermedio; el .npz acumula cada
+columna en su propio archivo temporal y al final las une en el zip.
+
+escribir_reporte() reúne todos los formatos en una sola llamada sobre un
+archivo de destino, y archivo_reporte() la pasa por la caché en disco
+(cache_reportes); la usan la descarga directa y la cola de trabajos
+(trabajos_reportes). escribir_cierre() arma el libro de cierre de mes con los
+cuatro reportes y sus totales en hojas de un mismo archivo; se pide a
+archivo_reporte() como el reporte CIERRE_MES, así también pasa por la cola.
+"""
+import csv
+import io
+import itertools
+import os
+import shutil
+import tempfile
+import zipfile
+import zlib
+
+import numpy as np
+import xlsxwriter
+from xlsxwriter.utility import xl_range
+
+import pdf_tablas
+from cache_reportes import cache_reportes
+
+# Reporte -> (nombre base del archivo, encabezados en el orden de las columnas de la consulta)
+REPORTES = {
+    'inventario_combustible': ("Inventario_Combustible", ['Fecha', 'Combustible', 'Entrada', 'Salida', 'Saldo']),
+    'ventas_combustible': ("Ventas_Combustible", ['Fecha', 'Cliente', 'Combustible', 'Litros']),
+    'ventas_productos': ("Ventas_Productos", ['Fecha', 'Producto', 'Cantidad', 'Total']),
+    'inventario_productos': ("Inventario_Productos", ['Producto', 'Saldo']),
+}
+
+TIPO_EXCEL = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+TIPO_PDF = 'application/pdf'
+
+# Formatos de volcado masivo -> (extensión, tipo MIME)
+FORMATOS_MASIVOS = {
+    'csv': ('csv', 'text/csv'),  # Werkzeug agrega "; charset=utf-8" a los text/*
+    'csv.gz': ('csv.gz', 'application/gzip'),
+    'npz': ('npz', 'application/octet-stream'),
+}
+
+# Libro de cierre de mes (solo 'excel'), que la cola de trabajos genera como un reporte más
+CIERRE_MES = 'cierre_mes'
+
+# Todos los formatos descargables -> (extensión, tipo MIME)
+FORMATOS = {
+    'excel': ('xlsx', TIPO_EXCEL),
+    'pdf': ('pdf', TIPO_PDF),
+    **FORMATOS_MASIVOS,
+}
+
+# Columnas de texto que en el .npz se guardan como códigos enteros más su lista
+# de categorías, y columnas de fecha (datetime64[D]); el resto son números (float64)
+COLUMNAS_CATEGORIA = {'Cliente', 'Combustible', 'Producto'}
+COLUMNAS_FECHA = {'Fecha'}
+
+MAXIMO_EN_MEMORIA = int(os.getenv('EXPORTACION_MAXIMO_EN_MEMORIA', str(8 * 1024 * 1024)))
+TAMANO_BLOQUE = 64 * 1024
+
+
+def archivo_temporal():
+    """Archivo en memoria hasta MAXIMO_EN_MEMORIA bytes; pasado eso, en disco."""
+    return tempfile.SpooledTemporaryFile(max_size=MAXIMO_EN_MEMORIA)
+
+
+def nombre_archivo(reporte, formato, fecha_inicio, fecha_fin):
+    if reporte == CIERRE_MES:
+        return f"Cierre_{str(fecha_inicio)[:7]}.{FORMATOS[formato][0]}"
+    return f"{REPORTES[reporte][0]}_{fecha_inicio}_a_{fecha_fin}.{FORMATOS[formato][0]}"
+
+
+def escribir_reporte(reporte, formato, filas, destino, fecha_inicio=None, fecha_fin=None):
+    """
+    Escribe las `filas` del reporte en `destino` (archivo abierto en modo
+    binario) con el formato pedido, uno de FORMATOS.
+    """
+    columnas = REPORTES[reporte][1]
+    if formato == 'excel':
+        escribir_excel(filas, columnas, destino)
+    elif formato == 'npz':
+        escribir_npz(filas, columnas, destino)
+    elif formato == 'pdf':
+        escribir_pdf(filas, columnas, destino, REPORTES[reporte][0].replace('_', ' '),
+                     f"Rango: {fecha_inicio} a {fecha_fin}")
+    elif formato in ('csv', 'csv.gz'):
+        bloques = bloques_csv(filas, columnas)
+        if formato == 'csv.gz':
+            bloques = comprimir_gzip(bloques)
+        for bloque in bloques:
+            destino.write(bloque)
+    else:
+        raise ValueError(f"Formato no soportado: {formato}")
+
+
+def archivo_reporte(db, reporte, formato, fecha_inicio, fecha_fin, envolver=None):
+    """
+    Archivo abierto (binario) con el reporte, tomado de cache_reportes si la
+    versión de los datos del rango no cambió o generado y guardado si no.
+    `db` es un DatabaseAuthenticator; `envolver(filas)`, si se indica, envuelve
+    las filas que se escriben (la cola de trabajos cuenta ahí el progreso).
+    El libro de cierre (CIERRE_MES) no pasa por la caché.
+    """
+    if reporte == CIERRE_MES:
+        return archivo_cierre(db, fecha_inicio, fecha_fin, envolver)
+
+    def escribir(destino):
+        filas = db.iterar_reporte(reporte, fecha_inicio, fecha_fin)
+        if envolver is not None:
+            filas = envolver(filas)
+        escribir_reporte(reporte, formato, filas, destino, fecha_inicio, fecha_fin)
+
+    version = db.version_reporte(reporte, fecha_inicio, fecha_fin)
+    return cache_reportes.abrir(reporte, FORMATOS[formato][0], fecha_inicio, fecha_fin, version, escribir)
+
+
+def escribir_excel(filas, columnas, destino, hoja='Reporte'):
+    """
+    Escribe `filas` (iterable de tuplas) en una hoja con encabezado en negrita
+    y autofiltro. `destino` es una ruta o un archivo abierto en modo binario.
+    Devuelve la cantidad de filas escritas.
+    """
+    libro = xlsxwriter.Workbook(destino, {'constant_memory': True, 'tmpdir': tempfile.gettempdir()})
+    try:
+        return escribir_hoja(libro, hoja, filas, columnas)
+    finally:
+        libro.close()
+
+
+def escribir_hoja(libro, hoja, filas, columnas, totales=()):
+    """
+    Agrega a `libro` una hoja con los encabezados y las filas. En modo
+    constant_memory las filas deben escribirse en orden, así que cada hoja se
+    termina antes de empezar la siguiente. Con `totales` (índices de columna)
+    agrega al final una fila "Total" con SUBTOTAL de esas columnas, que respeta
+    el autofiltro. Devuelve la cantidad de filas.
+    """
+    hoja = libro.add_worksheet(hoja)
+    encabezado = libro.add_format({'bold': True, 'bg_color': '#DDEEFF'})
+    hoja.write_row(0, 0, columnas, encabezado)
+    sumas = dict.fromkeys(totales, 0)
+    n = 0
+    for n, fila in enumerate(filas, start=1):
+        hoja.write_row(n, 0, fila)
+        for i in sumas:
+            sumas[i] += fila[i] or 0
+    hoja.autofilter(0, 0, max(n, 1), len(columnas) - 1)
+    if sumas:
+        negrita = libro.add_format({'bold': True, 'top': 1})
+        hoja.write(n + 1, 0, 'Total', negrita)
+        for i, suma in sumas.items():
+            rango = xl_range(1, i, max(n, 1), i)
+            hoja.write_formula(n + 1, i, f'=SUBTOTAL(9,{rango})', negrita, float(suma))
+    return n
+
+
+# Hojas del libro de cierre de mes, en orden: clave en los datos de
+# DatabaseAuthenticator.obtener_cierre_mes -> (hoja, encabezados, columnas con total)
+HOJAS_CIERRE = [
+    ('totales_combustible', 'Totales por combustible', ['Combustible', 'Litros', 'Monto', 'Líneas'], (1, 2, 3)),
+    ('totales_metodo_pago', 'Totales por método de pago', ['Origen', 'Método de pago', 'Ventas', 'Total'], (2, 3)),
+] + [
+    (reporte, nombre.replace('_', ' '), columnas, ())
+    for reporte, (nombre, columnas) in REPORTES.items()
+]
+
+
+def escribir_cierre(datos, destino, envolver=None):
+    """
+    Libro de cierre de mes: las hojas de totales y una hoja por reporte, en un
+    solo xlsxwriter. `datos` es {clave: [dicts]} con las columnas en el orden de
+    los encabezados (el de las consultas); `envolver` como en archivo_reporte().
+    """
+    libro = xlsxwriter.Workbook(destino, {'constant_memory': True, 'tmpdir': tempfile.gettempdir()})
+    try:
+        for clave, hoja, columnas, totales in HOJAS_CIERRE:
+            filas = (tuple(fila.values()) for fila in datos[clave])
+            if envolver is not None:
+                filas = envolver(filas)
+            escribir_hoja(libro, hoja, filas, columnas, totales)
+    finally:
+        libro.close()
+
+
+def archivo_cierre(db, fecha_inicio, fecha_fin, envolver=None):
+    """Archivo temporal (abierto, al principio) con el libro de cierre del rango."""
+    datos = db.obtener_cierre_mes(fecha_inicio, fecha_fin)
+    archivo = archivo_temporal()
+    try:
+        escribir_cierre(datos, archivo, envolver)
+    except Exception:
+        archivo.close()
+        raise
+    archivo.seek(0)
+    return archivo
+
+
+def _lotes(filas, tamano):
+    filas = iter(filas)
+    while True:
+        lote = list(itertools.islice(filas, tamano))
+        if not lote:
+            return
+        yield lote
+
+
+def bloques_csv(filas, columnas, tamano_lote=1000):
+    """Genera el CSV (UTF-8, encabezado incluido) en bloques de bytes, un lote de filas por bloque."""
+    texto = io.StringIO()
+    escritor = csv.writer(texto, lineterminator='\n')
+    escritor.writerow(columnas)
+    for lote in _lotes(filas, tamano_lote):
+        escritor.writerows(lote)
+        yield texto.getvalue().encode('utf-8')
+        texto.seek(0)
+        texto.truncate()
+    if texto.tell():
+        yield texto.getvalue().encode('utf-8')
+
+
+def comprimir_gzip(bloques, nivel=6):
+    """Comprime al vuelo una secuencia de bloques de bytes en formato gzip."""
+    compresor = zlib.compressobj(nivel, zlib.DEFLATED, 31)  # 31: cabecera y cola gzip
+    for bloque in bloques:
+        comprimido = compresor.compress(bloque)
+        if comprimido:
+            yield comprimido
+    yield compresor.flush()
+
+
+def _escribir_npy(zip_salida, nombre, dtype, cantidad, datos):
+    """Entrada `nombre`.npy del zip con la cabecera de NumPy y los bytes crudos de `datos`."""
+    with zip_salida.open(f'{nombre}.npy', 'w', force_zip64=True) as entrada:
+        np.lib.format.write_array_header_1_0(entrada, {
+            'descr': np.lib.format.dtype_to_descr(dtype),
+            'fortran_order': False,
+            'shape': (cantidad,),
+        })
+        shutil.copyfileobj(datos, entrada)
+
+
+def escribir_npz(filas, columnas, destino, tamano_lote=1000):
+    """
+    Escribe `filas` por columnas en un .npz comprimido (legible con np.load).
+    Las fechas quedan como datetime64[D], los textos de COLUMNAS_CATEGORIA
+    como códigos int32 más '<columna>_categorias', y el resto como float64.
+    Cada lote se convierte a arreglos y se vuelca al archivo temporal de su
+    columna, así la memoria no depende de la cantidad de filas.
+    Devuelve la cantidad de filas escritas.
+    """
+    tipos = [np.dtype('datetime64[D]') if c in COLUMNAS_FECHA
+             else np.dtype(np.int32) if c in COLUMNAS_CATEGORIA
+             else np.dtype(np.float64) for c in columnas]
+    categorias = {c: {} for c in columnas if c in COLUMNAS_CATEGORIA}
+    temporales = [tempfile.TemporaryFile() for _ in columnas]
+    try:
+        cantidad = 0
+        for lote in _lotes(filas, tamano_lote):
+            cantidad += len(lote)
+            for i, (columna, tipo) in enumerate(zip(columnas, tipos)):
+                valores = [fila[i] for fila in lote]
+                if columna in categorias:
+                    codigos = categorias[columna]
+                    arreglo = np.array([codigos.setdefault(v, len(codigos)) for v in valores], dtype=tipo)
+                elif columna in COLUMNAS_FECHA:
+                    arreglo = np.array([str(v)[:10] if v else 'NaT' for v in valores], dtype=tipo)
+                else:
+                    arreglo = np.array([float(v) if v is not None else np.nan for v in valores], dtype=tipo)
+                temporales[i].write(arreglo.tobytes())
+        with zipfile.ZipFile(destino, 'w', compression=zipfile.ZIP_DEFLATED) as zip_salida:
+            for columna, tipo, datos in zip(columnas, tipos, temporales):
+                datos.seek(0)
+                _escribir_npy(zip_salida, columna, tipo, cantidad, datos)
+            for columna, codigos in categorias.items():
+                with zip_salida.open(f'{columna}_categorias.npy', 'w', force_zip64=True) as entrada:
+                    np.lib.format.write_array(entrada, np.array([str(v) for v in codigos], dtype=str))
+        return cantidad
+    finally:
+        for datos in temporales:
+            datos.close()
+
+
+def escribir_pdf(filas, columnas, destino, titulo, subtitulo=''):
+    """Tabla en A4 horizontal con título y encabezados en cada página (ver pdf_tablas)."""
+    pdf_tablas.escribir_tabla(filas, columnas, destino, titulo, subtitulo)
+
+
+def transmitir(archivo, tamano_bloque=TAMANO_BLOQUE):
+    """Generador que entrega `archivo` desde el principio por bloques y lo cierra al final."""
+    try:
+        archivo.seek(0)
+        while True:
+            bloque = archivo.read(tamano_bloque)
+            if not bloque:
+                break
+            yield bloque
+    finally:
+        archivo.close()
@@ -0,0 +1,121 @@
+"""
+Años y meses disponibles (facetas) de las tablas con fecha, para los menús
+desplegables de las páginas de estadísticas.
+
+Antes se repetía la agregación completa del historial sin filtros solo para
+sacar los años. Ahora las facetas se calculan una vez con búsquedas en el
+índice por Fecha (ver DatabaseAuthenticator.obtener_facetas), se guardan aquí
+y cada inserción agrega su año y mes con registrar(), sin volver a consultar.
+El tiempo de vida (FACETAS_TTL, en segundos) solo sirve para recoger lo que
+otros procesos hayan escrito en la misma base.
+"""
+import datetime
+import os
+import threading
+import time
+
+
+def anio_mes(fecha):
+    """(anio, mes) de un date, datetime o texto 'YYYY-MM-DD...'."""
+    if isinstance(fecha, (datetime.date, datetime.datetime)):
+        return fecha.year, fecha.month
+    texto = str(fecha).strip()
+    return int(texto[:4]), int(texto[5:7])
+
+
+def meses_entre(inicio, fin):
+    """[(anio, mes)] desde el mes de `inicio` hasta el de `fin`, ambos incluidos."""
+    anio, mes = anio_mes(inicio)
+    ultimo = anio_mes(fin)
+    meses = []
+    while (anio, mes) <= ultimo:
+        meses.append((anio, mes))
+        anio, mes = (anio + 1, 1) if mes == 12 else (anio, mes + 1)
+    return meses
+
+
+class Facetas:
+    """Conjunto de (anio, mes) con datos. No se modifica una vez armado."""
+
+    def __init__(self, pares=()):
+        self._meses = {}
+        for anio, mes in pares:
+            self._meses.setdefault(int(anio), set()).add(int(mes))
+
+    def contiene(self, anio, mes):
+        return int(mes) in self._meses.get(int(anio), ())
+
+    def con(self, pares):
+        """Facetas nuevas con estos (anio, mes) agregados."""
+        return Facetas([(a, m) for a, ms in self._meses.items() for m in ms] + list(pares))
+
+    @property
+    def anios(self):
+        return sorted(self._meses)
+
+    def meses(self, anio=None):
+        """Meses con datos del año indicado o, sin año, de cualquier año."""
+        if anio:
+            return sorted(self._meses.get(int(anio), ()))
+        return sorted(set().union(*self._meses.values()))
+
+    def a_dict(self):
+        return {anio: sorted(meses) for anio, meses in sorted(self._meses.items())}
+
+
+class CacheFacetas:
+    """
+    Facetas por (backend, conjunto de datos). Las inserciones que ocurren
+    mientras se carga un conjunto se aplican también a lo recién cargado, así
+    una carga lenta no pierde un mes nuevo.
+    """
+
+    def __init__(self, ttl=3600.0):
+        self.ttl = ttl
+        self._entradas = {}  # clave -> (vence, Facetas)
+        self._cargando = {}  # clave -> [cargas en curso, [(anio, mes)] registrados mientras tanto]
+        self._lock = threading.Lock()
+
+    def obtener(self, clave, cargar):
+        """Devuelve las Facetas de `clave`, cargándolas con cargar() si faltan o vencieron."""
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None and entrada[0] > time.monotonic():
+                return entrada[1]
+            carga = self._cargando.setdefault(clave, [0, []])
+            carga[0] += 1
+        try:
+            facetas = cargar()
+        except Exception:
+            with self._lock:
+                self._terminar_carga(clave, carga)
+            raise
+        with self._lock:
+            if carga[1]:
+                facetas = facetas.con(carga[1])
+            self._entradas[clave] = (time.monotonic() + self.ttl, facetas)
+            self._terminar_carga(clave, carga)
+        return facetas
+
+    def _terminar_carga(self, clave, carga):
+        carga[0] -= 1
+        if not carga[0]:
+            self._cargando.pop(clave, None)
+
+    def registrar(self, clave, fecha):
+        """Agrega el año y mes de `fecha` a las facetas de `clave` si ya están cargadas."""
+        anio, mes = anio_mes(fecha)
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None and not entrada[1].contiene(anio, mes):
+                self._entradas[clave] = (entrada[0], entrada[1].con([(anio, mes)]))
+            if clave in self._cargando:
+                self._cargando[clave][1].append((anio, mes))
+
+    def invalidar(self, *claves):
+        with self._lock:
+            for clave in claves:
+                self._entradas.pop(clave, None)
+
+
+facetas = CacheFacetas(ttl=float(os.getenv('FACETAS_TTL', '3600')))
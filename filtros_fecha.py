@@ -0,0 +1,80 @@
+"""
+Filtros por fecha que pueden aprovechar los índices.
+
+`MONTH(Fecha) = ? AND YEAR(Fecha) = ?` o `CAST(Fecha AS DATE) = ?` obligan al
+motor a calcular la función en cada fila y recorrer toda la tabla. Aquí esos
+filtros se arman como rangos semiabiertos `Fecha >= inicio AND Fecha < fin`,
+que funcionan igual para columnas DATE y DATETIME y permiten buscar en el
+índice por Fecha.
+
+Todas las funciones devuelven (clausulas, parametros) para sumarlas a las
+listas `where_clauses` / `params` con que se arman las consultas.
+"""
+import datetime
+
+
+def fecha_de(valor):
+    """Día (date) de un date, datetime o texto 'YYYY-MM-DD...'."""
+    if isinstance(valor, datetime.datetime):
+        return valor.date()
+    if isinstance(valor, datetime.date):
+        return valor
+    return datetime.date.fromisoformat(str(valor).strip()[:10])
+
+
+def rango_periodo(anio, mes=None, dia=None):
+    """[inicio, fin) del año, del mes o del día indicado."""
+    anio = int(anio)
+    if mes is None:
+        return datetime.date(anio, 1, 1), datetime.date(anio + 1, 1, 1)
+    mes = int(mes)
+    if dia is not None:
+        inicio = datetime.date(anio, mes, int(dia))
+        return inicio, inicio + datetime.timedelta(days=1)
+    inicio = datetime.date(anio, mes, 1)
+    fin = datetime.date(anio + 1, 1, 1) if mes == 12 else datetime.date(anio, mes + 1, 1)
+    return inicio, fin
+
+
+def filtro_rango(columna, inicio, fin):
+    """`columna >= inicio AND columna < fin`."""
+    return [f"{columna} >= ?", f"{columna} < ?"], [inicio, fin]
+
+
+def filtro_periodo(columna, anio=None, mes=None, dia=None):
+    """
+    Filtro por año / mes / día. Con el año presente se usa un solo rango; sin
+    él no hay rango posible (p.ej. "todos los marzos") y se cae a MONTH()/DAY().
+    """
+    anio = int(anio) if anio else None
+    mes = int(mes) if mes else None
+    dia = int(dia) if dia else None
+    clausulas, params = [], []
+    if anio:
+        inicio, fin = rango_periodo(anio, mes, dia if mes else None)
+        clausulas, params = filtro_rango(columna, inicio, fin)
+        if mes:
+            mes = dia = None
+    if mes:
+        clausulas.append(f"MONTH({columna}) = ?")
+        params.append(mes)
+    if dia:
+        clausulas.append(f"DAY({columna}) = ?")
+        params.append(dia)
+    return clausulas, params
+
+
+def filtro_dia(columna, fecha):
+    """Registros del día `fecha` (date, datetime o 'YYYY-MM-DD')."""
+    inicio = fecha_de(fecha)
+    return filtro_rango(columna, inicio, inicio + datetime.timedelta(days=1))
+
+
+def filtro_hoy(columna):
+    return filtro_dia(columna, datetime.date.today())
+
+
+def filtro_entre_fechas(columna, fecha_inicio, fecha_fin):
+    """Del día fecha_inicio al día fecha_fin, ambos completos."""
+    return filtro_rango(columna, fecha_de(fecha_inicio),
+                        fecha_de(fecha_fin) + datetime.timedelta(days=1))
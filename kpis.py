@@ -0,0 +1,52 @@
+"""
+Indicadores del tablero (dashboard).
+
+Se calculan todos juntos con DatabaseAuthenticator.obtener_kpis_dashboard(),
+una sola consulta, y los consumen tanto la página del tablero como el
+endpoint JSON que usa la pantalla de la oficina para refrescarse. El
+resultado pasa por cache_kpis, así que puede tener algunos segundos: `edad`
+dice cuántos.
+"""
+import datetime
+
+
+class KpisDashboard:
+    """Indicadores del día y gráficos del tablero."""
+
+    __slots__ = ('ventas_totales', 'litros_distribuidos', 'productos_vendidos',
+                 'ventas_por_producto', 'inventario', 'generado')
+
+    def __init__(self, ventas_totales=0.0, litros_distribuidos=0.0, productos_vendidos=0,
+                 ventas_por_producto=None, inventario=None, generado=None):
+        self.ventas_totales = ventas_totales          # Q vendidos hoy en productos
+        self.litros_distribuidos = litros_distribuidos  # Salidas de combustible de hoy
+        self.productos_vendidos = productos_vendidos  # Unidades de productos vendidas hoy
+        self.ventas_por_producto = ventas_por_producto or []  # [(nombre, unidades)] últimos 7 días
+        self.inventario = inventario or []            # [(tipo de combustible, saldo)]
+        self.generado = generado                      # datetime del cálculo
+
+    @property
+    def edad(self):
+        """Segundos desde que se calcularon los indicadores."""
+        if self.generado is None:
+            return 0.0
+        return max(0.0, (datetime.datetime.now() - self.generado).total_seconds())
+
+    @property
+    def inv_labels(self):
+        return [nombre for nombre, _ in self.inventario]
+
+    @property
+    def inv_data(self):
+        return [saldo for _, saldo in self.inventario]
+
+    def a_dict(self):
+        return {
+            'ventas_totales': self.ventas_totales,
+            'litros_distribuidos': self.litros_distribuidos,
+            'productos_vendidos': self.productos_vendidos,
+            'ventas_por_producto': [list(fila) for fila in self.ventas_por_producto],
+            'inventario': [list(fila) for fila in self.inventario],
+            'generado': self.generado.isoformat() if self.generado else None,
+            'edad_segundos': round(self.edad, 1),
+        }
@@ -0,0 +1,352 @@
+"""
+Migraciones versionadas del esquema.
+
+Cada migración tiene un número de versión y las sentencias para cada backend
+(sqlserver y sqlite). Las aplicadas se anotan en la tabla MigracionesEsquema,
+así cada una corre una sola vez por base de datos. El backend las aplica al
+preparar el esquema; también se pueden correr a mano:
+
+    python migraciones.py            # aplica las pendientes
+    python migraciones.py --estado   # solo muestra cuáles faltan
+"""
+import datetime
+
+TABLA_VERSIONES = {
+    'sqlserver': """
+        IF OBJECT_ID(N'dbo.MigracionesEsquema', N'U') IS NULL
+        CREATE TABLE dbo.MigracionesEsquema (
+            Version INT NOT NULL PRIMARY KEY,
+            Descripcion NVARCHAR(200) NOT NULL,
+            FechaAplicada DATETIME NOT NULL
+        )
+    """,
+    'sqlite': """
+        CREATE TABLE IF NOT EXISTS MigracionesEsquema (
+            Version INTEGER PRIMARY KEY,
+            Descripcion TEXT NOT NULL,
+            FechaAplicada DATETIME NOT NULL
+        )
+    """,
+}
+
+
+def _indice(dialecto, nombre, tabla, columnas, incluir=()):
+    """CREATE INDEX idempotente; las columnas incluidas solo existen en SQL Server."""
+    if dialecto == 'sqlite':
+        return f"CREATE INDEX IF NOT EXISTS {nombre} ON {tabla} ({', '.join(columnas)})"
+    sql = (
+        f"IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = N'{nombre}' "
+        f"AND object_id = OBJECT_ID(N'dbo.{tabla}'))\n"
+        f"CREATE INDEX {nombre} ON dbo.{tabla} ({', '.join(columnas)})"
+    )
+    if incluir:
+        sql += f" INCLUDE ({', '.join(incluir)})"
+    return sql
+
+
+# (nombre, tabla, columnas clave, columnas incluidas)
+INDICES_FECHA = [
+    ('IX_InventarioCombustible_Tipo_Fecha', 'InventarioCombustible',
+     ('TipoCombustibleID', 'Fecha', 'InventarioID'), ('Entrada', 'Salida')),
+    ('IX_InventarioCombustible_Fecha', 'InventarioCombustible', ('Fecha',), ('Salida',)),
+    ('IX_VentaCombustible_Fecha_Cliente', 'VentaCombustible', ('Fecha', 'ClienteID'), ('Total',)),
+    ('IX_DetalleVentaCombustible_Venta', 'DetalleVentaCombustible', ('VentaCombustibleID',), ()),
+    ('IX_Ventas_Fecha', 'Ventas', ('Fecha',), ('ClienteID', 'Total')),
+    ('IX_DetalleVenta_Venta', 'DetalleVenta', ('VentaID',), ('ProductoID', 'Cantidad')),
+]
+
+
+# Versiones de los datos para la caché de archivos de reportes (migración 5).
+# Cada tabla con fecha lleva una fila por mes en VersionesDatos y las tablas sin
+# fecha una fila con Mes = ''; disparadores sobre las tablas de los reportes la
+# actualizan en cada INSERT, UPDATE o DELETE, también los hechos fuera de la
+# aplicación. Version crece en toda la tabla (rowversion en SQL Server, el
+# máximo + 1 en SQLite), así el máximo de las filas de un rango cambia con
+# cualquier cambio en él. La fila se actualiza dentro de la transacción que
+# escribe, así que las ventas del mismo mes se encolan en ella hasta el commit.
+
+def _meses(tabla, fecha='Fecha'):
+    """(T-SQL, SQLite) de las filas (Tabla, Mes) de los meses de las filas de {t}."""
+    return (f"SELECT '{tabla}' AS Tabla, CONVERT(VARCHAR(7), {{t}}.{fecha}, 120) AS Mes FROM {{t}}",
+            f"SELECT '{tabla}' AS Tabla, substr({{t}}.{fecha}, 1, 7) AS Mes")
+
+
+def _meses_cabecera(tabla, clave):
+    """Igual que _meses, con el mes de la cabecera `tabla` de las filas de detalle de {t}."""
+    return (f"SELECT '{tabla}' AS Tabla, CONVERT(VARCHAR(7), C.Fecha, 120) AS Mes FROM {{t}} "
+            f"JOIN dbo.{tabla} C ON C.{clave} = {{t}}.{clave}",
+            f"SELECT '{tabla}' AS Tabla, substr(C.Fecha, 1, 7) AS Mes FROM {tabla} C WHERE C.{clave} = {{t}}.{clave}")
+
+
+# Tabla -> filas a versionar ({t} es inserted / deleted en T-SQL y NEW / OLD en
+# SQLite) y, en las que tienen Nombre, su clave: un cambio de nombre o un
+# borrado versiona 'Nombres', que usan los reportes que muestran nombres
+VERSIONADAS = [
+    ('InventarioCombustible', [_meses('InventarioCombustible')], None),
+    ('VentaCombustible', [_meses('VentaCombustible')], None),
+    ('DetalleVentaCombustible', [_meses_cabecera('VentaCombustible', 'VentaCombustibleID')], None),
+    ('Ventas', [_meses('Ventas')], None),
+    ('DetalleVenta', [_meses_cabecera('Ventas', 'VentaID')], None),
+    ('Productos', [("SELECT 'Productos' AS Tabla, '' AS Mes FROM {t}", "SELECT 'Productos' AS Tabla, '' AS Mes")],
+     'ProductoID'),
+    ('Clientes', [], 'ClienteID'),
+    ('TiposCombustible', [], 'TipoCombustibleID'),
+]
+
+
+def _disparador_sqlserver(tabla, filas, clave_nombre):
+    """Un disparador AFTER INSERT, UPDATE, DELETE que hace MERGE de las filas en VersionesDatos."""
+    selects = [sql.format(t=t) for sql, _ in filas for t in ('inserted', 'deleted')]
+    if clave_nombre:
+        # Nombre cambiado o fila borrada: cambian los nombres que muestran los reportes
+        selects.append(
+            f"SELECT 'Nombres' AS Tabla, '' AS Mes FROM deleted D LEFT JOIN inserted I ON I.{clave_nombre} = D.{clave_nombre} "
+            f"WHERE I.{clave_nombre} IS NULL OR I.Nombre <> D.Nombre"
+        )
+    return f"""
+        CREATE OR ALTER TRIGGER dbo.TR_{tabla}_VersionesDatos ON dbo.{tabla}
+        AFTER INSERT, UPDATE, DELETE AS
+        BEGIN
+            SET NOCOUNT ON;
+            MERGE dbo.VersionesDatos WITH (HOLDLOCK) AS V
+            USING ({' UNION '.join(selects)}) AS M
+            ON V.Tabla = M.Tabla AND V.Mes = M.Mes
+            WHEN MATCHED THEN UPDATE SET Cambios = V.Cambios + 1
+            WHEN NOT MATCHED THEN INSERT (Tabla, Mes, Cambios) VALUES (M.Tabla, M.Mes, 1);
+        END
+    """
+
+
+def _disparadores_sqlite(tabla, filas, clave_nombre):
+    """Un disparador por evento; cada uno inserta o actualiza sus filas en VersionesDatos."""
+    sentencias = []
+    for evento, seudotablas in (('INSERT', ('NEW',)), ('UPDATE', ('NEW', 'OLD')), ('DELETE', ('OLD',))):
+        selects = [sql.format(t=t) for _, sql in filas for t in seudotablas]
+        if clave_nombre and evento == 'UPDATE':
+            selects.append("SELECT 'Nombres' AS Tabla, '' AS Mes WHERE NEW.Nombre IS NOT OLD.Nombre")
+        elif clave_nombre and evento == 'DELETE':
+            selects.append("SELECT 'Nombres' AS Tabla, '' AS Mes")
+        if not selects:
+            continue
+        sentencias.append(f"""
+            CREATE TRIGGER IF NOT EXISTS TR_{tabla}_VersionesDatos_{evento} AFTER {evento} ON {tabla}
+            BEGIN
+                INSERT INTO VersionesDatos (Tabla, Mes, Cambios, Version)
+                SELECT M.Tabla, M.Mes, 1, (SELECT IFNULL(MAX(Version), 0) + 1 FROM VersionesDatos)
+                FROM ({' UNION '.join(selects)}) AS M
+                WHERE M.Mes IS NOT NULL
+                ON CONFLICT (Tabla, Mes) DO UPDATE SET Cambios = Cambios + 1, Version = excluded.Version;
+            END
+        """)
+    return sentencias
+
+
+MIGRACIONES = [
+    {
+        'version': 1,
+        'descripcion': 'Tabla de saldos por tipo de combustible',
+        'sqlserver': ["""
+            IF OBJECT_ID(N'dbo.SaldosCombustible', N'U') IS NULL
+            CREATE TABLE dbo.SaldosCombustible (
+                TipoCombustibleID INT NOT NULL PRIMARY KEY REFERENCES dbo.TiposCombustible(TipoCombustibleID),
+                Saldo DECIMAL(18, 2) NOT NULL DEFAULT 0,
+                FechaActualizacion DATETIME NULL
+            )
+        """],
+        'sqlite': ["""
+            CREATE TABLE IF NOT EXISTS SaldosCombustible (
+                TipoCombustibleID INTEGER PRIMARY KEY REFERENCES TiposCombustible(TipoCombustibleID),
+                Saldo REAL NOT NULL DEFAULT 0,
+                FechaActualizacion DATETIME
+            )
+        """],
+    },
+    {
+        'version': 2,
+        'descripcion': 'Índices para los filtros por rango de fechas',
+        'sqlserver': [_indice('sqlserver', *i) for i in INDICES_FECHA],
+        'sqlite': [_indice('sqlite', *i) for i in INDICES_FECHA],
+    },
+    {
+        'version': 3,
+        'descripcion': 'Índice por código de producto para la búsqueda por prefijo',
+        'sqlserver': [_indice('sqlserver', 'IX_Productos_Codigo', 'Productos', ('Codigo',), ('Nombre', 'Cantidad'))],
+        'sqlite': [_indice('sqlite', 'IX_Productos_Codigo', 'Productos', ('Codigo',))],
+    },
+    {
+        'version': 4,
+        'descripcion': 'Resúmenes diarios de ventas por cliente y combustible / producto',
+        'sqlserver': [
+            """
+            IF OBJECT_ID(N'dbo.ResumenDiarioCombustible', N'U') IS NULL
+            CREATE TABLE dbo.ResumenDiarioCombustible (
+                Fecha DATE NOT NULL,
+                ClienteID INT NOT NULL,
+                TipoCombustibleID INT NOT NULL,
+                Litros DECIMAL(18, 2) NOT NULL DEFAULT 0,
+                Monto DECIMAL(18, 2) NOT NULL DEFAULT 0,
+                Lineas INT NOT NULL DEFAULT 0,
+                PRIMARY KEY (Fecha, ClienteID, TipoCombustibleID)
+            )
+            """,
+            """
+            IF OBJECT_ID(N'dbo.ResumenDiarioProductos', N'U') IS NULL
+            CREATE TABLE dbo.ResumenDiarioProductos (
+                Fecha DATE NOT NULL,
+                ClienteID INT NOT NULL,
+                ProductoID INT NOT NULL,
+                Cantidad INT NOT NULL DEFAULT 0,
+                Monto DECIMAL(18, 2) NOT NULL DEFAULT 0,
+                Lineas INT NOT NULL DEFAULT 0,
+                PRIMARY KEY (Fecha, ClienteID, ProductoID)
+            )
+            """,
+            """
+            IF NOT EXISTS (SELECT 1 FROM dbo.ResumenDiarioCombustible)
+            INSERT INTO dbo.ResumenDiarioCombustible (Fecha, ClienteID, TipoCombustibleID, Litros, Monto, Lineas)
+            SELECT CAST(VC.Fecha AS DATE), ISNULL(VC.ClienteID, 0), DVC.TipoCombustibleID,
+                   SUM(DVC.CantidadLitros), SUM(DVC.Subtotal), COUNT(*)
+            FROM dbo.VentaCombustible VC
+            JOIN dbo.DetalleVentaCombustible DVC ON DVC.VentaCombustibleID = VC.VentaCombustibleID
+            GROUP BY CAST(VC.Fecha AS DATE), ISNULL(VC.ClienteID, 0), DVC.TipoCombustibleID
+            """,
+            """
+            IF NOT EXISTS (SELECT 1 FROM dbo.ResumenDiarioProductos)
+            INSERT INTO dbo.ResumenDiarioProductos (Fecha, ClienteID, ProductoID, Cantidad, Monto, Lineas)
+            SELECT CAST(V.Fecha AS DATE), ISNULL(V.ClienteID, 0), DV.ProductoID,
+                   SUM(DV.Cantidad), SUM(DV.Subtotal), COUNT(*)
+            FROM dbo.Ventas V
+            JOIN dbo.DetalleVenta DV ON DV.VentaID = V.VentaID
+            GROUP BY CAST(V.Fecha AS DATE), ISNULL(V.ClienteID, 0), DV.ProductoID
+            """,
+        ],
+        'sqlite': [
+            """
+            CREATE TABLE IF NOT EXISTS ResumenDiarioCombustible (
+                Fecha DATE NOT NULL,
+                ClienteID INTEGER NOT NULL,
+                TipoCombustibleID INTEGER NOT NULL,
+                Litros REAL NOT NULL DEFAULT 0,
+                Monto REAL NOT NULL DEFAULT 0,
+                Lineas INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (Fecha, ClienteID, TipoCombustibleID)
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS ResumenDiarioProductos (
+                Fecha DATE NOT NULL,
+                ClienteID INTEGER NOT NULL,
+                ProductoID INTEGER NOT NULL,
+                Cantidad INTEGER NOT NULL DEFAULT 0,
+                Monto REAL NOT NULL DEFAULT 0,
+                Lineas INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (Fecha, ClienteID, ProductoID)
+            )
+            """,
+            """
+            INSERT INTO ResumenDiarioCombustible (Fecha, ClienteID, TipoCombustibleID, Litros, Monto, Lineas)
+            SELECT date(VC.Fecha), IFNULL(VC.ClienteID, 0), DVC.TipoCombustibleID,
+                   SUM(DVC.CantidadLitros), SUM(DVC.Subtotal), COUNT(*)
+            FROM VentaCombustible VC
+            JOIN DetalleVentaCombustible DVC ON DVC.VentaCombustibleID = VC.VentaCombustibleID
+            WHERE NOT EXISTS (SELECT 1 FROM ResumenDiarioCombustible)
+            GROUP BY date(VC.Fecha), IFNULL(VC.ClienteID, 0), DVC.TipoCombustibleID
+            """,
+            """
+            INSERT INTO ResumenDiarioProductos (Fecha, ClienteID, ProductoID, Cantidad, Monto, Lineas)
+            SELECT date(V.Fecha), IFNULL(V.ClienteID, 0), DV.ProductoID,
+                   SUM(DV.Cantidad), SUM(DV.Subtotal), COUNT(*)
+            FROM Ventas V
+            JOIN DetalleVenta DV ON DV.VentaID = V.VentaID
+            WHERE NOT EXISTS (SELECT 1 FROM ResumenDiarioProductos)
+            GROUP BY date(V.Fecha), IFNULL(V.ClienteID, 0), DV.ProductoID
+            """,
+        ],
+    },
+    {
+        'version': 5,
+        'descripcion': 'Versiones de los datos por tabla y mes, mantenidas con disparadores',
+        'sqlserver': [
+            """
+            IF OBJECT_ID(N'dbo.VersionesDatos', N'U') IS NULL
+            CREATE TABLE dbo.VersionesDatos (
+                Tabla VARCHAR(40) NOT NULL,
+                Mes VARCHAR(7) NOT NULL,
+                Cambios BIGINT NOT NULL DEFAULT 0,
+                Version ROWVERSION NOT NULL,
+                PRIMARY KEY (Tabla, Mes)
+            )
+            """,
+        ] + [_disparador_sqlserver(*v) for v in VERSIONADAS],
+        'sqlite': [
+            """
+            CREATE TABLE IF NOT EXISTS VersionesDatos (
+                Tabla TEXT NOT NULL,
+                Mes TEXT NOT NULL,
+                Cambios INTEGER NOT NULL DEFAULT 0,
+                Version INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (Tabla, Mes)
+            )
+            """,
+        ] + [sentencia for v in VERSIONADAS for sentencia in _disparadores_sqlite(*v)],
+    },
+]
+
+
+def versiones_aplicadas(conexion, dialecto):
+    """Devuelve el conjunto de versiones ya aplicadas (crea la tabla de control si falta)."""
+    cursor = conexion.cursor()
+    cursor.execute(TABLA_VERSIONES[dialecto])
+    conexion.commit()
+    cursor.execute("SELECT Version FROM MigracionesEsquema")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def migraciones_pendientes(conexion, dialecto):
+    aplicadas = versiones_aplicadas(conexion, dialecto)
+    return [m for m in MIGRACIONES if m['version'] not in aplicadas]
+
+
+def aplicar_migraciones(conexion, dialecto, hasta=None):
+    """
+    Aplica en orden las migraciones pendientes (hasta la versión `hasta`, si se indica).
+    Cada una corre en su propia transacción junto con su registro en
+    MigracionesEsquema. Devuelve las versiones aplicadas.
+    """
+    aplicadas = []
+    for migracion in migraciones_pendientes(conexion, dialecto):
+        if hasta is not None and migracion['version'] > hasta:
+            break
+        cursor = conexion.cursor()
+        try:
+            for sentencia in migracion[dialecto]:
+                cursor.execute(sentencia)
+            cursor.execute(
+                "INSERT INTO MigracionesEsquema (Version, Descripcion, FechaAplicada) VALUES (?, ?, ?)",
+                (migracion['version'], migracion['descripcion'], datetime.datetime.now()),
+            )
+            conexion.commit()
+        except Exception:
+            conexion.rollback()
+            raise
+        aplicadas.append(migracion['version'])
+    return aplicadas
+
+
+if __name__ == "__main__":
+    import sys
+    from conexion import DatabaseAuthenticator
+
+    db = DatabaseAuthenticator(preparar_esquema=False)
+    conexion = db.backend.conectar()
+    try:
+        pendientes = migraciones_pendientes(conexion, db.backend.nombre)
+    finally:
+        conexion.close()
+    for migracion in pendientes:
+        print(f"Pendiente: {migracion['version']} - {migracion['descripcion']}")
+    if pendientes and '--estado' not in sys.argv:
+        db.backend.preparar()  # En SQLite además crea las tablas base que falten
+        pendientes = []
+    if not pendientes:
+        print("El esquema está al día.")
@@ -0,0 +1,78 @@
+"""
+Paginación por cursor (keyset) para los historiales de ventas.
+
+En lugar de OFFSET, que recorre y descarta todas las filas anteriores, cada
+página se pide a partir de la última (o primera) venta mostrada: la consulta
+busca directo en el índice por (Fecha, ID), así la página 500 cuesta lo mismo
+que la primera. La posición viaja en un token opaco que las rutas reciben en
+el parámetro `token`.
+"""
+import base64
+import datetime
+import json
+
+SIGUIENTE = 's'  # Ventas más antiguas que la posición
+ANTERIOR = 'a'   # Ventas más recientes que la posición
+
+
+def codificar_token(direccion, fecha, id_):
+    fecha = fecha.isoformat() if isinstance(fecha, (datetime.date, datetime.datetime)) else str(fecha)
+    datos = json.dumps([direccion, fecha, int(id_)], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(datos).decode().rstrip('=')
+
+
+def decodificar_token(token):
+    """Devuelve (direccion, fecha, id) o None si el token no es válido."""
+    if not token:
+        return None
+    try:
+        datos = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        direccion, fecha, id_ = json.loads(datos)
+        if direccion not in (SIGUIENTE, ANTERIOR):
+            return None
+        fecha = (datetime.date.fromisoformat(fecha) if len(fecha) <= 10
+                 else datetime.datetime.fromisoformat(fecha))
+        return direccion, fecha, int(id_)
+    except (ValueError, TypeError):
+        return None
+
+
+def filtro_keyset(token, columna_fecha, columna_id):
+    """
+    Condición y orden para la página que pide `token` sobre un listado que se
+    muestra del más reciente al más antiguo. Devuelve (clausulas, params, orden)
+    con orden 'DESC' o 'ASC' (hacia atrás se lee en orden inverso).
+    """
+    posicion = decodificar_token(token)
+    if posicion is None:
+        return [], [], 'DESC'
+    direccion, fecha, id_ = posicion
+    if direccion == SIGUIENTE:
+        comparador, orden = '<', 'DESC'
+    else:
+        comparador, orden = '>', 'ASC'
+    clausula = (f"({columna_fecha} {comparador} ? OR "
+                f"({columna_fecha} = ? AND {columna_id} {comparador} ?))")
+    return [clausula], [fecha, fecha, id_], orden
+
+
+def armar_pagina(filas, por_pagina, token, clave):
+    """
+    Recibe las filas leídas (hasta por_pagina + 1, en el orden de filtro_keyset)
+    y devuelve (filas de la página del más reciente al más antiguo, token
+    anterior, token siguiente). `clave(fila)` da la (fecha, id) de una fila.
+    """
+    posicion = decodificar_token(token)
+    direccion = posicion[0] if posicion else None
+    hay_mas = len(filas) > por_pagina
+    filas = list(filas[:por_pagina])
+    if not filas:
+        return filas, None, None
+    if direccion == ANTERIOR:
+        filas.reverse()
+        anterior = codificar_token(ANTERIOR, *clave(filas[0])) if hay_mas else None
+        siguiente = codificar_token(SIGUIENTE, *clave(filas[-1]))
+    else:
+        anterior = codificar_token(ANTERIOR, *clave(filas[0])) if direccion == SIGUIENTE else None
+        siguiente = codificar_token(SIGUIENTE, *clave(filas[-1])) if hay_mas else None
+    return filas, anterior, siguiente
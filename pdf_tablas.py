@@ -0,0 +1,220 @@
+"""
+Tablas en PDF para los reportes, con fpdf2.
+
+El PDF anterior dibujaba cada valor con su propio pdf.cell(..., border=1) a un
+ancho fijo de 277 / columnas, sin repetir el encabezado al cambiar de página,
+y codificaba el documento con output(dest='S').encode('latin1'), que además de
+fallar con fpdf2 no admite nombres fuera de latin-1. Aquí:
+
+- los anchos de columna salen de una muestra de las primeras filas (MUESTRA) y
+  se ajustan al ancho de la página; lo que no cabe se recorta con "…";
+- las filas se procesan por páginas: se formatea el lote de la página, se
+  escribe cada valor con pdf.text() (sin la maquetación de cell()) y la
+  cuadrícula se traza con una línea por fila y una por columna;
+- el encabezado se repite en cada página y el pie lleva "Página n de N";
+- se usa una fuente TrueType (PDF_FUENTE o una del sistema) para escribir
+  cualquier carácter; si no hay ninguna, Helvetica con lo que no sea latin-1
+  reemplazado por "?".
+
+fpdf2 guarda las páginas en memoria hasta output(); el resultado se escribe en
+el archivo de destino (en exportación, uno temporal o el de la caché).
+"""
+import datetime
+import decimal
+import itertools
+import os
+
+from fpdf import FPDF
+
+# Fuentes TrueType (normal, negrita) que se prueban en orden
+_FUENTES = [
+    (os.getenv('PDF_FUENTE'), os.getenv('PDF_FUENTE_NEGRITA')),
+    (r'C:\Windows\Fonts\arial.ttf', r'C:\Windows\Fonts\arialbd.ttf'),
+    ('/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf', '/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf'),
+    ('/Library/Fonts/Arial.ttf', '/Library/Fonts/Arial Bold.ttf'),
+]
+
+MUESTRA = 200      # filas con que se calculan los anchos de columna
+MARGEN = 10        # mm
+ALTO_FILA = 6      # mm
+RELLENO = 1.5      # mm a cada lado del texto dentro de la celda
+TAMANO_LETRA = 9
+
+
+def _fuente_ttf():
+    """(normal, negrita) de la primera fuente TrueType disponible, o None."""
+    for normal, negrita in _FUENTES:
+        if normal and os.path.isfile(normal):
+            return normal, negrita if negrita and os.path.isfile(negrita) else normal
+    return None
+
+
+def _es_numero(valor):
+    return isinstance(valor, (int, float, decimal.Decimal)) and not isinstance(valor, bool)
+
+
+def _texto(valor):
+    if valor is None:
+        return ''
+    if _es_numero(valor):
+        return "{:,.2f}".format(valor)
+    if isinstance(valor, (datetime.date, datetime.datetime)):
+        return valor.isoformat()[:10]
+    return str(valor)
+
+
+def _repartir(naturales, disponible):
+    """
+    Anchos de columna que suman `disponible`. Si no alcanza, las columnas
+    angostas conservan su ancho y las anchas se reparten lo que queda; si
+    sobra, todas se agrandan en proporción.
+    """
+    anchos = list(naturales)
+    if sum(naturales) > disponible:
+        restante = disponible
+        orden = sorted(range(len(naturales)), key=naturales.__getitem__)
+        for k, i in enumerate(orden):
+            anchos[i] = min(naturales[i], restante / (len(orden) - k))
+            restante -= anchos[i]
+    escala = disponible / sum(anchos)
+    return [a * escala for a in anchos]
+
+
+class TablaPdf:
+    """Una tabla con título en un A4 horizontal."""
+
+    def __init__(self, columnas, titulo, subtitulo=''):
+        self.columnas = list(columnas)
+        self.titulo = titulo
+        self.subtitulo = subtitulo
+        self.pdf = FPDF(orientation='L', unit='mm', format='A4')
+        self.pdf.set_auto_page_break(False)
+        self.pdf.set_margins(MARGEN, MARGEN)
+        ttf = _fuente_ttf()
+        if ttf:
+            self.pdf.add_font('Tabla', '', ttf[0])
+            self.pdf.add_font('Tabla', 'B', ttf[1])
+            self.fuente, self._puntos = 'Tabla', '…'
+        else:
+            self.fuente, self._puntos = 'helvetica', '...'
+        self._latin1 = ttf is None
+        self._anchos_numero = {}
+
+    def escribir(self, filas, destino):
+        """Dibuja `filas` (iterable de tuplas) y escribe el PDF en `destino` (archivo binario)."""
+        filas = iter(filas)
+        muestra = list(itertools.islice(filas, MUESTRA))
+        self._calcular_columnas(muestra)
+        filas = itertools.chain(muestra, filas)
+        pdf = self.pdf
+        sobrante = []  # se lee una fila de más para no dejar una página vacía al final
+        while True:
+            pdf.add_page()
+            y = self._encabezado(pdf.page_no() == 1)
+            cabida = int((pdf.h - MARGEN - 8 - y) // ALTO_FILA)
+            lote = sobrante + list(itertools.islice(filas, cabida + 1 - len(sobrante)))
+            lote, sobrante = lote[:cabida], lote[cabida:]
+            self._dibujar([self._formatear(fila) for fila in lote], y)
+            if not sobrante:
+                break
+        destino.write(pdf.output())
+
+    def _calcular_columnas(self, muestra):
+        """Alineación y ancho de cada columna según el encabezado y la muestra."""
+        pdf = self.pdf
+        disponible = pdf.w - 2 * MARGEN
+        pdf.set_font(self.fuente, 'B', TAMANO_LETRA)
+        naturales = [pdf.get_string_width(self._limpiar(c)) for c in self.columnas]
+        pdf.set_font(self.fuente, '', TAMANO_LETRA)
+        self.numericas = []
+        for i in range(len(self.columnas)):
+            valores = [fila[i] for fila in muestra if fila[i] is not None]
+            self.numericas.append(bool(valores) and all(_es_numero(v) for v in valores))
+            for valor in valores:
+                naturales[i] = max(naturales[i], pdf.get_string_width(self._limpiar(_texto(valor))))
+        self.anchos = _repartir([n + 2 * RELLENO for n in naturales], disponible)
+        self.bordes = list(itertools.accumulate([MARGEN] + self.anchos))
+        # Largo hasta el que un texto cabe seguro sin medirlo (con la letra más ancha)
+        ancho_m = pdf.get_string_width('W')
+        self._seguros = [int((a - 2 * RELLENO) // ancho_m) for a in self.anchos]
+
+    def _limpiar(self, texto):
+        if self._latin1:
+            return texto.encode('latin-1', 'replace').decode('latin-1')
+        return texto
+
+    def _formatear(self, fila):
+        textos = []
+        for i, valor in enumerate(fila):
+            texto = self._limpiar(_texto(valor))
+            if len(texto) > self._seguros[i]:
+                texto = self._recortar(texto, self.anchos[i] - 2 * RELLENO)
+            textos.append(texto)
+        return textos
+
+    def _recortar(self, texto, ancho):
+        pdf = self.pdf
+        if pdf.get_string_width(texto) <= ancho:
+            return texto
+        while texto and pdf.get_string_width(texto + self._puntos) > ancho:
+            texto = texto[:-1]
+        return texto + self._puntos
+
+    def _ancho_numero(self, texto):
+        # Las cifras tienen todas el mismo ancho en estas fuentes, así que en
+        # "{:,.2f}" el ancho depende solo del largo y del signo
+        if not texto[-1].isdigit():
+            return self.pdf.get_string_width(texto)
+        clave = (len(texto), texto[:1] == '-')
+        ancho = self._anchos_numero.get(clave)
+        if ancho is None:
+            ancho = self._anchos_numero[clave] = self.pdf.get_string_width(texto)
+        return ancho
+
+    def _encabezado(self, primera):
+        """Título (solo en la primera página), encabezados de columna y pie. Devuelve la y de la primera fila."""
+        pdf = self.pdf
+        y = MARGEN
+        if primera:
+            pdf.set_font(self.fuente, 'B', 14)
+            pdf.set_xy(MARGEN, y)
+            pdf.cell(0, 8, self._limpiar(self.titulo), align='C')
+            pdf.set_font(self.fuente, '', 11)
+            pdf.set_xy(MARGEN, y + 8)
+            pdf.cell(0, 6, self._limpiar(self.subtitulo), align='C')
+            y += 18
+        pdf.set_font(self.fuente, '', 8)
+        pdf.set_xy(MARGEN, pdf.h - MARGEN - 4)
+        pdf.cell(0, 4, f"Página {pdf.page_no()} de {{nb}}", align='R')
+        pdf.set_fill_color(221, 238, 255)
+        pdf.rect(MARGEN, y, self.bordes[-1] - MARGEN, ALTO_FILA, style='DF')
+        # Con el relleno distinto del color del texto, fpdf2 envuelve cada text() en q ... Q
+        pdf.set_fill_color(0)
+        pdf.set_font(self.fuente, 'B', TAMANO_LETRA)
+        for i, columna in enumerate(self.columnas):
+            pdf.text(self.bordes[i] + RELLENO, y + ALTO_FILA - 1.8,
+                     self._recortar(self._limpiar(columna), self.anchos[i] - 2 * RELLENO))
+        pdf.set_font(self.fuente, '', TAMANO_LETRA)
+        return y + ALTO_FILA
+
+    def _dibujar(self, lote, y):
+        """Filas del lote desde `y` y la cuadrícula de esas filas."""
+        pdf = self.pdf
+        inicio = y
+        izquierda, derecha = self.bordes[0], self.bordes[-1]
+        posiciones = [(self.bordes[i + 1] - RELLENO if numerica else self.bordes[i] + RELLENO, numerica)
+                      for i, numerica in enumerate(self.numericas)]
+        for textos in lote:
+            base = y + ALTO_FILA - 1.8
+            for (x, numerica), texto in zip(posiciones, textos):
+                if texto:
+                    pdf.text(x - self._ancho_numero(texto) if numerica else x, base, texto)
+            y += ALTO_FILA
+            pdf.line(izquierda, y, derecha, y)
+        for x in self.bordes:
+            pdf.line(x, inicio - ALTO_FILA, x, y)
+
+
+def escribir_tabla(filas, columnas, destino, titulo, subtitulo=''):
+    """Escribe en `destino` un PDF con `filas` (iterable de tuplas) bajo los encabezados `columnas`."""
+    TablaPdf(columnas, titulo, subtitulo).escribir(filas, destino)
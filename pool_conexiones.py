@@ -0,0 +1,258 @@
+"""
+Pool de conexiones a la base de datos compartido por todo el proceso.
+
+Cada petición de Flask crea su propio DatabaseAuthenticator, pero todos piden
+prestadas las conexiones al mismo pool, así el saludo de conexión/login contra
+SQL Server se paga una sola vez por conexión y no una vez por consulta.
+"""
+import threading
+import time
+from collections import deque
+
+
+class PoolAgotadoError(Exception):
+    """No se liberó ninguna conexión dentro del tiempo de espera."""
+
+
+class _Entrada:
+    """Conexión física guardada en el pool junto con sus marcas de tiempo."""
+
+    __slots__ = ('conexion', 'creada', 'ultimo_uso')
+
+    def __init__(self, conexion):
+        self.conexion = conexion
+        self.creada = time.monotonic()
+        self.ultimo_uso = self.creada
+
+
+class ConexionPool:
+    """
+    Conexión prestada por el pool. Se usa igual que una conexión de pyodbc,
+    pero close() la devuelve al pool en lugar de cerrarla.
+    Como contexto confirma al salir sin errores, revierte si hubo una
+    excepción y en ambos casos la devuelve al pool.
+    """
+
+    def __init__(self, pool, entrada):
+        self._pool = pool
+        self._entrada = entrada
+
+    def __getattr__(self, nombre):
+        if self._entrada is None:
+            raise RuntimeError("La conexión ya fue devuelta al pool.")
+        return getattr(self._entrada.conexion, nombre)
+
+    def close(self):
+        entrada, self._entrada = self._entrada, None
+        if entrada is not None:
+            self._pool._devolver(entrada)
+
+    def descartar(self):
+        """Cierra la conexión física (p.ej. tras un error de red) en vez de reutilizarla."""
+        entrada, self._entrada = self._entrada, None
+        if entrada is not None:
+            self._pool._devolver(entrada, descartar=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if self._entrada is not None:
+                if exc_type is None:
+                    self._entrada.conexion.commit()
+                else:
+                    self._entrada.conexion.rollback()
+        finally:
+            self.close()
+        return False
+
+
+class PoolConexiones:
+    """
+    Pool acotado y seguro entre hilos.
+
+    - tamano_maximo: conexiones físicas abiertas como máximo (prestadas + libres).
+    - tiempo_espera: segundos que obtener() espera una conexión libre antes de fallar.
+    - inactividad_maxima: las conexiones libres más viejas que esto se cierran.
+    - vida_maxima: ninguna conexión se reutiliza pasado este tiempo desde que se abrió.
+    - validar_tras: si la conexión estuvo libre más de estos segundos, se valida
+      con consulta_validacion antes de prestarla.
+    """
+
+    def __init__(self, fabrica, tamano_maximo=10, tiempo_espera=30.0,
+                 inactividad_maxima=300.0, vida_maxima=1800.0,
+                 validar_tras=5.0, consulta_validacion="SELECT 1"):
+        if tamano_maximo < 1:
+            raise ValueError("tamano_maximo debe ser al menos 1")
+        self._fabrica = fabrica
+        self.tamano_maximo = tamano_maximo
+        self.tiempo_espera = tiempo_espera
+        self.inactividad_maxima = inactividad_maxima
+        self.vida_maxima = vida_maxima
+        self.validar_tras = validar_tras
+        self.consulta_validacion = consulta_validacion
+        self._libres = deque()  # LIFO: a la derecha las usadas más recientemente
+        self._abiertas = 0
+        self._condicion = threading.Condition(threading.Lock())
+        self._cerrado = False
+
+    # --- préstamo / devolución ---
+
+    def obtener(self):
+        """Presta una conexión; espera hasta tiempo_espera si el pool está lleno."""
+        limite = time.monotonic() + self.tiempo_espera
+        while True:
+            entrada, crear, vencidas = self._reservar(limite)
+            self._cerrar_fisicas(vencidas)
+            if crear:
+                return ConexionPool(self, self._crear())
+            if self._es_valida(entrada):
+                return ConexionPool(self, entrada)
+            # La conexión estaba rota: se descarta y se intenta con otra
+            self._liberar_cupo()
+            self._cerrar_fisicas([entrada])
+
+    def _reservar(self, limite):
+        vencidas = []
+        try:
+            with self._condicion:
+                while True:
+                    if self._cerrado:
+                        raise RuntimeError("El pool de conexiones está cerrado.")
+                    vencidas.extend(self._extraer_vencidas(time.monotonic()))
+                    if self._libres:
+                        return self._libres.pop(), False, vencidas
+                    if self._abiertas < self.tamano_maximo:
+                        self._abiertas += 1
+                        return None, True, vencidas
+                    restante = limite - time.monotonic()
+                    if restante <= 0:
+                        raise PoolAgotadoError(
+                            f"No hay conexiones libres (máximo {self.tamano_maximo}) "
+                            f"tras esperar {self.tiempo_espera} s."
+                        )
+                    self._condicion.wait(restante)
+        except Exception:
+            self._cerrar_fisicas(vencidas)
+            raise
+
+    def _crear(self):
+        try:
+            return _Entrada(self._fabrica())
+        except Exception:
+            self._liberar_cupo()
+            raise
+
+    def _es_valida(self, entrada):
+        ahora = time.monotonic()
+        if ahora - entrada.creada > self.vida_maxima:
+            return False
+        if ahora - entrada.ultimo_uso <= self.validar_tras:
+            return True
+        try:
+            cursor = entrada.conexion.cursor()
+            cursor.execute(self.consulta_validacion)
+            cursor.fetchall()
+            cursor.close()
+            return True
+        except Exception:
+            return False
+
+    def _devolver(self, entrada, descartar=False):
+        if not descartar:
+            try:
+                # Deja la conexión limpia: sin transacción abierta ni bloqueos
+                entrada.conexion.rollback()
+            except Exception:
+                descartar = True
+        ahora = time.monotonic()
+        if ahora - entrada.creada > self.vida_maxima:
+            descartar = True
+        with self._condicion:
+            if descartar or self._cerrado:
+                self._abiertas -= 1
+                cerrar = [entrada]
+            else:
+                entrada.ultimo_uso = ahora
+                self._libres.append(entrada)
+                cerrar = []
+            cerrar.extend(self._extraer_vencidas(ahora))
+            self._condicion.notify()
+        self._cerrar_fisicas(cerrar)
+
+    # --- mantenimiento ---
+
+    def _extraer_vencidas(self, ahora):
+        """Saca las conexiones libres inactivas o demasiado viejas. Requiere el lock."""
+        vencidas = []
+        conservadas = deque()
+        while self._libres:
+            entrada = self._libres.popleft()
+            if (ahora - entrada.ultimo_uso > self.inactividad_maxima
+                    or ahora - entrada.creada > self.vida_maxima):
+                vencidas.append(entrada)
+            else:
+                conservadas.append(entrada)
+        self._libres = conservadas
+        self._abiertas -= len(vencidas)
+        return vencidas
+
+    def _liberar_cupo(self):
+        with self._condicion:
+            self._abiertas -= 1
+            self._condicion.notify()
+
+    def _cerrar_fisicas(self, entradas):
+        for entrada in entradas:
+            try:
+                entrada.conexion.close()
+            except Exception:
+                pass
+
+    def cerrar(self):
+        """Cierra las conexiones libres y rechaza préstamos futuros."""
+        with self._condicion:
+            self._cerrado = True
+            libres = list(self._libres)
+            self._libres.clear()
+            self._abiertas -= len(libres)
+            self._condicion.notify_all()
+        self._cerrar_fisicas(libres)
+
+    def estadisticas(self):
+        with self._condicion:
+            return {
+                'abiertas': self._abiertas,
+                'libres': len(self._libres),
+                'prestadas': self._abiertas - len(self._libres),
+                'tamano_maximo': self.tamano_maximo,
+            }
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def obtener_pool(clave, fabrica, **opciones):
+    """
+    Devuelve el pool compartido del proceso para `clave` (normalmente la cadena
+    de conexión), creándolo la primera vez.
+    """
+    pool = _pools.get(clave)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(clave)
+            if pool is None:
+                pool = PoolConexiones(fabrica, **opciones)
+                _pools[clave] = pool
+    return pool
+
+
+def cerrar_pools():
+    """Cierra todos los pools del proceso (útil al apagar la aplicación)."""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.cerrar()
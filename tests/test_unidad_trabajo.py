@@ -0,0 +1,85 @@
+"""
+Unidad de trabajo por petición sobre el backend SQLite: lo que la vista
+informa como guardado debe estar confirmado en la base.
+
+    python -m pytest tests
+"""
+import datetime
+import os
+import sys
+
+import pytest
+from flask import Flask, flash, get_flashed_messages, redirect
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from unidad_trabajo import registrar_unidad_trabajo  # noqa: E402
+
+VENTA = [{'tipo_combustible_id': 1, 'precio_unitario': 30.0, 'cantidad_litros': 10,
+          'monto_quetzales': 300.0, 'subtotal': 300.0}]
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setenv('DB_BACKEND', 'sqlite')
+    monkeypatch.setenv('DB_PATH', str(tmp_path / 'prueba.db'))
+    from conexion import DatabaseAuthenticator
+    db = DatabaseAuthenticator()
+    with db._transaccion() as cursor:
+        cursor.execute("INSERT INTO TiposCombustible (Nombre, Precio) VALUES ('Super', 30)")
+        cursor.execute("INSERT INTO Clientes (Nombre) VALUES ('Cliente')")
+    db.agregar_registro_inventario(1, 0, 1000, 0, 1000, datetime.date.today().isoformat())
+    return db
+
+
+@pytest.fixture
+def app(db):
+    app = Flask(__name__)
+    app.secret_key = 'prueba'
+    registrar_unidad_trabajo(app)
+
+    @app.route('/vender', methods=['POST'])
+    def vender():
+        assert db.registrar_venta_combustible(1, datetime.date.today().isoformat(), 'Efectivo', '', VENTA)
+        return redirect('/avisos')
+
+    @app.route('/vender_y_leer_con_error', methods=['POST'])
+    def vender_y_leer_con_error():
+        assert db.registrar_venta_combustible(1, datetime.date.today().isoformat(), 'Efectivo', '', VENTA)
+        # Una lectura que falla y que el método atrapa, como hacen la mayoría
+        try:
+            with db._transaccion() as cursor:
+                cursor.execute("SELECT * FROM TablaQueNoExiste")
+        except Exception:
+            pass
+        flash('Venta registrada con éxito.', 'success')
+        return redirect('/avisos')
+
+    @app.route('/avisos')
+    def avisos():
+        return {'avisos': get_flashed_messages(with_categories=True)}
+
+    return app
+
+
+def _ventas(db):
+    with db._transaccion() as cursor:
+        cursor.execute("SELECT COUNT(*) FROM VentaCombustible")
+        return cursor.fetchone()[0]
+
+
+def test_la_venta_se_confirma_antes_de_responder(app, db):
+    cliente = app.test_client()
+    respuesta = cliente.post('/vender')
+    assert respuesta.status_code == 302
+    assert _ventas(db) == 1
+
+
+def test_escritura_seguida_de_lectura_fallida_informa_el_error(app, db):
+    cliente = app.test_client()
+    respuesta = cliente.post('/vender_y_leer_con_error')
+    assert respuesta.status_code == 302
+    avisos = cliente.get('/avisos').get_json()['avisos']
+    # No queda el aviso de éxito de una venta que no se guardó
+    assert avisos == [['danger', 'No se pudieron guardar los cambios. Intente de nuevo.']]
+    assert _ventas(db) == 0
@@ -0,0 +1,73 @@
+"""
+Versión de los datos de los reportes (VersionesDatos, migración 5) sobre el
+backend SQLite: cambia con correcciones hechas directo en la base aunque no
+cambien conteos ni sumas, y un rango cerrado no va a la base.
+
+    python -m pytest tests
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cache_catalogos import catalogos  # noqa: E402
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setenv('DB_BACKEND', 'sqlite')
+    monkeypatch.setenv('DB_PATH', str(tmp_path / 'prueba.db'))
+    from conexion import DatabaseAuthenticator
+    db = DatabaseAuthenticator()
+    with db._transaccion() as cursor:
+        cursor.execute("INSERT INTO TiposCombustible (Nombre, Precio) VALUES ('Super', 30)")
+        cursor.execute("INSERT INTO Clientes (Nombre) VALUES ('Cliente')")
+    db.agregar_registro_inventario(1, 0, 1000, 200, 800, '2024-03-05')
+    db.registrar_venta_combustible(1, '2024-03-05', 'Efectivo', '', [
+        {'tipo_combustible_id': 1, 'precio_unitario': 30.0, 'cantidad_litros': 10,
+         'monto_quetzales': 300.0, 'subtotal': 300.0},
+    ])
+    catalogos.limpiar()
+    return db
+
+
+def _directo(db, sql, params=()):
+    """Corrección hecha fuera de la aplicación: no invalida ninguna caché."""
+    with db._conectar() as connection:
+        connection.cursor().execute(sql, params)
+        connection.commit()
+
+
+def test_cambios_que_no_mueven_las_sumas_cambian_la_version(db):
+    marzo = ('2024-03-01', '2024-03-31')
+    antes_ventas = db.version_reporte('ventas_combustible', *marzo)
+    antes_inventario = db.version_reporte('inventario_combustible', *marzo)
+
+    _directo(db, "UPDATE VentaCombustible SET Fecha = '2024-03-20'")
+    _directo(db, "UPDATE InventarioCombustible SET Entrada = Salida, Salida = Entrada")
+    assert db.version_reporte('ventas_combustible', *marzo) == antes_ventas  # copia en caché
+    catalogos.limpiar()  # vence CATALOGO_TTL
+
+    assert db.version_reporte('ventas_combustible', *marzo) != antes_ventas
+    assert db.version_reporte('inventario_combustible', *marzo) != antes_inventario
+
+
+def test_cambio_de_nombre_cambia_la_version(db):
+    marzo = ('2024-03-01', '2024-03-31')
+    antes = db.version_reporte('ventas_combustible', *marzo)
+    _directo(db, "UPDATE Clientes SET Nombre = 'Otro nombre'")
+    catalogos.limpiar()
+    assert db.version_reporte('ventas_combustible', *marzo) != antes
+
+
+def test_rango_cerrado_no_va_a_la_base(db, monkeypatch):
+    db.version_reporte('ventas_combustible', '2024-03-01', '2024-03-31')
+
+    def sin_base():
+        raise AssertionError("un rango cerrado no debe pedir una conexión")
+
+    monkeypatch.setattr(db, '_conectar', sin_base)
+    db.version_reporte('ventas_combustible', '2024-03-01', '2024-03-31')
+    db.version_reporte('inventario_combustible', '2024-01-01', '2024-03-31')
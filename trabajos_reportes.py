@@ -0,0 +1,223 @@
+"""
+Cola de trabajos para generar reportes en segundo plano.
+
+descargar_reporte genera el archivo dentro de la petición, así que un rango
+grande ocupa un hilo del servidor durante toda la generación y el navegador
+suele cortar por tiempo. Aquí la página de reportes encola el trabajo, recibe
+su id y consulta el estado (con las filas procesadas como progreso) hasta que
+el archivo está listo para descargar.
+
+Los trabajos corren en un ThreadPoolExecutor de REPORTES_HILOS hilos: la
+generación pasa casi todo el tiempo esperando a la base o escribiendo a disco.
+Cada usuario puede tener a lo sumo REPORTES_POR_USUARIO trabajos pendientes
+(en cola o generándose). Los archivos terminados quedan en un directorio
+temporal y se borran REPORTES_TTL segundos después de terminar. Cada archivo
+se toma de la caché de reportes (cache_reportes) cuando ya está generado.
+
+Los trabajos viven en la memoria del proceso: con varios procesos del
+servidor, el estado solo se ve en el proceso que recibió el trabajo.
+"""
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import exportacion
+
+EN_COLA = 'en_cola'
+GENERANDO = 'generando'
+LISTO = 'listo'
+ERROR = 'error'
+CANCELADO = 'cancelado'
+
+
+class LimiteTrabajos(Exception):
+    """El usuario ya tiene el máximo de trabajos pendientes."""
+
+
+class _Cancelado(Exception):
+    pass
+
+
+class Trabajo:
+    def __init__(self, usuario, reporte, formato, fecha_inicio, fecha_fin):
+        self.id = uuid.uuid4().hex
+        self.usuario = usuario
+        self.reporte = reporte
+        self.formato = formato
+        self.fecha_inicio = fecha_inicio
+        self.fecha_fin = fecha_fin
+        self.estado = EN_COLA
+        self.filas = 0            # filas escritas hasta ahora
+        self.error = None
+        self.ruta = None          # archivo generado, cuando está LISTO
+        self.tamano = None
+        self.creado = time.time()
+        self.iniciado = None
+        self.terminado = None
+        self.cancelar = False
+        self.futuro = None
+
+    @property
+    def pendiente(self):
+        return self.estado in (EN_COLA, GENERANDO)
+
+    @property
+    def nombre_archivo(self):
+        return exportacion.nombre_archivo(self.reporte, self.formato, self.fecha_inicio, self.fecha_fin)
+
+    @property
+    def tipo(self):
+        return exportacion.FORMATOS[self.formato][1]
+
+    def a_dict(self):
+        fin = self.terminado or time.time()
+        return {
+            'id': self.id,
+            'reporte': self.reporte,
+            'formato': self.formato,
+            'fecha_inicio': self.fecha_inicio,
+            'fecha_fin': self.fecha_fin,
+            'estado': self.estado,
+            'filas': self.filas,
+            'error': self.error,
+            'archivo': self.nombre_archivo,
+            'tamano': self.tamano,
+            'segundos': round(fin - self.iniciado, 1) if self.iniciado else 0,
+        }
+
+
+class ColaReportes:
+    def __init__(self, hilos=2, por_usuario=2, ttl=3600.0):
+        self.por_usuario = por_usuario
+        self.ttl = ttl
+        self._ejecutor = ThreadPoolExecutor(max_workers=hilos, thread_name_prefix='reportes')
+        self._trabajos = {}  # id -> Trabajo
+        self._directorio = None
+        self._lock = threading.Lock()
+
+    def encolar(self, usuario, reporte, formato, fecha_inicio, fecha_fin, db):
+        """
+        Encola el reporte y devuelve su Trabajo; `db` (DatabaseAuthenticator)
+        entrega las filas. Lanza LimiteTrabajos si el usuario ya tiene
+        demasiados pendientes.
+        """
+        self._purgar()
+        trabajo = Trabajo(usuario, reporte, formato, fecha_inicio, fecha_fin)
+        with self._lock:
+            pendientes = sum(1 for t in self._trabajos.values() if t.usuario == usuario and t.pendiente)
+            if pendientes >= self.por_usuario:
+                raise LimiteTrabajos(
+                    f"Ya tiene {pendientes} reportes en proceso; espere a que terminen.")
+            if self._directorio is None:
+                self._directorio = tempfile.mkdtemp(prefix='reportes_')
+            self._trabajos[trabajo.id] = trabajo
+            trabajo.futuro = self._ejecutor.submit(self._ejecutar, trabajo, db)
+        return trabajo
+
+    def obtener(self, trabajo_id, usuario):
+        """El trabajo `trabajo_id` si existe y es de `usuario`; si no, None."""
+        self._purgar()
+        with self._lock:
+            trabajo = self._trabajos.get(trabajo_id)
+        return trabajo if trabajo is not None and trabajo.usuario == usuario else None
+
+    def trabajos(self, usuario):
+        """Trabajos de `usuario`, del más reciente al más antiguo."""
+        self._purgar()
+        with self._lock:
+            propios = [t for t in self._trabajos.values() if t.usuario == usuario]
+        return sorted(propios, key=lambda t: t.creado, reverse=True)
+
+    def cancelar(self, trabajo_id, usuario):
+        """
+        Cancela un trabajo pendiente (el que se está generando se detiene en
+        la siguiente fila) o descarta uno terminado con su archivo.
+        """
+        trabajo = self.obtener(trabajo_id, usuario)
+        if trabajo is None:
+            return False
+        with self._lock:
+            if trabajo.pendiente:
+                trabajo.cancelar = True
+                if trabajo.futuro.cancel():
+                    self._terminar(trabajo, CANCELADO)
+                return True
+            self._trabajos.pop(trabajo.id, None)
+        self._borrar_archivo(trabajo)
+        return True
+
+    def _ejecutar(self, trabajo, db):
+        with self._lock:
+            if trabajo.cancelar:
+                self._terminar(trabajo, CANCELADO)
+                return
+            trabajo.estado = GENERANDO
+            trabajo.iniciado = time.time()
+        extension = exportacion.FORMATOS[trabajo.formato][0]
+        ruta = os.path.join(self._directorio, f'{trabajo.id}.{extension}')
+        try:
+            archivo = exportacion.archivo_reporte(db, trabajo.reporte, trabajo.formato, trabajo.fecha_inicio,
+                                                  trabajo.fecha_fin, lambda filas: self._contar(trabajo, filas))
+            with archivo, open(ruta, 'wb') as destino:
+                shutil.copyfileobj(archivo, destino)
+        except _Cancelado:
+            self._quitar(ruta)
+            with self._lock:
+                self._terminar(trabajo, CANCELADO)
+        except Exception as e:
+            print("Error al generar el reporte en segundo plano:", e)
+            self._quitar(ruta)
+            with self._lock:
+                trabajo.error = str(e)
+                self._terminar(trabajo, ERROR)
+        else:
+            with self._lock:
+                trabajo.ruta = ruta
+                trabajo.tamano = os.path.getsize(ruta)
+                self._terminar(trabajo, LISTO)
+
+    @staticmethod
+    def _contar(trabajo, filas):
+        for fila in filas:
+            if trabajo.cancelar:
+                raise _Cancelado()
+            trabajo.filas += 1
+            yield fila
+
+    @staticmethod
+    def _terminar(trabajo, estado):
+        trabajo.estado = estado
+        trabajo.terminado = time.time()
+
+    def _purgar(self):
+        """Descarta los trabajos terminados hace más de ttl segundos y sus archivos."""
+        limite = time.time() - self.ttl
+        with self._lock:
+            vencidos = [t for t in self._trabajos.values() if t.terminado and t.terminado < limite]
+            for trabajo in vencidos:
+                del self._trabajos[trabajo.id]
+        for trabajo in vencidos:
+            self._borrar_archivo(trabajo)
+
+    @classmethod
+    def _borrar_archivo(cls, trabajo):
+        if trabajo.ruta:
+            cls._quitar(trabajo.ruta)
+
+    @staticmethod
+    def _quitar(ruta):
+        try:
+            os.remove(ruta)
+        except OSError:
+            pass
+
+
+cola_reportes = ColaReportes(
+    hilos=int(os.getenv('REPORTES_HILOS', '2')),
+    por_usuario=int(os.getenv('REPORTES_POR_USUARIO', '2')),
+    ttl=float(os.getenv('REPORTES_TTL', '3600')),
+)
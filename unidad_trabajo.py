@@ -0,0 +1,127 @@
+"""
+Unidad de trabajo por petición.
+
+Durante una petición de Flask todos los métodos de DatabaseAuthenticator
+comparten una sola conexión del pool y una sola transacción, guardadas en `g`.
+La conexión se pide al pool la primera vez que se necesita. La transacción
+se confirma en after_request, antes de enviar la respuesta. Si una consulta
+de la petición falló (aunque el método la haya atrapado) se revierte todo; en
+una petición que escribe (POST, etc.) eso, igual que un commit fallido, se
+informa: el usuario no recibe el aviso de éxito que la vista ya dejó sino un
+error. El teardown revierte lo que quede abierto (excepciones sin manejar) y
+devuelve la conexión.
+"""
+from flask import flash, g, has_app_context, make_response, request, session
+
+_CLAVE_G = '_unidad_trabajo'
+
+
+class UnidadDeTrabajo:
+    """Conexión y transacción compartidas por todas las consultas de una petición."""
+
+    def __init__(self, abrir_conexion):
+        self._abrir_conexion = abrir_conexion
+        self.conexion = None
+        self.fallida = False
+        self._al_finalizar = []
+
+    def cursor(self):
+        """Devuelve un cursor nuevo sobre la conexión de la unidad, abriéndola si hace falta."""
+        if self.conexion is None:
+            self.conexion = self._abrir_conexion()
+        return self.conexion.cursor()
+
+    def marcar_fallida(self):
+        """Una operación falló: al terminar la petición se revierte todo lo hecho."""
+        self.fallida = True
+
+    def al_finalizar(self, funcion, solo_si_confirma=False):
+        """
+        Registra `funcion` para después de confirmar o revertir (p.ej. invalidar
+        cachés); con solo_si_confirma=True, solo si el commit se hizo.
+        """
+        self._al_finalizar.append((funcion, solo_si_confirma))
+
+    def finalizar(self, confirmar=True):
+        """
+        Confirma si `confirmar` y ninguna operación falló, si no revierte;
+        siempre devuelve la conexión al pool. Un error del commit se propaga.
+        """
+        conexion, self.conexion = self.conexion, None
+        funciones, self._al_finalizar = self._al_finalizar, []
+        confirmada = False
+        try:
+            if conexion is not None:
+                try:
+                    if confirmar and not self.fallida:
+                        conexion.commit()
+                        confirmada = True
+                    else:
+                        conexion.rollback()
+                finally:
+                    conexion.close()
+        finally:
+            for funcion, solo_si_confirma in funciones:
+                if confirmada or not solo_si_confirma:
+                    funcion()
+
+
+def unidad_actual(abrir_conexion):
+    """
+    Devuelve la unidad de trabajo de la petición en curso (creándola sin abrir
+    conexión todavía) o None si no hay contexto de aplicación, por ejemplo en
+    scripts o hilos en segundo plano.
+    """
+    if not has_app_context():
+        return None
+    unidad = g.get(_CLAVE_G)
+    if unidad is None:
+        unidad = UnidadDeTrabajo(abrir_conexion)
+        setattr(g, _CLAVE_G, unidad)
+    return unidad
+
+
+_METODOS_LECTURA = ('GET', 'HEAD', 'OPTIONS')
+
+
+def _sin_guardar(respuesta):
+    """Respuesta de una petición cuyos cambios se revirtieron."""
+    # El aviso de éxito que dejó la vista ya no es cierto
+    session.pop('_flashes', None)
+    flash('No se pudieron guardar los cambios. Intente de nuevo.', 'danger')
+    if respuesta.status_code in (301, 302, 303, 307, 308):
+        return respuesta  # la página de destino muestra el error
+    return make_response("No se pudieron guardar los cambios.", 500)
+
+
+def registrar_unidad_trabajo(app):
+    """
+    Instala el after_request que confirma la unidad de trabajo antes de
+    responder y el teardown que revierte la que siga abierta.
+    """
+
+    @app.after_request
+    def _confirmar_unidad_trabajo(respuesta):
+        unidad = g.pop(_CLAVE_G, None)
+        if unidad is None:
+            return respuesta
+        try:
+            unidad.finalizar(confirmar=respuesta.status_code < 500)
+        except Exception as e:
+            print("Error al confirmar la transacción de la petición; no se guardó ningún cambio:", e)
+            return _sin_guardar(respuesta)
+        if unidad.fallida and request.method not in _METODOS_LECTURA:
+            print("Una consulta de la petición falló; se revirtieron sus cambios:", request.method, request.path)
+            return _sin_guardar(respuesta)
+        return respuesta
+
+    @app.teardown_appcontext
+    def _finalizar_unidad_trabajo(error=None):
+        unidad = g.pop(_CLAVE_G, None)
+        if unidad is not None:
+            try:
+                unidad.finalizar(confirmar=error is None)
+            except Exception as e:
+                print("Error al finalizar la transacción de la petición:", e)
+
+    return app